@@ -28,7 +28,6 @@ if [[ ! -f "${ENV_FILE}" ]]; then
   echo "  MQTT_PORT=1883"
   echo "  MQTT_USER=kaeserchen"
   echo "  MQTT_PASSWORD=..."
-  echo "  MQTT_TOPIC=kha/livingroom/shield/press_key"
   exit 1
 fi
 
@@ -55,7 +54,7 @@ fi
 # python3-venv        → needed to create a virtual environment (PEP 668 friendly)
 # python3-pip         → pip inside the venv (we still upgrade pip in the venv)
 # mosquitto-clients   → useful for testing MQTT (mosquitto_pub/sub)
-# paho-mqtt (via pip) → Python MQTT client library used by mqtt_to_shield_hid.py
+# khc (via pip)       → the KHC Python package (shared MQTT runtime + the bridge itself)
 echo "Installing dependencies..."
 sudo apt-get update
 sudo apt-get install -y python3-venv python3-pip mosquitto-clients
@@ -64,8 +63,8 @@ echo "Creating Python venv at ${VENV} ..."
 python3 -m venv "${VENV}"
 "${VENV}/bin/pip" install --upgrade pip
 
-echo "Installing Python dependencies into the venv..."
-"${VENV}/bin/pip" install paho-mqtt
+echo "Installing the khc package into the venv..."
+"${VENV}/bin/pip" install -e "${PY_ROOT}"
 
 
 # 3. Install systemd service units
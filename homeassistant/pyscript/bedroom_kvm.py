@@ -21,8 +21,12 @@ SOURCE_NAMES = [
 
 
 @service
-def set_kvm_source(source_name=None, entity_id=None):
-  """Stream Deck calls this service to switch the KVM source."""
+def set_kvm_source(source_name=None, entity_id=None, trace=None):
+  """Stream Deck calls this service to switch the KVM source.
+
+  `trace` (latency tracing, KHC_TRACE=1) is forwarded as-is when a traced
+  input triggered the switch, like nvidia_shield_tv.send_key.
+  """
   if source_name not in SOURCE_NAMES:
     return
 
@@ -34,5 +38,7 @@ def set_kvm_source(source_name=None, entity_id=None):
       state.set(bool_id, target)
 
   # Send the source change to the Mac KVM service via MQTT.
-  mqtt.publish(topic=KVM_SET_SOURCE_MQTT_TOPIC,
-               payload=json.dumps({"source_name": source_name}))
+  payload = {"source_name": source_name}
+  if trace:
+    payload["trace"] = trace
+  mqtt.publish(topic=KVM_SET_SOURCE_MQTT_TOPIC, payload=json.dumps(payload))
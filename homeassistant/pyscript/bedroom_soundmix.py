@@ -1,7 +1,29 @@
 import json
 import re
+import time
 
 DAW_SET_PARAMS_MQTT_TOPIC = "kha/bedroom/windows_pc/daw/set_params"
+# Retained dial → DAW params table for the Mac mini's local Sparrow → REAPER
+# fast path (python/src/khc/services/mac_mini/fast_path.py).
+DAW_ROUTING_MQTT_TOPIC = "kha/bedroom/windows_pc/daw/routing"
+# Mixer state as REAPER reports it, retained per param
+# (python/src/khc/services/mac_mini/reaper_feedback.py).
+DAW_STATE_MQTT_TOPIC = "kha/bedroom/windows_pc/daw/state"
+# REAPER's feedback rounds the values we send.
+DAW_STATE_TOLERANCE = 0.001
+# Fades and holds, run by the Mac mini's REAPER bridge
+# (python/src/khc/services/mac_mini/ramps.py).
+DAW_RAMP_MQTT_TOPIC = "kha/bedroom/windows_pc/daw/ramp"
+# Sparrow batches from the Mac mini; only read here for their latency trace.
+SPARROW_CONTROLS_MQTT_TOPIC = "kha/bedroom/windows_pc/controls"
+# A Sparrow trace older than this (ms) isn't what caused the DAW update.
+TRACE_MAX_AGE_MS = 500.0
+
+# Mix switch timing (seconds).
+FADE_OUT_SECONDS = 0.15
+PLUG_SWITCH_SECONDS = 1.0   # plugs need this long to physically switch
+FADE_IN_SECONDS = 0.5
+HOLD_TIMEOUT_SECONDS = 10.0  # the bridge lets go on its own if the release never comes
 
 SOUNDMIX_NAMES = [
   "none",
@@ -24,16 +46,39 @@ CONTROL_ENTITIES = [
 ]
 
 
+# Master routes to one output based on the active mix.
+MASTER_OUTPUT_PARAMS = {
+  "piano_seat_with_speakers": "master_volume_speakers",
+  "desk_seat_with_speakers": "master_volume_speakers",
+  "desk_seat_with_headphones": "master_volume_regular_headphones",
+  # No OSC route yet — piano-seat-with-headphones currently produces silence.
+  "piano_seat_with_headphones": "master_volume_inverted_headphones",
+}
+MASTER_PARAMS = ["master_volume_speakers", "master_volume_regular_headphones", "master_volume_inverted_headphones"]
+
+
 # Cache of the last published DAW params, used to only send values that actually
 # changed. Without this, every dial update would republish all params.
 last_daw_params = None
 
-# When True, _update_daw() is suppressed. This is set during sound mix transitions
-# to prevent dial updates from re-sending output volumes while speakers/headphones
-# are physically switching on/off. Without this, a dial update arriving mid-transition
-# would immediately overwrite the muted state.
+# Params as REAPER last reported them (empty unless the Mac mini bridge has
+# reaper.feedback_port set). Used instead of last_daw_params when that is
+# unknown, e.g. after an HA restart, so only params REAPER doesn't already
+# have are sent.
+daw_state = {}
+
+# When True, _update_daw() is suppressed. This is set while the plugs switch
+# during a sound mix transition; the bridge's hold also keeps back any output
+# volume that gets through, until the outputs fade back in.
 _muted = False
 
+# Numbers the hold token of each mix switch.
+_transition = 0
+
+# Latency tracing (KHC_TRACE=1 on the Mac mini): the trace of the last Sparrow
+# batch, with our hop added, sent along with the DAW update it causes.
+_pending_trace = None
+
 
 def _get_current_soundmix_name():
   candidates = []
@@ -45,10 +90,8 @@ def _get_current_soundmix_name():
   return "none"
 
 
-def _update_daw():
-  # Skip during mix transitions (see _muted comment above).
-  if _muted:
-    return
+def _daw_params():
+  """All DAW params for the current dials and mix."""
   # Pull all values from Home Assistant control entities.
   master_volume = float(input_number.streamdeck_dial_master_volume)
   piano_volume = float(input_number.streamdeck_dial_piano_volume)
@@ -57,11 +100,7 @@ def _update_daw():
   corp_mac_volume = float(input_number.streamdeck_dial_corp_mac_volume)
   corp_windows_volume = float(input_number.streamdeck_dial_corp_windows_volume)
 
-  # Master routes to one output based on the active mix.
-  mix_name = _get_current_soundmix_name()
-  uses_speakers = mix_name in ["piano_seat_with_speakers", "desk_seat_with_speakers"]
-  uses_regular_headphones = mix_name == "desk_seat_with_headphones"
-  uses_inverted_headphones = mix_name == "piano_seat_with_headphones"
+  master_param = MASTER_OUTPUT_PARAMS.get(_get_current_soundmix_name())
 
   new_daw_params = {
     "piano_volume": piano_volume,
@@ -69,11 +108,25 @@ def _update_daw():
     "personal_mac_volume": personal_mac_volume,
     "corp_mac_volume": corp_mac_volume,
     "corp_windows_volume": corp_windows_volume,
-    "master_volume_speakers": master_volume if uses_speakers else 0,
-    "master_volume_regular_headphones": master_volume if uses_regular_headphones else 0,
-    # No OSC route yet — piano-seat-with-headphones currently produces silence.
-    "master_volume_inverted_headphones": master_volume if uses_inverted_headphones else 0,
   }
+  for param in MASTER_PARAMS:
+    new_daw_params[param] = master_volume if param == master_param else 0
+  return new_daw_params
+
+
+def _take_trace():
+  global _pending_trace
+  trace, _pending_trace = _pending_trace, None
+  if trace and time.time() * 1000.0 - trace["hops"][-1][1] <= TRACE_MAX_AGE_MS:
+    return trace
+  return None
+
+
+def _update_daw():
+  # Skip during mix transitions (see _muted comment above).
+  if _muted:
+    return
+  new_daw_params = _daw_params()
 
   # Assemble list of parameters ("publishable_daw_params") that changed since last time.
   global last_daw_params
@@ -82,17 +135,46 @@ def _update_daw():
     for key, value in new_daw_params.items():
       if (not key in last_daw_params) or (last_daw_params[key] != value):
         publishable_daw_params[key] = value
+  elif daw_state:
+    publishable_daw_params = {}
+    for key, value in new_daw_params.items():
+      if (not key in daw_state) or abs(daw_state[key] - value) > DAW_STATE_TOLERANCE:
+        publishable_daw_params[key] = value
   else:
     publishable_daw_params = new_daw_params
 
   # Send list of changed parameters to DAW.
   if publishable_daw_params:
-    mqtt.publish(topic=DAW_SET_PARAMS_MQTT_TOPIC, payload=json.dumps(publishable_daw_params))
+    payload = dict(publishable_daw_params)
+    trace = _take_trace()
+    if trace:
+      payload["trace"] = trace
+    mqtt.publish(topic=DAW_SET_PARAMS_MQTT_TOPIC, payload=json.dumps(payload))
 
   # Backup current parameters for comparison in the next cycle.
   last_daw_params = new_daw_params
 
 
+def _publish_routing(muted=False):
+  """Publish which DAW params each dial drives in the active mix (retained).
+
+  The Mac mini uses it to send Sparrow moves to REAPER directly; while
+  `muted` (plugs switching) it sends nothing and leaves the DAW to us.
+  """
+  mix_name = _get_current_soundmix_name()
+  master_param = MASTER_OUTPUT_PARAMS.get(mix_name)
+  routes = {
+    "master_volume": [master_param] if master_param else [],
+    "piano_volume": ["piano_volume"],
+    "personal_windows_volume": ["personal_windows_volume"],
+    "personal_mac_volume": ["personal_mac_volume"],
+    "corp_mac_volume": ["corp_mac_volume"],
+    "corp_windows_volume": ["corp_windows_volume"],
+  }
+  mqtt.publish(topic=DAW_ROUTING_MQTT_TOPIC, retain=True,
+               payload=json.dumps({"mix": mix_name, "muted": muted, "routes": routes}))
+
+
 def _update_plugs():
   soundmix_name = _get_current_soundmix_name()
   use_piano_seat = soundmix_name in ["piano_seat_with_speakers", "piano_seat_with_headphones"]
@@ -121,23 +203,33 @@ def _apply_soundmix(soundmix_name):
     if state.get(entity_id) != target:
       state.set(entity_id, target)
 
-  # Mute all DAW outputs before switching plugs. This prevents a burst of sound
-  # through the old speakers/headphones while they're physically powering off.
-  # We set _muted=True to block any _update_daw() calls triggered by dial updates
-  # arriving mid-transition, which would otherwise immediately restore the output volumes.
-  global last_daw_params, _muted
+  # Fade all DAW outputs out and hold them there before switching plugs. This
+  # prevents a burst of sound through the old speakers/headphones while they're
+  # physically powering off. The bridge runs the fades and keeps back any
+  # output volume sent meanwhile, so the hold can't be undone by a dial update.
+  global last_daw_params, _muted, _transition
   _muted = True
-  silence = {"master_volume_speakers": 0, "master_volume_regular_headphones": 0, "master_volume_inverted_headphones": 0}
-  mqtt.publish(topic=DAW_SET_PARAMS_MQTT_TOPIC, payload=json.dumps(silence))
-  last_daw_params = None  # Force _update_daw to resend all params after unmute.
+  _publish_routing(muted=True)
+  _transition += 1
+  token = f"soundmix-{_transition}"
+  silence = {param: 0 for param in MASTER_PARAMS}
+  mqtt.publish(topic=DAW_RAMP_MQTT_TOPIC, payload=json.dumps({
+    "params": silence, "duration": FADE_OUT_SECONDS, "curve": "out",
+    "hold": token, "timeout": HOLD_TIMEOUT_SECONDS,
+  }))
 
-  # Switch the physical plugs while muted.
+  # Switch the physical plugs while held.
   _update_plugs()
 
-  # Wait for plugs to physically switch, then unmute and send the real volumes.
-  task.sleep(1.0)
+  # Release: the bridge waits for the plugs to settle, then fades in the real volumes.
+  new_daw_params = _daw_params()
+  mqtt.publish(topic=DAW_RAMP_MQTT_TOPIC, payload=json.dumps({
+    "release": token, "params": new_daw_params, "delay": PLUG_SWITCH_SECONDS,
+    "duration": FADE_IN_SECONDS, "curve": "in",
+  }))
+  last_daw_params = new_daw_params
   _muted = False
-  _update_daw()
+  _publish_routing()
 
 
 @service
@@ -147,6 +239,29 @@ def set_soundmix(soundmix_name=None, entity_id=None):
     _apply_soundmix(soundmix_name)
 
 
+@time_trigger("startup")
+def publish_daw_routing_on_startup():
+  _publish_routing()
+
+
+@mqtt_trigger(f"{DAW_STATE_MQTT_TOPIC}/+")
+def on_daw_state(topic=None, payload=None):
+  try:
+    daw_state[topic.rsplit("/", 1)[1]] = float(payload)
+  except ValueError:
+    pass
+
+
+@mqtt_trigger(SPARROW_CONTROLS_MQTT_TOPIC)
+def on_sparrow_controls(payload_obj=None):
+  # Binary frames (--codec f32/u16) carry no trace and arrive without payload_obj.
+  global _pending_trace
+  trace = payload_obj.get("trace") if isinstance(payload_obj, dict) else None
+  if trace:
+    trace["hops"].append(["ha", time.time() * 1000.0])
+    _pending_trace = trace
+
+
 @state_trigger(CONTROL_ENTITIES)
 def on_control_entity_value_changed(var_name, value):
   _update_daw()
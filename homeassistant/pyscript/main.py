@@ -1,4 +1,5 @@
 import json
+import time
 import kidsroom_luca_bed
 import livingroom_lights
 import denon_avr
@@ -8,9 +9,18 @@ import samsung_qn90a
 import nvidia_shield_tv
 
 
+def _trace_hop(payload_obj):
+  # Latency tracing (KHC_TRACE=1 on the numpad): append our hop and pass the
+  # trace along to the output bridge. Wall-clock ms, like the Python services.
+  trace = payload_obj.get("trace")
+  if trace:
+    trace["hops"].append(["ha", time.time() * 1000.0])
+  return trace
+
+
 @mqtt_trigger("flic")
 def on_flic_message_received(payload_obj=None):
-  log.error(payload_obj)
+  log.debug(payload_obj)
   if payload_obj['deviceName'] == 'DominikBed':
     somfy_shades.send_somfy_shade_command(["bedroom_blackout_left"], "up")
     somfy_shades.send_somfy_shade_command(["bedroom_blackout_right"], "up")
@@ -24,8 +34,8 @@ def on_flic_message_received(payload_obj=None):
 
 @mqtt_trigger("khc/livingroom/numpad")
 def on_livingroom_numpad_mqtt_received(payload_obj=None):
-  # Uncomment the line below to debug incoming MQTT messages.
-  log.info(payload_obj)
+  # Enable debug logging for this module to see incoming MQTT messages.
+  log.debug(payload_obj)
 
   # Forget about any other events (e.g. 'released') for now.
   if payload_obj['event_name'] != 'pressed':
@@ -33,6 +43,7 @@ def on_livingroom_numpad_mqtt_received(payload_obj=None):
 
   key_name = payload_obj["key"]
   pressed_keys = payload_obj["pressed_keys"]
+  trace = _trace_hop(payload_obj)
 
   if 'mod_left' in pressed_keys:
     # -----------------------
@@ -167,11 +178,11 @@ def on_livingroom_numpad_mqtt_received(payload_obj=None):
 
     # Top row: Media player.
     elif key_name == '1_1':
-      nvidia_shield_tv.previous_track()
+      nvidia_shield_tv.previous_track(trace)
     elif key_name == '1_2':
-      nvidia_shield_tv.play_pause()
+      nvidia_shield_tv.play_pause(trace)
     elif key_name == '1_3':
-      nvidia_shield_tv.next_track()
+      nvidia_shield_tv.next_track(trace)
     elif key_name == '1_4':
       samsung_qn90a.maybe_toggle_ambient_mode()
 
@@ -179,19 +190,19 @@ def on_livingroom_numpad_mqtt_received(payload_obj=None):
     elif key_name == '2_1':
       pass  # Unused
     elif key_name == '2_2':
-      nvidia_shield_tv.send_key("up")
+      nvidia_shield_tv.send_key("up", trace)
     elif key_name == '2_3':
       nvidia_shield_tv.menu()
     elif key_name == '3_1':
-      nvidia_shield_tv.send_key("left")
+      nvidia_shield_tv.send_key("left", trace)
     elif key_name == '3_2':
-      nvidia_shield_tv.send_key("center")
+      nvidia_shield_tv.send_key("center", trace)
     elif key_name == '3_3':
-      nvidia_shield_tv.send_key("right")
+      nvidia_shield_tv.send_key("right", trace)
     elif key_name == '4_1':
-      nvidia_shield_tv.send_key("back")
+      nvidia_shield_tv.send_key("back", trace)
     elif key_name == '4_2':
-      nvidia_shield_tv.send_key("down")
+      nvidia_shield_tv.send_key("down", trace)
     elif key_name == '4_3':
       nvidia_shield_tv.home()
 
@@ -8,10 +8,14 @@ ANDROIDTV_ENTITY_ID = "media_player.shield_androidtv"
 def _adb_shell_command(command):
   androidtv.adb_command(entity_id=ANDROIDTV_ENTITY_ID, command=command)
 
-def send_key(name):
-  # Send a message to the Shield MQTT service.
+def send_key(name, trace=None):
+  # Send a message to the Shield MQTT service. `trace` is forwarded as-is when
+  # the numpad runs with KHC_TRACE=1 (see khc.services.common.tracing).
   SHIELD_MQTT_TOPIC = "kha/livingroom/shield/press_key"
-  payload = f'{{"name": "{name}"}}'
+  if trace:
+    payload = json.dumps({"name": name, "trace": trace})
+  else:
+    payload = f'{{"name": "{name}"}}'
   mqtt.publish(topic=SHIELD_MQTT_TOPIC, payload=payload)
 
 def reboot():
@@ -20,14 +24,14 @@ def reboot():
   task.sleep(2)
   input_boolean.livingroom_plug_nvidia_shield.turn_on()
 
-def play_pause():
-  send_key("play_pause")
+def play_pause(trace=None):
+  send_key("play_pause", trace)
 
-def previous_track():
-  send_key("prev")
+def previous_track(trace=None):
+  send_key("prev", trace)
 
-def next_track():
-  send_key("next")
+def next_track(trace=None):
+  send_key("next", trace)
 
 def menu():
   _adb_shell_command("am start -a android.settings.SETTINGS")
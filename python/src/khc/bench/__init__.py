@@ -0,0 +1 @@
+# Offline benchmarks for KHC bridges (no broker or devices required)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Batch window benchmark for the Sparrow bridge
+
+Replays synthetic MIDI gestures through BatchWindow on a simulated clock,
+with the same flush rules as flush_forever (one publish in flight, trailing
+edge, window measured from the last flush), and compares the adaptive window
+against a fixed one. Per gesture and window it reports:
+  - publishes and publishes/s
+  - added latency per published value (staged → flushed, ms, p50/p99/max)
+
+Nothing touches MIDI, MQTT or the wall clock, so the figures are exact and
+repeatable; `--rtt` sets the simulated broker round trip.
+
+Usage:
+  python -m khc.bench.batching
+  python -m khc.bench.batching --rtt 0.03 --fixed 0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from dataclasses import replace
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from khc.bench.hot_paths import percentile
+from khc.services.common.config import SparrowConfig, get_config
+from khc.services.mac_mini.khc_sparrow_to_mqtt import BatchWindow
+
+Event = Tuple[float, int]  # (seconds, CC)
+
+
+class Outcome(NamedTuple):
+    events: int
+    publishes: int
+    seconds: float
+    latencies_ms: List[float]
+
+
+# --------------------------------------------------------------------
+# Gestures
+# --------------------------------------------------------------------
+def isolated_ticks() -> List[Event]:
+    """One dial click every 400 ms for 4 s."""
+    return [(i * 0.4, 0) for i in range(10)]
+
+
+def slow_knob() -> List[Event]:
+    """One dial turned slowly: ~15 CC/s for 2 s."""
+    return [(i / 15.0, 0) for i in range(30)]
+
+
+def fader_sweep() -> List[Event]:
+    """All five faders swept together: ~100 CC/s each for 1 s."""
+    return [(i / 100.0 + cc * 0.002, cc) for i in range(100) for cc in range(5, 10)]
+
+
+def knob_then_sweep() -> List[Event]:
+    """A slow knob, a pause, then a sweep: the window must close again in between."""
+    return slow_knob() + [(3.0 + t, cc) for t, cc in fader_sweep()]
+
+
+GESTURES: Dict[str, Callable[[], List[Event]]] = {
+    "isolated": isolated_ticks,
+    "slow_knob": slow_knob,
+    "fader_sweep": fader_sweep,
+    "knob+sweep": knob_then_sweep,
+}
+
+
+# --------------------------------------------------------------------
+# Simulation
+# --------------------------------------------------------------------
+def simulate(events: List[Event], window: BatchWindow, rtt: float) -> Outcome:
+    """Run flush_forever's schedule over `events` on a virtual clock."""
+    events = sorted(events)
+    pending: Dict[int, float] = {}  # CC → time its latest value was staged
+    latencies: List[float] = []
+    publishes = 0
+    i = 0
+    now = 0.0
+    last_flush = float("-inf")
+
+    def stage_until(t: float) -> None:
+        nonlocal i
+        while i < len(events) and events[i][0] <= t:
+            at, cc = events[i]
+            window.on_event(at)
+            pending[cc] = at
+            i += 1
+
+    while i < len(events) or pending:
+        if not pending:
+            now = max(now, events[i][0])  # staged.wait()
+        stage_until(now)
+        now = max(now, last_flush + window.interval(now))
+        stage_until(now)
+        last_flush = now
+        latencies.extend((now - at) * 1000.0 for at in pending.values())
+        pending.clear()
+        publishes += 1
+        now += rtt  # publish_and_wait: one batch in flight
+        window.on_rtt(rtt)
+        stage_until(now)
+
+    seconds = max(events[-1][0] - events[0][0], 1e-9) if events else 1e-9
+    return Outcome(len(events), publishes, seconds, sorted(latencies))
+
+
+def run(rtt: float, fixed: float) -> List[Tuple[str, str, Outcome]]:
+    adaptive = get_config().sparrow
+    windows: Dict[str, SparrowConfig] = {
+        f"fixed {fixed * 1000:.0f}ms": replace(adaptive, min_batch_interval=fixed, max_batch_interval=fixed),
+        "adaptive": adaptive,
+    }
+    return [
+        (gesture, label, simulate(make_events(), BatchWindow(config), rtt))
+        for gesture, make_events in GESTURES.items()
+        for label, config in windows.items()
+    ]
+
+
+def format_results(results: List[Tuple[str, str, Outcome]]) -> str:
+    lines = [f"{'gesture':<12} {'window':<11} {'events':>7} {'pubs':>6} {'pubs/s':>7} "
+             f"{'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}"]
+    for gesture, label, o in results:
+        lat = o.latencies_ms
+        lines.append(
+            f"{gesture:<12} {label:<11} {o.events:>7} {o.publishes:>6} {o.publishes / o.seconds:>7.1f} "
+            f"{percentile(lat, 50):>7.1f} {percentile(lat, 99):>7.1f} {lat[-1] if lat else 0.0:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Compare fixed and adaptive Sparrow batch windows")
+    p.add_argument("--rtt", type=float, default=0.002,
+                   help="Simulated broker round trip in seconds. Default: %(default)s")
+    p.add_argument("--fixed", type=float, default=0.02,
+                   help="Fixed window to compare against, in seconds. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+    print(format_results(run(args.rtt, args.fixed)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+fakes.py — in-process stand-ins for the broker and the devices
+
+Everything here is pure Python so the benchmarks run on a plain Linux box:
+  - FakeRuntime    : MqttRuntime look-alike that records publishes
+  - FakeOSCClient  : the REAPER bridge's OSC bundle client, real encoding,
+                     counting datagrams instead of sending them
+  - FakeSerial     : pyserial look-alike that counts written bytes
+  - SyntheticMidi  : iterable of CC messages (sine sweeps across controls)
+  - MidiPlayer     : plays timed CC messages into a callback in real time
+  - load_shield_hid: imports the Shield HID bridge with its hidg devices
+                     pointed at /dev/null
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import time
+from types import ModuleType
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import paho.mqtt.client as mqtt
+
+from khc.services.common.config import get_config
+from khc.services.mac_mini.osc_bundle import OscBundleClient
+from khc.services.mac_mini.rpp_index import param_to_osc
+
+
+def make_message(topic: str, payload: bytes) -> mqtt.MQTTMessage:
+    msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+    msg.payload = payload
+    return msg
+
+
+# --------------------------------------------------------------------
+# MQTT
+# --------------------------------------------------------------------
+class FakePublishInfo:
+    rc = mqtt.MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout: Optional[float] = None) -> None:
+        pass
+
+    def is_published(self) -> bool:
+        return True
+
+
+class FakeRuntime:
+    """Records publishes; subscriptions are accepted and ignored."""
+
+    connected = True
+
+    def __init__(self, client_id: str = "bench"):
+        self.client_id = client_id
+        self.published: List[Tuple[str, Any, int, bool]] = []
+        self._info = FakePublishInfo()
+
+    def subscribe(self, topic_filter: str, handler: Any, userdata: Any = None, qos: int = 0) -> None:
+        pass
+
+    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> FakePublishInfo:
+        self.published.append((topic, payload, qos, retain))
+        return self._info
+
+    async def publish_and_wait(self, topic: str, payload: Any, qos: int = 0, retain: bool = False,
+                               timeout: float = 1.0) -> bool:
+        self.publish(topic, payload, qos, retain)
+        return True
+
+    async def wait_connected(self) -> None:
+        pass
+
+
+# --------------------------------------------------------------------
+# Devices
+# --------------------------------------------------------------------
+class FakeUDPSocket:
+    def __init__(self) -> None:
+        self.datagrams = 0
+        self.bytes_sent = 0
+
+    def sendto(self, data: bytes, address: Any) -> int:
+        self.datagrams += 1
+        self.bytes_sent += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeOSCClient(OscBundleClient):
+    """OscBundleClient with REAPER's addresses pre-encoded, sending into a FakeUDPSocket (`.sock`)."""
+
+    def __init__(self) -> None:
+        super().__init__("127.0.0.1", get_config().reaper.osc_port, param_to_osc().values(), sock=FakeUDPSocket())
+
+
+class FakeSerial:
+    def __init__(self) -> None:
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FakeMidiMessage(NamedTuple):
+    type: str
+    control: int
+    value: int
+    channel: int = 0
+
+
+class SyntheticMidi:
+    """
+    Sine sweeps across CC 0–9, one control after another per step.
+
+    Iterating yields `count` control_change messages as fast as the consumer
+    pulls them; `pulls` records a perf_counter timestamp per yielded message
+    so the gap between two pulls is the consumer's per-message cost.
+    """
+
+    def __init__(self, count: int, controls: int = 10, period: int = 256):
+        self.count = count
+        self.controls = controls
+        self.period = period
+        self.pulls: List[float] = []
+
+    def __iter__(self) -> Iterator[FakeMidiMessage]:
+        pulls = self.pulls
+        for i in range(self.count):
+            cc = i % self.controls
+            phase = 2.0 * math.pi * (i // self.controls) / self.period
+            value = int(round(63.5 + 63.5 * math.sin(phase + cc)))
+            pulls.append(time.perf_counter())
+            yield FakeMidiMessage("control_change", cc, value)
+        pulls.append(time.perf_counter())
+
+
+class MidiPlayer:
+    """
+    Plays (seconds, CC, value) events into `callback` at their time, from
+    the calling thread — run play() in a thread of its own, as mido's rtmidi
+    backend calls the input callback. A late event is sent at once; `late`
+    holds how far behind schedule each one went out (seconds).
+    """
+
+    def __init__(self, events: Sequence[Tuple[float, int, int]], callback: Callable[[FakeMidiMessage], None]):
+        self.events = sorted(events)
+        self.callback = callback
+        self.late: List[float] = []
+
+    def play(self) -> None:
+        start = time.perf_counter()
+        for at, cc, value in self.events:
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.late.append(max(0.0, -delay))
+            self.callback(FakeMidiMessage("control_change", cc, value))
+
+
+def load_shield_hid() -> ModuleType:
+    """Import the Shield HID bridge with its hidg devices pointed at /dev/null."""
+    from khc.services.rbpiz2w_shieldremote import khc_mqtt_to_shield_hid as module
+
+    module.KEYBOARD_DEV = os.devnull
+    module.CONSUMER_DEV = os.devnull
+    return module
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Smoothing filter benchmark for the Sparrow bridge
+
+Replays synthetic pot gestures through each per-control filter
+(khc.services.common.filters) on a simulated clock. A gesture is an intended
+position over time; the pot is read at 1 kHz with Gaussian jitter and, like
+the Sparrow, sends a CC only when the 7-bit reading changes. Per gesture and
+filter it reports:
+  - CCs in, values passed (what would be staged for publishing, resting
+    values from FilterBank.settle included) and the share of publishes
+    saved against passing every change
+  - tracking error in MIDI steps between the last passed value and the
+    intended position: time-weighted mean, and after half a second at rest
+
+Usage:
+  python -m khc.bench.filters
+  python -m khc.bench.filters --jitter 0.5 --seed 7
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from dataclasses import replace
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from khc.services.common.config import ControlFilterConfig, get_config
+from khc.services.common.filters import FilterBank
+
+SAMPLE_RATE = 1000.0  # Hz, pot read rate
+DURATION = 3.3        # seconds per gesture: the gestures end by 2.8 s, then 0.5 s at rest
+SETTLE_POLL = 0.05    # seconds, like the bridge's settle task
+
+Intent = Callable[[float], float]  # seconds → position in MIDI steps (0–127)
+
+
+class Outcome(NamedTuple):
+    events: int
+    passed: int
+    mean_error: float   # steps
+    final_error: float  # steps
+
+
+# --------------------------------------------------------------------
+# Gestures (intended position, whether the pot jitters)
+# --------------------------------------------------------------------
+def _ramp(t: float, t0: float, t1: float, a: float, b: float) -> float:
+    if t <= t0:
+        return a
+    if t >= t1:
+        return b
+    return a + (b - a) * (t - t0) / (t1 - t0)
+
+
+GESTURES: Dict[str, Tuple[Intent, bool]] = {
+    "idle": (lambda t: 64.5, True),  # resting between two steps: worst-case flicker
+    "slow_move": (lambda t: _ramp(t, 0.2, 2.8, 40.0, 55.0), False),
+    "slow_jittery": (lambda t: _ramp(t, 0.2, 2.8, 40.0, 55.0), True),
+    "fast_sweep": (lambda t: _ramp(t, 0.2, 0.5, 0.0, 127.0), True),
+    "reversal": (lambda t: _ramp(t, 0.2, 0.7, 30.0, 90.0) - _ramp(t, 0.9, 1.4, 0.0, 30.0), True),
+}
+
+
+def pot_events(intent: Intent, jitter: float, rng: random.Random) -> List[Tuple[float, int]]:
+    """(seconds, CC value) whenever the jittered 7-bit reading changes."""
+    events: List[Tuple[float, int]] = []
+    last = None
+    for i in range(int(DURATION * SAMPLE_RATE)):
+        t = i / SAMPLE_RATE
+        value = min(127, max(0, round(intent(t) + rng.gauss(0.0, jitter))))
+        if value != last:
+            events.append((t, value))
+            last = value
+    return events
+
+
+# --------------------------------------------------------------------
+# Simulation
+# --------------------------------------------------------------------
+def simulate(config: ControlFilterConfig, intent: Intent, events: List[Tuple[float, int]]) -> Outcome:
+    bank = FilterBank(config, {})
+    settle_every = int(SETTLE_POLL * SAMPLE_RATE)
+    passed = 0
+    published = None
+    error_sum = 0.0
+    samples = int(DURATION * SAMPLE_RATE)
+    i = 0
+    for n in range(samples):
+        t = n / SAMPLE_RATE
+        while i < len(events) and events[i][0] <= t:
+            at, value = events[i]
+            out = bank.update("control", value / 127.0, at)
+            if out is not None:
+                passed += 1
+                published = out * 127.0
+            i += 1
+        if n % settle_every == 0:
+            for out in bank.settle(t).values():
+                passed += 1
+                published = out * 127.0
+        if published is not None:
+            error_sum += abs(published - intent(t))
+    final = abs(published - intent(DURATION)) if published is not None else 0.0
+    return Outcome(len(events), passed, error_sum / samples, final)
+
+
+def run(jitter: float, seed: int) -> List[Tuple[str, str, Outcome]]:
+    default = get_config().sparrow.filter
+    filters: Dict[str, ControlFilterConfig] = {
+        "none": replace(default, kind="none"),
+        "deadband": replace(default, kind="deadband", threshold=2.0 / 127.0),
+        "hysteresis": replace(default, kind="hysteresis"),
+        "one_euro": replace(default, kind="one_euro", threshold=1.0 / 127.0),
+    }
+    results = []
+    for gesture, (intent, jittery) in GESTURES.items():
+        events = pot_events(intent, jitter if jittery else 0.0, random.Random(seed))
+        for name, config in filters.items():
+            results.append((gesture, name, simulate(config, intent, events)))
+    return results
+
+
+def format_results(results: List[Tuple[str, str, Outcome]]) -> str:
+    lines = [f"{'gesture':<13} {'filter':<11} {'CCs':>6} {'passed':>7} {'saved':>6} {'err avg':>8} {'err end':>8}"]
+    baseline: Dict[str, int] = {g: o.passed for g, name, o in results if name == "none"}
+    for gesture, name, o in results:
+        saved = 1.0 - o.passed / baseline[gesture] if baseline.get(gesture) else 0.0
+        lines.append(
+            f"{gesture:<13} {name:<11} {o.events:>6} {o.passed:>7} {saved:>6.0%} "
+            f"{o.mean_error:>8.2f} {o.final_error:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Compare Sparrow per-control smoothing filters")
+    p.add_argument("--jitter", type=float, default=0.35,
+                   help="Pot noise, standard deviation in MIDI steps. Default: %(default)s")
+    p.add_argument("--seed", type=int, default=1, help="Noise seed. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+    print(format_results(run(args.jitter, args.seed)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Hot-path benchmark for every bridge's message callback
+
+Drives each bridge's handler with synthetic MQTT messages (or, for the
+Sparrow bridge, synthetic MIDI) against fake sinks and reports:
+  - throughput (messages/s)
+  - per-message latency (p50/p99, µs)
+  - allocations: tracemalloc peak and net blocks retained per 1k messages
+
+Usage:
+  python -m khc.bench.hot_paths
+  python -m khc.bench.hot_paths --messages 20000 --only reaper,kvm
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence
+
+from khc.bench.fakes import (
+    FakeOSCClient, FakeRuntime, FakeSerial, SyntheticMidi, load_shield_hid, make_message,
+)
+from khc.services.common.config import get_config
+
+
+class Result(NamedTuple):
+    name: str
+    messages: int
+    seconds: float
+    latencies_us: List[float]
+    peak_kib: float
+    net_blocks: int
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100.0 * len(sorted_values)))]
+
+
+# --------------------------------------------------------------------
+# Scenarios: each returns per-message latencies in µs
+# --------------------------------------------------------------------
+def _drive_handler(handler: Callable[..., Any], userdata: Any, messages: List[Any]) -> List[float]:
+    runtime = FakeRuntime()
+    latencies: List[float] = []
+
+    async def run() -> None:
+        for msg in messages:
+            t0 = time.perf_counter()
+            await handler(runtime, userdata, msg)
+            latencies.append((time.perf_counter() - t0) * 1e6)
+
+    asyncio.run(run())
+    return latencies
+
+
+def bench_reaper(n: int) -> List[float]:
+    from khc.services.mac_mini import khc_mqtt_to_reaper as reaper
+
+    topic = f"{get_config().mqtt.topic_prefix}/daw/set_params"
+    keys = list(get_config().reaper.param_to_osc)
+    messages = [
+        make_message(topic, json.dumps({k: (i % 100) / 100.0 for k in keys[: 1 + i % len(keys)]}).encode())
+        for i in range(n)
+    ]
+    return _drive_handler(reaper.on_mqtt_message_received, FakeOSCClient(), messages)
+
+
+def bench_reaper_binary(n: int) -> List[float]:
+    from khc.services.common.codec import DAW_PARAMS_CODEC
+    from khc.services.mac_mini import khc_mqtt_to_reaper as reaper
+
+    topic = f"{get_config().mqtt.topic_prefix}/daw/set_params"
+    keys = list(get_config().reaper.param_to_osc)
+    messages = [
+        make_message(topic, DAW_PARAMS_CODEC.encode({k: (i % 100) / 100.0 for k in keys[: 1 + i % len(keys)]}))
+        for i in range(n)
+    ]
+    return _drive_handler(reaper.on_mqtt_message_received, FakeOSCClient(), messages)
+
+
+def bench_kvm(n: int) -> List[float]:
+    from khc.services.mac_mini import khc_mqtt_to_kvm as kvm
+
+    topic = f"{get_config().mqtt.topic_prefix}/kvm/set_source"
+    sources = list(get_config().kvm.source_to_cmd)
+    messages = [make_message(topic, json.dumps({"source_name": sources[i % len(sources)]}).encode()) for i in range(n)]
+    return _drive_handler(kvm.on_mqtt_message_received, FakeSerial(), messages)
+
+
+def bench_shield_hid(n: int) -> List[float]:
+    hid = load_shield_hid()
+    names = list(hid.NAME_TO_ACTION)
+    messages = [make_message(get_config().shield_hid.topic, json.dumps({"name": names[i % len(names)]}).encode()) for i in range(n)]
+    return _drive_handler(hid._on_message, None, messages)
+
+
+def bench_sparrow(n: int) -> List[float]:
+    from khc.services.mac_mini import khc_sparrow_to_mqtt as sparrow
+
+    # The MIDI callback stages every message; one flush per sweep step
+    # (every `controls` messages) stands in for the batch timer.
+    runtime = FakeRuntime()
+    source = SyntheticMidi(n)
+    batcher = sparrow.ControlBatcher()
+    for i, msg in enumerate(source):
+        batcher.stage(msg)
+        if i % source.controls == source.controls - 1:
+            runtime.publish(*sparrow.encode_controls(batcher.take()))
+    pulls = source.pulls
+    return [(b - a) * 1e6 for a, b in zip(pulls, pulls[1:])]
+
+
+SCENARIOS: Dict[str, Callable[[int], List[float]]] = {
+    "reaper": bench_reaper,
+    "reaper_bin": bench_reaper_binary,
+    "kvm": bench_kvm,
+    "shield_hid": bench_shield_hid,
+    "sparrow": bench_sparrow,
+}
+
+
+# --------------------------------------------------------------------
+# Runner
+# --------------------------------------------------------------------
+def run_scenario(name: str, n: int) -> Result:
+    scenario = SCENARIOS[name]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        scenario(min(n, 200))  # warm-up: imports, caches
+
+        t0 = time.perf_counter()
+        latencies = scenario(n)
+        seconds = time.perf_counter() - t0
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        scenario(n)
+        gc.collect()  # count what's really retained, not pending cycles
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    net_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return Result(name, n, seconds, sorted(latencies), peak / 1024.0, net_blocks)
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [f"{'bridge':<12} {'msgs':>7} {'msg/s':>10} {'p50 µs':>9} {'p99 µs':>9} {'peak KiB':>9} {'blocks/1k':>10}"]
+    for r in results:
+        lines.append(
+            f"{r.name:<12} {r.messages:>7} {r.messages / r.seconds:>10.0f} "
+            f"{percentile(r.latencies_us, 50):>9.1f} {percentile(r.latencies_us, 99):>9.1f} "
+            f"{r.peak_kib:>9.1f} {r.net_blocks * 1000.0 / r.messages:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark KHC bridge hot paths offline")
+    p.add_argument("--messages", "-n", type=int, default=5000,
+                   help="Messages per scenario. Default: %(default)s")
+    p.add_argument("--only", default=",".join(SCENARIOS),
+                   help="Comma-separated scenarios. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+
+    # Bridges log/print per message: keep the formatting cost, drop the output.
+    logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(open(os.devnull, "w"))])
+
+    results = [run_scenario(name, args.messages) for name in args.only.split(",") if name]
+    print(format_results(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Synthetic MIDI load test for the Sparrow bridge, end to end
+
+Runs the bridge's real pipeline in real time — the MIDI callback thread
+staging into a ControlBatcher (map, smoothing filter, coalescing) and
+flush_forever publishing to a FakeRuntime — fed by a MidiPlayer with
+synthetic gestures:
+  - sweeps   : sine sweeps on all ten controls, 100 CC/s each
+  - spins    : bursty knob spins (400 CC/s for 250 ms) between idle gaps
+  - idle     : isolated clicks 400 ms apart
+
+Per gesture it reports:
+  - publishes/s while the gesture runs
+  - staging → publish latency per published value (ms, p50/p99/max): from
+    the MIDI callback that staged the value — or, for a resting position
+    the filter held back, from the settle poll that staged it — to the
+    publish that carried it
+  - where the CCs went: filtered (smoothing filter), coalesced (replaced in
+    the batcher before a flush) and published, and how many resting
+    positions the settle poll published
+
+The publish path follows khc.toml ([sparrow] batch window, filters,
+publish_mode); `--rtt` delays each publish like a broker round trip.
+
+Usage:
+  python -m khc.bench.midi_load
+  python -m khc.bench.midi_load --rtt 0.01 --only sweeps,spins
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from khc.bench.fakes import FakeMidiMessage, FakeRuntime, MidiPlayer
+from khc.bench.hot_paths import percentile
+from khc.services.common.config import get_config
+from khc.services.common.runtime import run_blocking
+from khc.services.mac_mini import khc_sparrow_to_mqtt as sparrow
+
+Event = Tuple[float, int, int]  # (seconds, CC, value)
+
+SETTLE = 0.2  # seconds after the last event for the trailing flush
+
+
+class Outcome(NamedTuple):
+    events: int
+    seconds: float
+    publishes: int
+    filtered: int
+    coalesced: int
+    published: int
+    settled: int
+    latencies_ms: List[float]
+    late_ms: float  # worst scheduling delay of the player
+
+
+# --------------------------------------------------------------------
+# Gestures (Sparrow CCs: dials 0–4, faders 5–9)
+# --------------------------------------------------------------------
+def sweeps(seconds: float = 2.0, rate: float = 100.0) -> List[Event]:
+    return [
+        (i / rate + cc * 0.0005, cc, int(round(63.5 + 63.5 * math.sin(2.0 * math.pi * i / rate + cc))))
+        for i in range(int(seconds * rate)) for cc in range(10)
+    ]
+
+
+def spins(bursts: int = 4, rate: float = 400.0, burst: float = 0.25, gap: float = 0.5) -> List[Event]:
+    events: List[Event] = []
+    for b in range(bursts):
+        start = b * (burst + gap)
+        direction = 1 if b % 2 == 0 else -1
+        for i in range(int(burst * rate)):
+            events.append((start + i / rate, b % 5, 64 + direction * min(63, i // 2)))
+    return events
+
+
+def idle(clicks: int = 6, every: float = 0.4) -> List[Event]:
+    return [(i * every, 5, 40 + 4 * (i % 2)) for i in range(clicks)]
+
+
+GESTURES: Dict[str, Callable[[], List[Event]]] = {
+    "sweeps": sweeps,
+    "spins": spins,
+    "idle": idle,
+}
+
+
+# --------------------------------------------------------------------
+# Harness
+# --------------------------------------------------------------------
+class TimedRuntime(FakeRuntime):
+    """FakeRuntime that timestamps each publish and waits `rtt` for it."""
+
+    def __init__(self, rtt: float):
+        super().__init__()
+        self.rtt = rtt
+        self.sent: List[Tuple[float, List[str]]] = []  # (perf_counter, control ids)
+
+    async def publish_and_wait(self, topic: str, payload: Any, qos: int = 0, retain: bool = False,
+                               timeout: float = 1.0) -> bool:
+        self.sent.append((time.perf_counter(), controls_in(topic, payload)))
+        self.publish(topic, payload, qos, retain)
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        return True
+
+
+def controls_in(topic: str, payload: Any) -> List[str]:
+    if topic.endswith("/controls"):
+        return [k for k in json.loads(payload) if k != "trace"]
+    return [topic.rsplit("/", 1)[1]]  # per_control mode
+
+
+def counts() -> Tuple[int, int, int, int]:
+    return sparrow.FILTERED.value, sparrow.OVERWRITTEN.value, sparrow.CONTROLS_PUBLISHED.value, sparrow.SETTLED.value
+
+
+async def simulate(events: List[Event], rtt: float) -> Outcome:
+    loop = asyncio.get_running_loop()
+    staged = asyncio.Event()
+    batcher = sparrow.ControlBatcher(on_staged=lambda: loop.call_soon_threadsafe(staged.set))
+    batcher.window.on_rtt(rtt)
+    runtime = TimedRuntime(rtt)
+    device = next(iter(get_config().sparrow.devices.values()))
+    control_of_cc = {int(cc): control_id for cc, control_id in device.cc_map.items()}
+    # control id → perf_counter of each stage() that passed the filter and each settle() that staged it
+    staged_at: Dict[str, List[float]] = {}
+
+    def on_midi(msg: FakeMidiMessage) -> None:
+        t = time.perf_counter()
+        filtered = sparrow.FILTERED.value
+        batcher.stage(msg)
+        control_id = control_of_cc.get(msg.control)
+        if control_id is not None and sparrow.FILTERED.value == filtered:
+            bisect.insort(staged_at.setdefault(control_id, []), t)
+
+    async def settle_forever() -> None:
+        # sparrow.settle_forever, timestamping what each poll stages
+        while True:
+            await asyncio.sleep(sparrow.SETTLE_POLL)
+            t = time.perf_counter()
+            for control_id in batcher.settle(time.monotonic()):
+                bisect.insort(staged_at.setdefault(control_id, []), t)
+
+    before = counts()
+    player = MidiPlayer(events, on_midi)
+    flush = asyncio.create_task(sparrow.flush_forever(runtime, batcher, staged))
+    settle = asyncio.create_task(settle_forever())
+    t0 = time.perf_counter()
+    await run_blocking(player.play)
+    seconds = time.perf_counter() - t0
+    await asyncio.sleep(SETTLE + get_config().sparrow.max_batch_interval + rtt)
+    flush.cancel()
+    settle.cancel()
+    filtered, coalesced, published, settled = (b - a for a, b in zip(before, counts()))
+
+    latencies: List[float] = []
+    for sent_at, control_ids in runtime.sent:
+        for control_id in control_ids:
+            times = staged_at.get(control_id, [])
+            i = bisect.bisect_right(times, sent_at)
+            if i:
+                latencies.append((sent_at - times[i - 1]) * 1000.0)
+    return Outcome(len(events), seconds, len(runtime.sent), filtered, coalesced, published, settled,
+                   sorted(latencies), max(player.late, default=0.0) * 1000.0)
+
+
+def run(names: List[str], rtt: float) -> List[Tuple[str, Outcome]]:
+    return [(name, asyncio.run(simulate(GESTURES[name](), rtt))) for name in names]
+
+
+def format_results(results: List[Tuple[str, Outcome]]) -> str:
+    lines = [f"{'gesture':<8} {'CCs':>6} {'pubs/s':>7} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+             f"{'filtered':>9} {'coalesced':>10} {'published':>10} {'settled':>8} {'late ms':>8}"]
+    for name, o in results:
+        lat = o.latencies_ms
+        lines.append(
+            f"{name:<8} {o.events:>6} {o.publishes / max(o.seconds, 1e-9):>7.1f} "
+            f"{percentile(lat, 50):>7.1f} {percentile(lat, 99):>7.1f} {lat[-1] if lat else 0.0:>7.1f} "
+            f"{o.filtered:>9} {o.coalesced:>10} {o.published:>10} {o.settled:>8} {o.late_ms:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Load-test the Sparrow bridge with synthetic MIDI")
+    p.add_argument("--rtt", type=float, default=0.002,
+                   help="Simulated broker round trip per publish, in seconds. Default: %(default)s")
+    p.add_argument("--only", default=",".join(GESTURES),
+                   help="Comma-separated gestures. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+    print(format_results(run([n for n in args.only.split(",") if n], args.rtt)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Publish mode benchmark for the Sparrow bridge: blob vs per-control topics
+
+Stages synthetic MIDI gestures through the real ControlBatcher (map and
+smoothing filter included) and encodes every batch both ways: one payload on
+{prefix}/controls (sparrow.publish_mode = "blob") and the changed values on
+retained {prefix}/controls/<id> topics ("per_control", RetainedControls).
+A batch is cut every `--batch` staged messages, standing in for the window.
+Per gesture and mode it reports the broker's load:
+  - PUBLISH packets and bytes on the wire (MQTT 3.1.1 framing)
+  - PUBACKs the broker sends back for QoS 1 classes (sparrow.control_qos)
+  - values deduped, and topics retained: what a restarted subscriber gets
+
+Usage:
+  python -m khc.bench.publish_modes
+  python -m khc.bench.publish_modes --batch 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import sys
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from khc.bench.fakes import FakeMidiMessage
+from khc.services.mac_mini.khc_sparrow_to_mqtt import ControlBatcher, RetainedControls, encode_controls
+
+Gesture = List[Tuple[int, int]]  # (CC, value) in arrival order
+PUBACK_BYTES = 4
+
+
+class Outcome(NamedTuple):
+    batches: int
+    publishes: int
+    wire_bytes: int
+    acks: int
+    deduped: int
+    retained: int
+
+
+# --------------------------------------------------------------------
+# Gestures (Sparrow CCs: dials 0–4, faders 5–9)
+# --------------------------------------------------------------------
+def sweep_all(steps: int = 200) -> Gesture:
+    """All ten controls moving together (sine sweeps)."""
+    return [
+        (cc, int(round(63.5 + 63.5 * math.sin(2.0 * math.pi * step / 100.0 + cc))))
+        for step in range(steps) for cc in range(10)
+    ]
+
+
+def one_fader(steps: int = 2000) -> Gesture:
+    """A single fader moved up and down."""
+    return [(5, int(round(63.5 - 63.5 * math.cos(2.0 * math.pi * step / 254.0)))) for step in range(steps)]
+
+
+def wiggle(steps: int = 2000) -> Gesture:
+    """One fader nudged and put back: each excursion starts and ends at 64."""
+    return [(5, (64, 72, 64)[step % 3]) for step in range(steps)]
+
+
+GESTURES: Dict[str, Callable[[], Gesture]] = {
+    "sweep_all": sweep_all,
+    "one_fader": one_fader,
+    "wiggle": wiggle,
+}
+
+
+# --------------------------------------------------------------------
+# Simulation
+# --------------------------------------------------------------------
+def publish_bytes(topic: str, payload: bytes, qos: int) -> int:
+    """Size of one MQTT 3.1.1 PUBLISH packet."""
+    remaining = 2 + len(topic.encode("utf-8")) + (2 if qos else 0) + len(payload)
+    length_bytes = 1 if remaining < 128 else 2 if remaining < 16384 else 3
+    return 1 + length_bytes + remaining
+
+
+def batches(gesture: Gesture, batch: int) -> List[Dict[str, float]]:
+    batcher = ControlBatcher()
+    out = []
+    for i, (cc, value) in enumerate(gesture):
+        batcher.stage(FakeMidiMessage("control_change", cc, value))
+        if i % batch == batch - 1:
+            out.append(batcher.take())
+    out.append(batcher.take())
+    return [b for b in out if b]
+
+
+def simulate_blob(staged: List[Dict[str, float]]) -> Outcome:
+    wire = 0
+    for pending in staged:
+        topic, payload = encode_controls(pending)
+        wire += publish_bytes(topic, payload.encode("utf-8"), 0)
+    return Outcome(len(staged), len(staged), wire, 0, 0, 0)
+
+
+def simulate_per_control(staged: List[Dict[str, float]]) -> Outcome:
+    retained = RetainedControls()
+    publishes = wire = acks = deduped = 0
+    for pending in staged:
+        messages = retained.messages(pending)
+        deduped += len(pending) - len(messages)
+        for _, topic, payload, qos in messages:
+            publishes += 1
+            wire += publish_bytes(topic, payload, qos)
+            acks += 1 if qos else 0
+            retained.mark_sent(topic, payload)
+    return Outcome(len(staged), publishes, wire + acks * PUBACK_BYTES, acks, deduped, len(retained))
+
+
+def run(batch: int) -> List[Tuple[str, str, Outcome]]:
+    results = []
+    for gesture, make in GESTURES.items():
+        staged = batches(make(), batch)
+        results.append((gesture, "blob", simulate_blob(staged)))
+        results.append((gesture, "per_control", simulate_per_control(staged)))
+    return results
+
+
+def format_results(results: List[Tuple[str, str, Outcome]]) -> str:
+    lines = [f"{'gesture':<10} {'mode':<12} {'batches':>8} {'pubs':>6} {'bytes':>8} {'acks':>6} "
+             f"{'deduped':>8} {'retained':>9}"]
+    for gesture, mode, o in results:
+        lines.append(
+            f"{gesture:<10} {mode:<12} {o.batches:>8} {o.publishes:>6} {o.wire_bytes:>8} {o.acks:>6} "
+            f"{o.deduped:>8} {o.retained:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Compare Sparrow blob and per-control publish modes")
+    p.add_argument("--batch", type=int, default=10,
+                   help="Staged MIDI messages per batch. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+    print(format_results(run(max(1, args.batch))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
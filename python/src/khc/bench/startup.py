@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for every service
+
+For each service, in fresh interpreters:
+  - import cost of the service module (`python -X importtime`), plus the
+    heaviest non-khc imports that khc modules pull in
+  - time-to-first-message: interpreter spawn → service module and its device
+    library imported → first synthetic message handled by the real handler
+    (see khc.bench.hot_paths). The MQTT connect is not included; in the real
+    services it overlaps with the device-library import.
+
+Usage:
+  python -m khc.bench.startup
+  python -m khc.bench.startup --runs 10 --only sparrow
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+SPAWN_ENV = "KHC_BENCH_SPAWN_NS"
+
+
+class Service(NamedTuple):
+    module: str
+    scenario: Optional[str]        # khc.bench.hot_paths scenario, if any
+    device_imports: Sequence[str]  # what serve() imports lazily
+
+
+SERVICES: Dict[str, Service] = {
+    "kvm": Service("khc.services.mac_mini.khc_mqtt_to_kvm", "kvm", ("serial",)),
+    "reaper": Service("khc.services.mac_mini.khc_mqtt_to_reaper", "reaper", ()),
+    "sparrow": Service("khc.services.mac_mini.khc_sparrow_to_mqtt", "sparrow", ("mido",)),
+    "shield_hid": Service("khc.services.rbpiz2w_shieldremote.khc_mqtt_to_shield_hid", "shield_hid", ()),
+    "numpad": Service("khc.services.rbpi3.numpad_to_mqtt", None, ()),
+}
+
+
+# --------------------------------------------------------------------
+# Parent side
+# --------------------------------------------------------------------
+def import_profile(module: str, top: int = 3) -> Tuple[Optional[float], List[Tuple[str, float]]]:
+    """Return (cumulative import ms, [(heaviest non-khc import made by a khc module, ms), ...])."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return None, []
+    # -X importtime prints in post-order: children (one indent deeper) precede their parent.
+    pending: Dict[int, List[Tuple[str, float]]] = {}
+    external: Dict[str, float] = {}
+    total = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, raw_name = line.split("|", 2)
+        try:
+            cumulative_ms = int(cumulative) / 1000.0
+        except ValueError:
+            continue  # header line
+        name = raw_name.strip()
+        depth = (len(raw_name) - len(raw_name.lstrip())) // 2
+        children = pending.pop(depth + 1, [])
+        if name.startswith("khc"):
+            for child, ms in children:
+                if not child.startswith("khc"):
+                    external[child] = max(ms, external.get(child, 0.0))
+        pending.setdefault(depth, []).append((name, cumulative_ms))
+        if name == module:
+            total = cumulative_ms
+    heaviest = sorted(external.items(), key=lambda item: item[1], reverse=True)
+    return total, heaviest[:top]
+
+
+def time_to_first_message(name: str, runs: int) -> Optional[float]:
+    samples: List[float] = []
+    for _ in range(runs):
+        env = dict(os.environ, **{SPAWN_ENV: str(time.time_ns())})
+        proc = subprocess.run(
+            [sys.executable, "-m", "khc.bench.startup", "--child", name],
+            capture_output=True, text=True, env=env,
+        )
+        if proc.returncode != 0 or not proc.stdout.strip():
+            return None
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+# --------------------------------------------------------------------
+# Child side
+# --------------------------------------------------------------------
+def run_child(name: str) -> int:
+    service = SERVICES[name]
+    importlib.import_module(service.module)
+    for module in service.device_imports:
+        importlib.import_module(module)
+    if service.scenario is not None:
+        from khc.bench.hot_paths import SCENARIOS
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            SCENARIOS[service.scenario](1)
+    print(f"{(time.time_ns() - int(os.environ[SPAWN_ENV])) / 1e6:.1f}")
+    return 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark KHC service startup")
+    p.add_argument("--runs", type=int, default=5,
+                   help="Spawns per service for time-to-first-message (median). Default: %(default)s")
+    p.add_argument("--only", default=",".join(SERVICES),
+                   help="Comma-separated services. Default: %(default)s")
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    args = p.parse_args(argv or sys.argv[1:])
+
+    if args.child:
+        return run_child(args.child)
+
+    print(f"{'service':<11} {'import ms':>10} {'1st msg ms':>11}  heaviest imports")
+    for name in (n for n in args.only.split(",") if n):
+        import_ms, heaviest = import_profile(SERVICES[name].module)
+        first_ms = time_to_first_message(name, args.runs)
+        fmt = lambda v: f"{v:.1f}" if v is not None else "n/a"
+        print(
+            f"{name:<11} {fmt(import_ms):>10} {fmt(first_ms):>11}  "
+            + ", ".join(f"{mod} {ms:.0f}" for mod, ms in heaviest)
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
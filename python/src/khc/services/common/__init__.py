@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 """
-common.py — shared helpers for KHC services (strict env-file mode)
+khc.services.common — shared helpers for KHC services (strict env-file mode)
 
-Reads all secrets from ~/khc-private/.env.
+Reads all secrets from ~/khc-private/.env (override the path with KHC_ENV_FILE).
 If the file or any required key is missing, aborts immediately.
 
 Example ~/.env:
@@ -10,22 +10,23 @@ Example ~/.env:
     MQTT_PORT=1883
     MQTT_USER=kaeserchen
     MQTT_PASSWORD=supersecret
+
+The MQTT connection itself is owned by `khc.services.common.runtime`;
+non-secret settings (topic prefix, device paths, mappings) live in
+`khc.services.common.config`.
 """
 
 from __future__ import annotations
 
 import json
+import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Tuple
 
-import paho.mqtt.client as mqtt
-
-# ---------- Shared config ----------
-MQTT_TOPIC_PREFIX = "kha/bedroom/windows_pc"
-
 # ---------- Secrets ----------
-ENV_FILE = Path.home() / "khc-private" / ".env"
+ENV_FILE = Path(os.environ.get("KHC_ENV_FILE", Path.home() / "khc-private" / ".env"))
 
 
 def _parse_env_file(path: Path) -> Dict[str, str]:
@@ -52,8 +53,9 @@ def _parse_env_file(path: Path) -> Dict[str, str]:
     return secrets
 
 
+@lru_cache(maxsize=None)
 def load_mqtt_secrets() -> Tuple[str, str, str, int]:
-    """Return (host, user, password, port)."""
+    """Return (host, user, password, port); the env file is parsed once per process."""
     secrets = _parse_env_file(ENV_FILE)
     host = secrets["MQTT_HOST"]
     user = secrets["MQTT_USER"]
@@ -62,18 +64,6 @@ def load_mqtt_secrets() -> Tuple[str, str, str, int]:
     return host, user, pwd, port
 
 
-# ---------- MQTT ----------
-def create_and_connect_mqtt_client(client_id: str, keepalive: int = 30) -> mqtt.Client:
-    host, user, pwd, port = load_mqtt_secrets()
-    client = mqtt.Client(
-        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-        client_id=client_id,
-    )
-    client.username_pw_set(user, pwd)
-    client.connect(host, port, keepalive=keepalive)
-    return client
-
-
 # ---------- JSON ----------
 def to_json(d: Dict[str, Any]) -> str:
     """Stable, compact JSON (no trailing spaces/newlines)."""
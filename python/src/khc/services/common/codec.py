@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+codec.py — compact binary frames for the high-rate control/param topics
+
+JSON stays the default everywhere; the binary frame is opt-in per publisher.
+Consumers call decode_payload(), which accepts either format on the same
+topic, so JSON and binary publishers/consumers can coexist.
+
+Frame layout (little-endian):
+  byte 0      MAGIC (0xC5) — never the first byte of JSON text, so it doubles
+              as the content-type marker
+  byte 1      schema id (low 7 bits) | QUANTIZED (0x80) for uint16 values
+  bytes 2–3   uint16 bitmask: bit i set → key i of the schema is present
+  bytes 4…    one float32 (or uint16 = round(v * 65535)) per set bit, in bit order
+
+A five-fader update is 24 bytes as float32 (14 quantized) instead of ~130
+bytes of JSON. A frame that sets a bit past the end of its schema is
+malformed: decode_payload() raises ValueError like for any other garbage.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+MAGIC = 0xC5
+QUANTIZED = 0x80
+_HEADER = struct.Struct("<BBH")
+
+# Key order is part of the wire format: append only, never reorder.
+CONTROL_KEYS: Tuple[str, ...] = (
+    "dial_1", "dial_2", "dial_3", "dial_4", "dial_5",
+    "fader_1", "fader_2", "fader_3", "fader_4", "fader_5",
+)
+DAW_PARAM_KEYS: Tuple[str, ...] = (
+    "piano_volume",
+    "personal_windows_volume",
+    "corp_mac_volume",
+    "corp_windows_volume",
+    "personal_mac_volume",
+    "master_volume_speakers",
+    "master_volume_regular_headphones",
+    "master_volume_inverted_headphones",
+)
+
+SCHEMA_CONTROLS = 0
+SCHEMA_DAW_PARAMS = 1
+
+
+class FrameCodec:
+    """Encoder/decoder for one schema (an ordered key list of at most 16 keys)."""
+
+    def __init__(self, schema_id: int, keys: Sequence[str], quantized: bool = False):
+        if len(keys) > 16:
+            raise ValueError("a frame schema holds at most 16 keys")
+        self.schema_id = schema_id
+        self.keys = tuple(keys)
+        self.quantized = quantized
+        self._bit_by_key = {k: i for i, k in enumerate(self.keys)}
+        # mask → keys present, for every valid mask (1024 for the 10 controls)
+        self._keys_by_mask: List[Tuple[str, ...]] = [
+            tuple(k for i, k in enumerate(self.keys) if mask & (1 << i)) for mask in range(1 << len(self.keys))
+        ]
+        # One precompiled Struct per value count, for both value widths.
+        self._f32 = [struct.Struct("<" + "f" * n) for n in range(len(self.keys) + 1)]
+        self._u16 = [struct.Struct("<" + "H" * n) for n in range(len(self.keys) + 1)]
+
+    def encode(self, values: Mapping[str, float]) -> bytes:
+        """Pack the schema keys present in `values` (other keys are ignored)."""
+        mask = 0
+        for key in values:
+            bit = self._bit_by_key.get(key)
+            if bit is not None:
+                mask |= 1 << bit
+        keys = self._keys_by_mask[mask]
+        if self.quantized:
+            packed = self._u16[len(keys)].pack(
+                *(int(round(min(1.0, max(0.0, float(values[k]))) * 65535.0)) for k in keys)
+            )
+            flags = self.schema_id | QUANTIZED
+        else:
+            packed = self._f32[len(keys)].pack(*(float(values[k]) for k in keys))
+            flags = self.schema_id
+        return _HEADER.pack(MAGIC, flags, mask) + packed
+
+    def decode(self, frame: bytes) -> Dict[str, float]:
+        try:
+            magic, flags, mask = _HEADER.unpack_from(frame)
+            if mask >= len(self._keys_by_mask):
+                raise ValueError(f"malformed frame: mask {mask:#06x} has bits past the schema's {len(self.keys)} keys")
+            keys = self._keys_by_mask[mask]
+            if flags & QUANTIZED:
+                raw = self._u16[len(keys)].unpack_from(frame, _HEADER.size)
+                return {k: v / 65535.0 for k, v in zip(keys, raw)}
+            return dict(zip(keys, self._f32[len(keys)].unpack_from(frame, _HEADER.size)))
+        except (struct.error, IndexError) as e:
+            raise ValueError(f"malformed frame ({len(frame)} bytes): {e}") from None
+
+
+CONTROLS_CODEC = FrameCodec(SCHEMA_CONTROLS, CONTROL_KEYS)
+CONTROLS_CODEC_U16 = FrameCodec(SCHEMA_CONTROLS, CONTROL_KEYS, quantized=True)
+DAW_PARAMS_CODEC = FrameCodec(SCHEMA_DAW_PARAMS, DAW_PARAM_KEYS)
+
+_DECODERS: Dict[int, FrameCodec] = {
+    SCHEMA_CONTROLS: CONTROLS_CODEC,
+    SCHEMA_DAW_PARAMS: DAW_PARAMS_CODEC,
+}
+
+
+def is_binary(payload: bytes) -> bool:
+    return bool(payload) and payload[0] == MAGIC
+
+
+def decode_payload(payload: bytes) -> Dict[str, Any]:
+    """Decode a JSON object or a binary frame; raises ValueError on garbage."""
+    if is_binary(payload):
+        if len(payload) < _HEADER.size:
+            raise ValueError(f"truncated frame ({len(payload)} bytes)")
+        codec = _DECODERS.get(payload[1] & ~QUANTIZED)
+        if codec is None:
+            raise ValueError(f"unknown frame schema {payload[1] & ~QUANTIZED}")
+        return codec.decode(payload)
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    return data
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+config.py — typed, cached, hot-reloadable service configuration
+
+Non-secret settings live in ~/khc-private/khc.toml (override the path with
+KHC_CONFIG). Every key is optional; a missing file means all defaults. See
+python/khc.example.toml for the full list.
+
+The file is parsed and validated once (get_config() returns the cached,
+frozen KhcConfig). watch_config() polls its mtime once per second — a stat()
+call; inotify isn't available on the Mac mini — and swaps in the new config
+in place, so handlers that read get_config() at use time pick up remapped
+REAPER tracks, KVM commands, numpad keys, batch bounds or filters without a
+restart. An invalid edit is logged and the previous config stays active.
+Connection-level settings (MQTT prefix, serial port, OSC host/port, numpad
+device, metrics ports) are read once at startup; MIDI devices follow
+reloads through the Sparrow bridge's hot-plug poll.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import tomllib
+from dataclasses import dataclass, field, fields, is_dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, get_args, get_origin, get_type_hints
+
+LOG = logging.getLogger("khc.config")
+
+CONFIG_FILE = Path(os.environ.get("KHC_CONFIG", Path.home() / "khc-private" / "khc.toml"))
+WATCH_INTERVAL = 1.0  # seconds
+
+
+class ConfigError(ValueError):
+    pass
+
+
+# --------------------------------------------------------------------
+# Schema (defaults are the values the services shipped with)
+# --------------------------------------------------------------------
+@dataclass(frozen=True)
+class MqttConfig:
+    topic_prefix: str = "kha/bedroom/windows_pc"
+
+
+@dataclass(frozen=True)
+class KvmConfig:
+    serial_port: str = "/dev/tty.usbmodemB7CD849C82261"
+    serial_baud: int = 9600
+    serial_timeout: float = 1.0
+    # source name → ASCII command (the Level1 KVM expects CRLF line endings)
+    source_to_cmd: Dict[str, str] = field(default_factory=lambda: {
+        "personal_mac":     "9:V=1\r\n",
+        "personal_windows": "9:V=2\r\n",
+        "corp_mac":         "9:V=3\r\n",
+        "corp_windows":     "9:V=4\r\n",
+    })
+
+
+@dataclass(frozen=True)
+class ReaperConfig:
+    host: str = "127.0.0.1"
+    osc_port: int = 1234
+    # OSC sends per second per address; values arriving faster (an MQTT
+    # backlog after a Wi-Fi blip) coalesce to the latest. 0 = no limit.
+    max_rate: float = 30.0
+    # REAPER's OSC feedback (its control surface "device port"): mixer state
+    # published retained on {prefix}/daw/state/..., see mac_mini/reaper_feedback.py.
+    # 0 = don't listen.
+    feedback_port: int = 0
+    feedback_host: str = "127.0.0.1"   # address to bind
+    state_interval: float = 0.1        # seconds between state publishes (throttle)
+    meter_interval: float = 0.25       # seconds between meter publishes (peak over the interval)
+    # {prefix}/daw/ramp fades (mac_mini/ramps.py)
+    ramp_rate: float = 100.0           # ramp steps/s (one OSC bundle each)
+    hold_timeout: float = 10.0         # seconds before an unreleased hold lets go on its own
+    # The session's .RPP file. When set, param_to_osc addresses may name tracks
+    # and hardware outputs ("/track/{piano}/volume", "/track/{submix}/send/{hw:1}/volume")
+    # and are re-resolved when the file changes; see mac_mini/rpp_index.py.
+    project: str = ""
+    # MQTT parameter key → REAPER OSC address
+    param_to_osc: Dict[str, str] = field(default_factory=lambda: {
+        "piano_volume": "/track/2/volume",                   # piano
+        "personal_windows_volume": "/track/3/volume",        # personal win
+        "corp_mac_volume": "/track/4/volume",                # corp mac
+        "corp_windows_volume": "/track/5/volume",            # corp win
+        "personal_mac_volume": "/track/6/volume",            # mac mini
+        "master_volume_speakers": "/track/1/send/1/volume",  # submix → speakers
+        "master_volume_regular_headphones": "/track/1/send/2/volume",  # submix → headphones
+        # master_volume_inverted_headphones: no REAPER send yet (piano-seat-with-headphones mix)
+    })
+
+    def __post_init__(self) -> None:
+        if self.max_rate < 0:
+            raise ConfigError(f"max_rate must be >= 0, got {self.max_rate}")
+        if not 0 <= self.feedback_port < 65536:
+            raise ConfigError(f"feedback_port must be a UDP port or 0, got {self.feedback_port}")
+        if not self.project:
+            named = [param for param, address in self.param_to_osc.items() if "{" in address]
+            if named:
+                raise ConfigError(f"param_to_osc uses track names ({', '.join(named)}) but reaper.project is not set")
+
+
+FILTER_KINDS = ("deadband", "hysteresis", "one_euro", "none")
+PUBLISH_MODES = ("blob", "per_control")
+
+
+@dataclass(frozen=True)
+class ControlFilterConfig:
+    """Smoothing for one control (see common/filters.py); values are 0–1 full scale."""
+    kind: str = "hysteresis"
+    threshold: float = 2.0 / 127.0     # deadband; hysteresis minimum; one_euro publish step
+    max_threshold: float = 6.0 / 127.0 # hysteresis: cap of the jitter-driven threshold
+    noise_gain: float = 1.5            # hysteresis: reversal threshold = noise_gain × jitter
+    min_cutoff: float = 1.0            # one_euro: Hz when the control is still
+    beta: float = 10.0                 # one_euro: cutoff gain per full-scale/s of speed
+    d_cutoff: float = 1.0              # one_euro: Hz for the speed estimate
+    settle: float = 0.2                # seconds without a publish before the resting value goes out; 0 = off
+
+    def __post_init__(self) -> None:
+        if self.kind not in FILTER_KINDS:
+            raise ConfigError(f"filter kind {self.kind!r} is not one of {', '.join(FILTER_KINDS)}")
+        if self.settle < 0:
+            raise ConfigError(f"filter settle must be >= 0, got {self.settle}")
+
+
+@dataclass(frozen=True)
+class MidiDeviceConfig:
+    """One MIDI controller: its input port and CC → control id mapping (see mac_mini/midi_map.py)."""
+    port: str = "Sparrow 5x5"          # exact or unique partial match of the input name
+    # CC number → control id (7-bit); the Sparrow 5x5 sends CC 0–9
+    cc_map: Dict[str, str] = field(default_factory=lambda: {
+        **{str(cc): f"dial_{cc + 1}" for cc in range(5)},
+        **{str(cc): f"fader_{cc - 4}" for cc in range(5, 10)},
+    })
+    # MSB CC number (0–31, LSB on +32) → control id, 14-bit
+    cc14_map: Dict[str, str] = field(default_factory=dict)
+    # NRPN parameter number (0–16383) → control id, 14-bit
+    nrpn_map: Dict[str, str] = field(default_factory=dict)
+    # Send DAW state back to the device's MIDI output (LED rings, motor faders)
+    feedback: bool = False
+
+    def __post_init__(self) -> None:
+        for name, limit in (("cc_map", 128), ("cc14_map", 32), ("nrpn_map", 16384)):
+            for key in getattr(self, name):
+                if not key.isdigit() or int(key) >= limit:
+                    raise ConfigError(f"{name}: {key!r} is not a number from 0 to {limit - 1}")
+        used = {int(k) for k in self.cc_map}
+        pairs = {int(k) for k in self.cc14_map} | {int(k) + 32 for k in self.cc14_map}
+        if used & pairs:
+            raise ConfigError(f"CC {sorted(used & pairs)} mapped both as 7-bit and as a 14-bit pair")
+        reserved = (used | pairs) & {6, 38, 98, 99} if self.nrpn_map else set()
+        if reserved:
+            raise ConfigError(f"CC {sorted(reserved)} are reserved for NRPN once nrpn_map is set")
+
+
+@dataclass(frozen=True)
+class SparrowConfig:
+    # device name → controller; all of them feed one batcher and publisher
+    devices: Dict[str, MidiDeviceConfig] = field(default_factory=lambda: {"sparrow": MidiDeviceConfig()})
+    # Adaptive batch window (seconds): an isolated change goes out after
+    # min_batch_interval, a sustained sweep or a slow broker widens the
+    # window up to max_batch_interval. Set both equal for a fixed interval.
+    min_batch_interval: float = 0.0
+    max_batch_interval: float = 0.05
+    busy_rate: float = 200.0           # staged values/s at which the window is fully open
+    rtt_factor: float = 2.0            # window ≥ rtt_factor × smoothed broker RTT
+    rtt_probe_interval: float = 2.0    # seconds between QoS 1 RTT probes on {prefix}/rtt_probe/<client id>
+    filter: ControlFilterConfig = field(default_factory=ControlFilterConfig)
+    # control id (dial_N, fader_N) → its own filter instead of `filter`
+    filters: Dict[str, ControlFilterConfig] = field(default_factory=dict)
+    # control id → HA dial name (input_number.streamdeck_dial_<name>),
+    # routed to REAPER params by the table HA publishes on {prefix}/daw/routing.
+    # Used by the local fast path (mac_mini/fast_path.py, host only) and by
+    # MIDI feedback (mac_mini/midi_feedback.py).
+    fast_path: bool = False
+    control_to_dial: Dict[str, str] = field(default_factory=dict)
+    feedback_rate: float = 200.0       # MIDI feedback messages/s per device
+    # "blob": each batch as one payload on {prefix}/controls (not retained).
+    # "per_control": each changed value retained on {prefix}/controls/<id>,
+    # so a subscriber that restarts gets every position at once.
+    publish_mode: str = "blob"
+    # per_control mode: control class (the id without its _N suffix) → QoS; others 0
+    control_qos: Dict[str, int] = field(default_factory=lambda: {"fader": 1})
+
+    def __post_init__(self) -> None:
+        if not self.devices:
+            raise ConfigError("devices: at least one MIDI device is required")
+        if self.rtt_probe_interval <= 0:
+            raise ConfigError(f"rtt_probe_interval must be > 0, got {self.rtt_probe_interval}")
+        if self.publish_mode not in PUBLISH_MODES:
+            raise ConfigError(f"publish_mode {self.publish_mode!r} is not one of {', '.join(PUBLISH_MODES)}")
+        for name, qos in self.control_qos.items():
+            if qos not in (0, 1, 2):
+                raise ConfigError(f"control_qos.{name}: QoS must be 0, 1 or 2, got {qos}")
+
+
+@dataclass(frozen=True)
+class NumpadConfig:
+    device_path: str = "/dev/input/by-id/usb-Telink_Macally_RFKeyboard-if01-event-kbd"
+    topic: str = "khc/livingroom/numpad"
+    # evdev KEY_* name → logical key name
+    key_to_name: Dict[str, str] = field(default_factory=lambda: {
+        "KEY_BACKSPACE":  "1_1",
+        "KEY_EQUAL":      "1_2",   # Macally sends KEY_EQUAL, not KEY_KPEQUAL
+        "KEY_KPSLASH":    "1_3",
+        "KEY_KPASTERISK": "1_4",
+        "KEY_KP7":        "2_1",
+        "KEY_KP8":        "2_2",
+        "KEY_KP9":        "2_3",
+        "KEY_KPMINUS":    "2_4",
+        "KEY_KP4":        "3_1",
+        "KEY_KP5":        "3_2",
+        "KEY_KP6":        "3_3",
+        "KEY_KPPLUS":     "3_4",
+        "KEY_KP1":        "4_1",
+        "KEY_KP2":        "4_2",
+        "KEY_KP3":        "4_3",
+        "KEY_KP0":        "mod_left",
+        "KEY_KPDOT":      "mod_center",
+        "KEY_KPENTER":    "mod_right",
+    })
+
+
+@dataclass(frozen=True)
+class ShieldHidConfig:
+    topic: str = "kha/livingroom/shield/press_key"
+
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    host: str = "127.0.0.1"
+    # service → local port of its Prometheus /metrics endpoint (0 disables)
+    ports: Dict[str, int] = field(default_factory=lambda: {
+        "mac_mini": 9100,  # khc-mac-mini-host (kvm + reaper + sparrow)
+        "kvm": 9101,
+        "reaper": 9102,
+        "sparrow": 9103,
+        "numpad": 9104,
+        "shield_hid": 9105,
+    })
+
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    level: str = "INFO"
+    rate_per_site: float = 5.0     # records/s per call site once the burst is spent (0 = unlimited)
+    burst: int = 20
+    debug_sample_every: int = 1    # emit every Nth DEBUG record per call site
+
+
+@dataclass(frozen=True)
+class KhcConfig:
+    mqtt: MqttConfig = field(default_factory=MqttConfig)
+    kvm: KvmConfig = field(default_factory=KvmConfig)
+    reaper: ReaperConfig = field(default_factory=ReaperConfig)
+    sparrow: SparrowConfig = field(default_factory=SparrowConfig)
+    numpad: NumpadConfig = field(default_factory=NumpadConfig)
+    shield_hid: ShieldHidConfig = field(default_factory=ShieldHidConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+
+
+# --------------------------------------------------------------------
+# Parsing & validation
+# --------------------------------------------------------------------
+def _coerce(value: Any, tp: Any, where: str) -> Any:
+    if is_dataclass(tp):
+        if not isinstance(value, Mapping):
+            raise ConfigError(f"{where}: expected a table")
+        return _build(tp, value, where)
+    if get_origin(tp) in (dict, Dict):
+        _, value_tp = get_args(tp)
+        if not isinstance(value, Mapping):
+            raise ConfigError(f"{where}: expected a table")
+        return {str(k): _coerce(v, value_tp, f"{where}.{k}") for k, v in value.items()}
+    if tp is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if tp is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if tp is str and isinstance(value, str):
+        return value
+    if tp is bool and isinstance(value, bool):
+        return value
+    raise ConfigError(f"{where}: expected {getattr(tp, '__name__', tp)}, got {value!r}")
+
+
+def _build(cls: type, data: Mapping[str, Any], where: str) -> Any:
+    hints = get_type_hints(cls)
+    names = {f.name for f in fields(cls)}
+    unknown = sorted(set(data) - names)
+    if unknown:
+        raise ConfigError(f"{where or 'config'}: unknown key(s) {unknown}")
+    kwargs = {
+        name: _coerce(data[name], hints[name], f"{where}.{name}" if where else name)
+        for name in names if name in data
+    }
+    try:
+        return cls(**kwargs)
+    except ConfigError as e:  # __post_init__ checks
+        raise ConfigError(f"{where or 'config'}: {e}") from None
+
+
+def parse_config(text: str) -> KhcConfig:
+    try:
+        data = tomllib.loads(text)
+    except tomllib.TOMLDecodeError as e:
+        raise ConfigError(str(e)) from None
+    return _build(KhcConfig, data, "")
+
+
+# --------------------------------------------------------------------
+# Store
+# --------------------------------------------------------------------
+class ConfigStore:
+    """The current config plus the mtime it was read at."""
+
+    def __init__(self, path: Path = CONFIG_FILE):
+        self.path = path
+        self._config: Optional[KhcConfig] = None
+        self._mtime: Optional[float] = None
+        self._listeners: List[Callable[[KhcConfig, KhcConfig], None]] = []
+
+    def _stat_mtime(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def get(self) -> KhcConfig:
+        if self._config is None:
+            self._mtime = self._stat_mtime()
+            self._config = parse_config(self.path.read_text()) if self._mtime is not None else KhcConfig()
+        return self._config
+
+    def add_listener(self, fn: Callable[[KhcConfig, KhcConfig], None]) -> None:
+        """Call fn(old, new) after each successful reload that changed something."""
+        self._listeners.append(fn)
+
+    def reload_if_changed(self) -> bool:
+        mtime = self._stat_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            new = parse_config(self.path.read_text()) if mtime is not None else KhcConfig()
+        except (OSError, ConfigError) as e:
+            LOG.error("Ignoring invalid config %s: %s", self.path, e)
+            return False
+        old = self.get()
+        if new == old:
+            return False
+        self._config = new
+        LOG.info("Reloaded config from %s", self.path)
+        for fn in self._listeners:
+            try:
+                fn(old, new)
+            except Exception:  # noqa: BLE001
+                LOG.exception("Config listener %s failed", getattr(fn, "__name__", fn))
+        return True
+
+
+CONFIG = ConfigStore()
+
+
+def get_config() -> KhcConfig:
+    return CONFIG.get()
+
+
+async def watch_config(interval: float = WATCH_INTERVAL) -> None:
+    """Reload the config in place whenever the file changes (runs forever)."""
+    CONFIG.get()
+    while True:
+        await asyncio.sleep(interval)
+        CONFIG.reload_if_changed()
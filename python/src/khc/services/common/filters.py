@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+filters.py — per-control smoothing for controller values
+
+Each physical control (dial_N, fader_N) gets its own filter instance that
+sees every raw, normalized value and decides what, if anything, to publish:
+
+  - deadband    publish once a value moves `threshold` away from the last
+                published one (the old fixed DEADBAND behaviour)
+  - hysteresis  a move that keeps its direction passes one step at a time
+                (slow, careful moves aren't lost); a reversal must exceed an
+                adaptive threshold that grows with the measured jitter of
+                the pot, so a noisy pot settles instead of flickering
+  - one_euro    One-Euro low-pass (Casiez et al., CHI 2012): heavy smoothing
+                when the control barely moves, almost none during a fast
+                move; publishes when the smoothed value changes by `threshold`
+  - none        publish every change
+
+A filter only decides when a CC arrives, so the value a gesture ends on can
+stay held back: the pot stops (no more CCs) or jitters around a position
+the filter won't step back to. FilterBank.settle() covers that: once a
+control hasn't published for `settle` seconds, it publishes
+  - its last raw value, if no CC arrived for `settle` seconds either and
+    that value isn't the published one
+  - else its resting position (a time-weighted mean of its raw values), if
+    that is half a step or more away from the published value
+
+Filters are pure: callers pass the clock, so khc.bench.filters can replay
+gestures on a simulated clock. Settings are [sparrow.filter] (default) and
+[sparrow.filters.<control>] (overrides) in khc.toml.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Optional, Protocol
+
+from khc.services.common.config import ControlFilterConfig
+
+NOISE_SMOOTHING = 0.25  # EWMA weight of a new reversal in the jitter estimate
+MIN_DT = 1e-3           # seconds; MIDI can deliver several values per timestamp
+REST_TAU = 0.05         # seconds; time constant of the resting-position estimate
+SETTLE_TOLERANCE = 0.5 / 127.0  # half a 7-bit step
+
+
+class ControlFilter(Protocol):
+    def update(self, value: float, now: float) -> Optional[float]:
+        """Return the value to publish for raw `value` at `now`, or None to hold it back."""
+        ...
+
+    def sync(self, value: float) -> None:
+        """`value` was published outside update() (FilterBank.settle); measure from it."""
+        ...
+
+
+class Passthrough:
+    def __init__(self) -> None:
+        self.last: Optional[float] = None
+
+    def update(self, value: float, now: float) -> Optional[float]:
+        if value == self.last:
+            return None
+        self.last = value
+        return value
+
+    def sync(self, value: float) -> None:
+        self.last = value
+
+
+class Deadband:
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.last: Optional[float] = None
+
+    def update(self, value: float, now: float) -> Optional[float]:
+        if self.last is not None and abs(value - self.last) < self.threshold:
+            return None
+        self.last = value
+        return value
+
+    def sync(self, value: float) -> None:
+        self.last = value
+
+
+class Hysteresis:
+    """Direction-aware deadband whose reversal threshold follows the pot's jitter."""
+
+    def __init__(self, threshold: float, max_threshold: float, noise_gain: float):
+        self.min_threshold = threshold
+        self.max_threshold = max(threshold, max_threshold)
+        self.noise_gain = noise_gain
+        self.noise = 0.0  # smoothed size of a reversal, capped at max_threshold
+        self.last: Optional[float] = None
+        self.direction = 0
+
+    @property
+    def threshold(self) -> float:
+        return min(self.max_threshold, max(self.min_threshold, self.noise_gain * self.noise))
+
+    def update(self, value: float, now: float) -> Optional[float]:
+        if self.last is None:
+            self.last = value
+            return value
+        delta = value - self.last
+        if not delta:
+            return None
+        direction = 1 if delta > 0 else -1
+        if direction != self.direction:
+            # Jitter or a real change of direction: learn from it either way
+            threshold = self.threshold
+            self.noise += NOISE_SMOOTHING * (min(abs(delta), self.max_threshold) - self.noise)
+            if abs(delta) < threshold:
+                return None
+            self.direction = direction
+        self.last = value
+        return value
+
+    def sync(self, value: float) -> None:
+        # At rest: the next move may go either way
+        self.last = value
+        self.direction = 0
+
+
+class OneEuro:
+    """One-Euro filter; cutoff = min_cutoff + beta × |speed| (Hz, speed in full-scale/s)."""
+
+    def __init__(self, threshold: float, min_cutoff: float, beta: float, d_cutoff: float):
+        self.threshold = threshold
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.x: Optional[float] = None
+        self.dx = 0.0
+        self.t = 0.0
+        self.last: Optional[float] = None
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, value: float, now: float) -> Optional[float]:
+        if self.x is None:
+            self.x, self.t, self.last = value, now, value
+            return value
+        dt = max(MIN_DT, now - self.t)
+        self.t = now
+        self.dx += self._alpha(self.d_cutoff, dt) * ((value - self.x) / dt - self.dx)
+        cutoff = self.min_cutoff + self.beta * abs(self.dx)
+        self.x += self._alpha(cutoff, dt) * (value - self.x)
+        # The ends of the travel are where the user wants to land exactly
+        x = value if value in (0.0, 1.0) else self.x
+        if self.last is not None and abs(x - self.last) < self.threshold:
+            return None
+        self.last = x
+        return x
+
+    def sync(self, value: float) -> None:
+        self.last = value
+
+
+def make_filter(config: ControlFilterConfig) -> ControlFilter:
+    if config.kind == "deadband":
+        return Deadband(config.threshold)
+    if config.kind == "hysteresis":
+        return Hysteresis(config.threshold, config.max_threshold, config.noise_gain)
+    if config.kind == "one_euro":
+        return OneEuro(config.threshold, config.min_cutoff, config.beta, config.d_cutoff)
+    return Passthrough()
+
+
+class RestingValue:
+    """Time-weighted mean of a control's raw values (which hold between CCs): where it rests."""
+
+    def __init__(self, value: float, now: float):
+        self.mean = value
+        self.raw = value
+        self.t = now
+
+    def at(self, now: float) -> float:
+        a = 1.0 - math.exp(-max(0.0, now - self.t) / REST_TAU)
+        return self.mean + a * (self.raw - self.mean)
+
+    def update(self, value: float, now: float) -> None:
+        self.mean = self.at(now)
+        self.raw, self.t = value, now
+
+
+class _Control:
+    __slots__ = ("filter", "settle", "rest", "published", "t_published")
+
+    def __init__(self, config: ControlFilterConfig, value: float, now: float):
+        self.filter = make_filter(config)
+        self.settle = config.settle if config.kind != "none" else 0.0
+        self.rest = RestingValue(value, now)
+        self.published: Optional[float] = None
+        self.t_published = now
+
+
+class FilterBank:
+    """One filter per control id, built on first use from `default`/`overrides`."""
+
+    def __init__(self, default: ControlFilterConfig, overrides: Dict[str, ControlFilterConfig]):
+        self.default = default
+        self.overrides = overrides
+        self._controls: Dict[str, _Control] = {}
+
+    def update(self, control_id: str, value: float, now: float) -> Optional[float]:
+        c = self._controls.get(control_id)
+        if c is None:
+            c = self._controls[control_id] = _Control(self.overrides.get(control_id, self.default), value, now)
+        else:
+            c.rest.update(value, now)
+        out = c.filter.update(value, now)
+        if out is not None:
+            c.published, c.t_published = out, now
+        return out
+
+    def settle(self, now: float) -> Dict[str, float]:
+        """Resting values of controls that haven't published for `settle` s and rest away from it."""
+        out: Dict[str, float] = {}
+        for control_id, c in self._controls.items():
+            if not c.settle or c.published is None or now - c.t_published < c.settle:
+                continue
+            if now - c.rest.t >= c.settle:
+                value = c.rest.raw  # stopped: exactly where it stopped
+                if value == c.published:
+                    continue
+            else:
+                value = c.rest.at(now)  # jittering around its resting position
+                if abs(value - c.published) < SETTLE_TOLERANCE:
+                    continue
+            c.filter.sync(value)
+            c.published, c.t_published = value, now
+            out[control_id] = value
+        return out
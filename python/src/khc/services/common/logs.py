@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+logs.py — shared logging setup for KHC services
+
+  - one key=value line per record:
+        ts=12:00:01.234 level=INFO logger=khc.runtime msg="Connected as numpad_to_mqtt"
+  - log_kv() attaches structured fields and does nothing (no formatting, no
+    record) unless the level is enabled, so it is safe on hot paths
+  - per-call-site rate limiting: a call site that floods (a bad-payload
+    warning per message) is cut to a token bucket; the next record that gets
+    through carries suppressed=<n>
+  - DEBUG sampling: with debug_sample_every = N only every Nth DEBUG record
+    per call site is emitted
+  - runtime level switch: publish DEBUG/INFO/WARNING/... to
+    khc/control/<service>/log_level (or khc/control/all/log_level); an empty
+    payload restores the configured level
+
+Limits and the default level are under [logging] in khc.toml and are read
+per record, so they follow config reloads.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from khc.services.common.config import get_config
+
+LOG = logging.getLogger("khc.logs")
+
+CONTROL_TOPIC_PREFIX = "khc/control"
+
+_CallSite = Tuple[str, int]
+
+
+# --------------------------------------------------------------------
+# Structured records
+# --------------------------------------------------------------------
+def _quote(value: Any) -> str:
+    s = str(value)
+    if not s or any(c in s for c in ' ="'):
+        return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return s
+
+
+def log_kv(logger: logging.Logger, level: int, msg: str, **fields: Any) -> None:
+    """Log `msg` with key=value fields; free when `level` is disabled."""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"kv": fields}, stacklevel=2)
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [
+            f"ts={self.formatTime(record, '%H:%M:%S')}.{int(record.msecs):03d}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"msg={_quote(record.getMessage())}",
+        ]
+        fields: Optional[Dict[str, Any]] = getattr(record, "kv", None)
+        if fields:
+            parts.extend(f"{k}={_quote(v)}" for k, v in fields.items())
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            parts.append(f"suppressed={suppressed}")
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+# --------------------------------------------------------------------
+# Filters
+# --------------------------------------------------------------------
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site (file, line); counts what it drops."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # call site -> [tokens, last refill (monotonic), suppressed since last emit]
+        self._buckets: Dict[_CallSite, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        config = get_config().logging
+        if config.rate_per_site <= 0:
+            return True
+        now = time.monotonic()
+        bucket = self._buckets.get((record.pathname, record.lineno))
+        if bucket is None:
+            bucket = self._buckets[(record.pathname, record.lineno)] = [float(config.burst), now, 0]
+        tokens = min(float(config.burst), bucket[0] + (now - bucket[1]) * config.rate_per_site)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            bucket[2] += 1
+            return False
+        bucket[0] = tokens - 1.0
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Pass every Nth DEBUG record per call site."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._seen: Dict[_CallSite, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        every = get_config().logging.debug_sample_every
+        if every <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        n = self._seen.get(site, 0)
+        self._seen[site] = n + 1
+        return n % every == 0
+
+
+# --------------------------------------------------------------------
+# Setup & runtime control
+# --------------------------------------------------------------------
+def configured_level() -> int:
+    level = logging.getLevelName(get_config().logging.level.upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def setup_logging(level: Optional[int] = None) -> None:
+    """Install the key=value handler on the root logger (idempotent)."""
+    root = logging.getLogger()
+    root.setLevel(configured_level() if level is None else level)
+    if any(getattr(h, "_khc", False) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._khc = True  # type: ignore[attr-defined]
+    handler.setFormatter(KeyValueFormatter())
+    # Sample first so dropped DEBUG records don't use up the rate budget
+    handler.addFilter(DebugSamplingFilter())
+    handler.addFilter(RateLimitFilter())
+    root.addHandler(handler)
+
+
+async def _on_log_level(runtime, userdata, msg) -> None:
+    name = msg.payload.decode("utf-8", "ignore").strip().upper()
+    level = logging.getLevelName(name) if name else configured_level()
+    if not isinstance(level, int):
+        LOG.warning("Ignoring unknown log level %r on %s", name, msg.topic)
+        return
+    logging.getLogger().setLevel(level)
+    # WARNING so the switch itself is visible at any level
+    LOG.warning("Log level set to %s via %s", logging.getLevelName(level), msg.topic)
+
+
+def subscribe_log_control(runtime, service: str) -> None:
+    """Let khc/control/<service>/log_level (and .../all/...) switch the root level."""
+    for scope in (service, "all"):
+        runtime.subscribe(f"{CONTROL_TOPIC_PREFIX}/{scope}/log_level", _on_log_level)
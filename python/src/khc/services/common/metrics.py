@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+metrics.py — in-process metrics with a Prometheus text endpoint
+
+Every service process has one REGISTRY. Hot paths hold on to their metric
+objects (created once at import) and only do an integer add or an array
+slot increment per event — no dict lookups, no locks. Increments from the
+MIDI and blocking-call threads rely on the GIL; an occasional lost
+increment under contention is acceptable for monitoring.
+
+    MESSAGES = counter("khc_reaper_messages_total", "daw/set_params messages handled")
+    MESSAGES.inc()
+
+run_service() serves the registry on http://127.0.0.1:<port>/metrics, with
+the port taken from [metrics.ports] in khc.toml (0 disables the endpoint).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LOG = logging.getLogger("khc.metrics")
+
+# Upper bucket bounds in seconds; values above the last bound land in +Inf.
+DEFAULT_BUCKETS_S: Sequence[float] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# --------------------------------------------------------------------
+# Metric types
+# --------------------------------------------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        self.value += n
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value: float = 0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, n: float = 1) -> None:
+        self.value += n
+
+    def dec(self, n: float = 1) -> None:
+        self.value -= n
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """Sample `fn()` at scrape time instead of tracking the value (e.g. a queue size)."""
+        self._fn = fn
+
+    def samples(self) -> List[str]:
+        value = self.value
+        if self._fn is not None:
+            try:
+                value = self._fn()
+            except Exception:  # noqa: BLE001
+                return []
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(value)}"]
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts live in a preallocated array."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, labels: Labels = (), bounds: Sequence[float] = DEFAULT_BUCKETS_S):
+        self.name = name
+        self.labels = labels
+        self.bounds = tuple(bounds)
+        self.counts = array("Q", bytes(8 * (len(self.bounds) + 1)))
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        cumulative = 0
+        labels = _format_labels(self.labels)
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            le = _format_labels(self.labels, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        cumulative += self.counts[-1]
+        le = _format_labels(self.labels, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {self.sum!r}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# --------------------------------------------------------------------
+# Registry
+# --------------------------------------------------------------------
+class Registry:
+    def __init__(self) -> None:
+        # name -> (kind, help, {labels: metric}); insertion-ordered for stable output
+        self._families: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+
+    def _get(self, cls: type, name: str, help: str, labels: Dict[str, str], **kwargs) -> object:
+        key: Labels = tuple(sorted(labels.items()))
+        kind, _, children = self._families.setdefault(name, (cls.kind, help, {}))
+        if kind != cls.kind:
+            raise ValueError(f"metric {name} already registered as a {kind}")
+        metric = children.get(key)
+        if metric is None:
+            metric = children[key] = cls(name, key, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, bounds: Sequence[float] = DEFAULT_BUCKETS_S, **labels: str) -> Histogram:
+        return self._get(Histogram, name, help, labels, bounds=bounds)
+
+    def exposition(self) -> str:
+        """Render all metrics in the Prometheus text format (version 0.0.4)."""
+        lines: List[str] = []
+        for name, (kind, help, children) in self._families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in children.values():
+                lines.extend(metric.samples())
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+# --------------------------------------------------------------------
+# HTTP endpoint
+# --------------------------------------------------------------------
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: Registry) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        # Drain the headers; we answer every GET the same way.
+        while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+            pass
+        if request_line.startswith(b"GET "):
+            body = registry.exposition().encode("utf-8")
+            head = b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+        else:
+            body = b"method not allowed\n"
+            head = b"HTTP/1.0 405 Method Not Allowed\r\nContent-Type: text/plain\r\n"
+        writer.write(head + b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> asyncio.AbstractServer:
+    """Start the /metrics endpoint (runs until the returned server is closed)."""
+    server = await asyncio.start_server(lambda r, w: _handle_scrape(r, w, registry), host, port)
+    LOG.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+runtime.py — asyncio MQTT runtime shared by all KHC services
+
+Owns the one paho client of a service process:
+  - the paho network loop runs in a dedicated thread that reconnects with
+    jittered exponential backoff (first retry after ~50 ms)
+  - every registered subscription is re-sent on each successful CONNACK
+  - incoming messages are handed over to the asyncio loop and dispatched to
+    async handlers there, so a slow handler never stalls the network thread
+  - with local_delivery=True (several bridges in one process, see
+    khc.services.mac_mini.host), a publish that matches one of our own
+    subscriptions is dispatched in-process right away; the subscriptions use
+    MQTT v5 no_local so the broker doesn't echo it back a second time
+
+Usage:
+    async def on_set_source(runtime, userdata, msg): ...
+
+    async def serve(runtime):
+        runtime.subscribe("kha/foo/#", on_set_source, userdata=ser)
+        await runtime.wait_closed()
+
+    def main():
+        return run_service("my_client_id", serve)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import paho.mqtt.client as mqtt
+
+from khc.services.common import load_mqtt_secrets
+from khc.services.common.config import get_config, watch_config
+from khc.services.common.logs import setup_logging, subscribe_log_control
+from khc.services.common.metrics import counter, gauge, histogram, serve_metrics
+
+LOG = logging.getLogger("khc.runtime")
+
+T = TypeVar("T")
+
+# async def handler(runtime, userdata, msg) -> None
+Handler = Callable[["MqttRuntime", Any, mqtt.MQTTMessage], Awaitable[None]]
+
+# ---------- metrics ----------
+MESSAGES_RECEIVED = counter("khc_mqtt_messages_received_total", "MQTT messages received")
+MESSAGES_PUBLISHED = counter("khc_mqtt_messages_published_total", "MQTT publishes handed to the client")
+PUBLISHES_DROPPED = counter("khc_mqtt_publishes_dropped_total", "MQTT publishes refused by the client (e.g. while disconnected)")
+CONNECTS = counter("khc_mqtt_connects_total", "Successful MQTT connects (including reconnects)")
+DISCONNECTS = counter("khc_mqtt_disconnects_total", "Unexpected MQTT disconnects")
+CONNECTED = gauge("khc_mqtt_connected", "1 while connected to the broker")
+DISPATCH_QUEUE = gauge("khc_mqtt_dispatch_queue", "Received messages waiting for their handlers")
+OUT_QUEUE = gauge("khc_mqtt_out_queue", "Packets queued in the MQTT client for sending")
+HANDLER_SECONDS = histogram("khc_handler_seconds", "Time spent in MQTT message handlers")
+HANDLER_ERRORS = counter("khc_handler_errors_total", "MQTT message handlers that raised")
+LOCAL_DELIVERIES = counter("khc_mqtt_local_deliveries_total", "Publishes dispatched in-process to our own subscriptions")
+
+
+# --------------------------------------------------------------------
+# Backoff
+# --------------------------------------------------------------------
+class Backoff:
+    """Exponential backoff with jitter: each delay is drawn from [d/2, d]."""
+
+    def __init__(self, initial: float = 0.05, maximum: float = 5.0, factor: float = 2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self._attempt = 0
+
+    def next(self) -> float:
+        delay = min(self.maximum, self.initial * (self.factor ** self._attempt))
+        self._attempt += 1
+        return random.uniform(delay / 2.0, delay)
+
+    def reset(self) -> None:
+        self._attempt = 0
+
+
+# --------------------------------------------------------------------
+# Runtime
+# --------------------------------------------------------------------
+class MqttRuntime:
+    """One MQTT connection plus an asyncio dispatcher for async handlers."""
+
+    def __init__(
+        self,
+        client_id: str,
+        keepalive: int = 30,
+        backoff: Optional[Backoff] = None,
+        local_delivery: bool = False,
+    ):
+        self.client_id = client_id
+        self._keepalive = keepalive
+        self._backoff = backoff or Backoff()
+        self._subscriptions: List[Tuple[str, int, Handler, Any]] = []
+        self._local_delivery = local_delivery
+        self._local_matches: Dict[str, bool] = {}  # topic -> matches a subscription
+
+        self._client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            protocol=mqtt.MQTTv5 if local_delivery else mqtt.MQTTv311,
+        )
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_message = self._on_message
+        self._client.on_publish = self._on_publish
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue[mqtt.MQTTMessage]] = None
+        self._closed: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task[None]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._broker: Optional[Tuple[str, str, str, int]] = None  # (host, user, password, port)
+        self._stopping = threading.Event()
+        self._connected = threading.Event()
+        self._connected_async: Optional[asyncio.Event] = None
+        # publish acks: mid -> future of an awaiting publish_and_wait(), and
+        # mids whose ack arrived before anyone waited (bounded, oldest dropped)
+        self._ack_lock = threading.Lock()
+        self._ack_waiters: Dict[int, asyncio.Future[None]] = {}
+        self._early_acks: "OrderedDict[int, None]" = OrderedDict()
+
+    # ---------- public API ----------
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def subscribe(self, topic_filter: str, handler: Handler, userdata: Any = None, qos: int = 0) -> None:
+        """Register an async handler; the subscription survives reconnects."""
+        self._subscriptions.append((topic_filter, qos, handler, userdata))
+        self._local_matches.clear()
+        if self.connected:
+            self._send_subscribe([(topic_filter, qos)])
+
+    def unsubscribe(self, topic_filter: str, handler: Handler) -> None:
+        """Remove a handler added with subscribe(); the broker subscription goes with the filter's last one."""
+        # A new list: the dispatcher may be iterating over the old one
+        self._subscriptions = [s for s in self._subscriptions if not (s[0] == topic_filter and s[2] == handler)]
+        self._local_matches.clear()
+        if self.connected and all(f != topic_filter for f, _, _, _ in self._subscriptions):
+            self._client.unsubscribe(topic_filter)
+
+    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        """Thread-safe, non-blocking publish (QoS 0 messages are dropped while disconnected)."""
+        if self._local_delivery and self._loop is not None:
+            self._deliver_locally(topic, payload, qos, retain)
+        info = self._client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            MESSAGES_PUBLISHED.inc()
+        else:
+            PUBLISHES_DROPPED.inc()
+        return info
+
+    async def publish_and_wait(
+        self, topic: str, payload: Any, qos: int = 0, retain: bool = False, timeout: float = 1.0,
+    ) -> bool:
+        """
+        Publish and wait — without blocking the event loop — until the client
+        has written it (QoS 0) or the broker acked it (QoS 1/2).
+
+        Returns False if the client refused the publish or `timeout` expired.
+        """
+        info = self.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        with self._ack_lock:
+            if info.mid in self._early_acks or info.is_published():
+                self._early_acks.pop(info.mid, None)
+                return True
+            fut = self._loop.create_future()
+            self._ack_waiters[info.mid] = fut
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._ack_lock:
+                self._ack_waiters.pop(info.mid, None)
+
+    async def wait_connected(self) -> None:
+        assert self._connected_async is not None, "runtime not started"
+        await self._connected_async.wait()
+
+    async def start(self) -> None:
+        # Here, not in the network thread: a missing secrets file must end the process
+        self._broker = load_mqtt_secrets()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._closed = asyncio.Event()
+        self._connected_async = asyncio.Event()
+        CONNECTED.set_function(lambda: int(self.connected))
+        DISPATCH_QUEUE.set_function(self._queue.qsize)
+        # paho keeps no public counter for this; fall back to 0 if its internals change
+        OUT_QUEUE.set_function(lambda: len(getattr(self._client, "_out_packet", ())))
+        self._dispatcher = asyncio.create_task(self._dispatch_forever(), name=f"{self.client_id}-dispatch")
+        self._thread = threading.Thread(target=self._network_main, name=f"{self.client_id}-mqtt", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        try:
+            self._client.disconnect()
+        except Exception:  # noqa: BLE001
+            pass
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 2.0)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._closed is not None:
+            self._closed.set()
+
+    async def wait_closed(self) -> None:
+        assert self._closed is not None, "runtime not started"
+        await self._closed.wait()
+
+    async def __aenter__(self) -> "MqttRuntime":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    # ---------- network thread ----------
+    def _network_main(self) -> None:
+        assert self._broker is not None
+        host, user, pwd, port = self._broker
+        self._client.username_pw_set(user, pwd)
+
+        while not self._stopping.is_set():
+            try:
+                self._client.connect(host, port, keepalive=self._keepalive)
+            except OSError as e:
+                delay = self._backoff.next()
+                LOG.warning("Connect to %s:%s failed (%s); retrying in %.0f ms", host, port, e, delay * 1000.0)
+                self._stopping.wait(delay)
+                continue
+
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while rc == mqtt.MQTT_ERR_SUCCESS and not self._stopping.is_set():
+                rc = self._client.loop(timeout=1.0)
+
+            if not self._stopping.is_set():
+                delay = self._backoff.next()
+                LOG.warning("Connection lost (%s); reconnecting in %.0f ms", mqtt.error_string(rc), delay * 1000.0)
+                self._stopping.wait(delay)
+
+    # ---------- paho callbacks (network thread) ----------
+    def _on_connect(self, client, userdata, connect_flags, reason_code, properties) -> None:
+        if reason_code.is_failure:
+            LOG.error("Connect refused: %s", reason_code)
+            return
+        LOG.info("Connected as %s", self.client_id)
+        CONNECTS.inc()
+        self._backoff.reset()
+        self._connected.set()
+        self._call_in_loop(self._connected_async.set)
+        filters = sorted({(topic_filter, qos) for topic_filter, qos, _, _ in self._subscriptions})
+        if filters:
+            self._send_subscribe(filters)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties) -> None:
+        self._connected.clear()
+        self._call_in_loop(self._connected_async.clear)
+        if not self._stopping.is_set():
+            DISCONNECTS.inc()
+            LOG.warning("Disconnected: %s", reason_code)
+
+    def _on_message(self, client, userdata, msg: mqtt.MQTTMessage) -> None:
+        self._call_in_loop(self._queue.put_nowait, msg)
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties) -> None:
+        with self._ack_lock:
+            fut = self._ack_waiters.pop(mid, None)
+            if fut is None:
+                self._early_acks[mid] = None
+                if len(self._early_acks) > 256:
+                    self._early_acks.popitem(last=False)
+        if fut is not None:
+            self._call_in_loop(_resolve, fut)
+
+    def _call_in_loop(self, fn: Callable[..., Any], *args: Any) -> None:
+        try:
+            self._loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            pass  # event loop already closed during shutdown
+
+    # ---------- local delivery ----------
+    def _send_subscribe(self, filters: List[Tuple[str, int]]) -> None:
+        if self._local_delivery:
+            self._client.subscribe([(t, mqtt.SubscribeOptions(qos=q, noLocal=True)) for t, q in filters])
+        else:
+            self._client.subscribe(filters)
+
+    def _deliver_locally(self, topic: str, payload: Any, qos: int, retain: bool) -> None:
+        """Queue a copy of our own publish for our own matching handlers (any thread)."""
+        matches = self._local_matches.get(topic)
+        if matches is None:
+            matches = any(mqtt.topic_matches_sub(f, topic) for f, _, _, _ in self._subscriptions)
+            self._local_matches[topic] = matches
+        if not matches:
+            return
+        msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("ascii")
+        msg.payload = payload if payload is not None else b""
+        msg.qos = qos
+        msg.retain = retain
+        LOCAL_DELIVERIES.inc()
+        self._on_message(self._client, None, msg)
+
+    # ---------- dispatcher (asyncio loop) ----------
+    async def _dispatch_forever(self) -> None:
+        while True:
+            msg = await self._queue.get()
+            MESSAGES_RECEIVED.inc()
+            for topic_filter, _, handler, userdata in self._subscriptions:
+                if not mqtt.topic_matches_sub(topic_filter, msg.topic):
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    await handler(self, userdata, msg)
+                except Exception:  # noqa: BLE001
+                    HANDLER_ERRORS.inc()
+                    LOG.exception("Handler %s failed on %s", getattr(handler, "__name__", handler), msg.topic)
+                HANDLER_SECONDS.observe(time.perf_counter() - t0)
+
+
+# --------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------
+def _resolve(fut: asyncio.Future[None]) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any) -> T:
+    """
+    Run a blocking call in a daemon thread and await its result.
+
+    Unlike asyncio.to_thread, a call that never returns (a MIDI port read, a
+    hidg write while the host is asleep) cannot hold up interpreter shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    fut: asyncio.Future[T] = loop.create_future()
+
+    def resolve(setter: Callable[[Any], None], value: Any) -> None:
+        if not fut.done():
+            setter(value)
+
+    def target() -> None:
+        try:
+            result = fn(*args)
+        except BaseException as e:  # noqa: BLE001
+            outcome = (fut.set_exception, e)
+        else:
+            outcome = (fut.set_result, result)
+        try:
+            loop.call_soon_threadsafe(resolve, *outcome)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    threading.Thread(target=target, name=getattr(fn, "__name__", "blocking"), daemon=True).start()
+    return await fut
+
+
+def run_service(
+    client_id: str,
+    serve: Callable[[MqttRuntime], Awaitable[None]],
+    service: Optional[str] = None,
+    local_delivery: bool = False,
+    log_level: Optional[int] = None,
+) -> int:
+    """Run `serve(runtime)` on a fresh event loop until it returns or Ctrl+C.
+
+    The service config (khc.services.common.config) is hot-reloaded meanwhile.
+    `service` picks the metrics port from [metrics.ports] in the config and
+    the khc/control/<service>/log_level topic. `log_level` (e.g. from a
+    --debug flag) overrides [logging].level.
+    """
+    setup_logging(log_level)
+
+    async def _main() -> None:
+        watcher = asyncio.create_task(watch_config(), name=f"{client_id}-config")
+        metrics_server = None
+        config = get_config().metrics
+        port = config.ports.get(service, 0) if service else 0
+        if port:
+            try:
+                metrics_server = await serve_metrics(port, config.host)
+            except OSError as e:
+                LOG.error("Cannot serve metrics on %s:%d: %s", config.host, port, e)
+        try:
+            async with MqttRuntime(client_id, local_delivery=local_delivery) as runtime:
+                if service:
+                    subscribe_log_control(runtime, service)
+                await serve(runtime)
+        finally:
+            watcher.cancel()
+            if metrics_server is not None:
+                metrics_server.close()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        LOG.info("Stopping cleanly (Ctrl+C)…")
+    return 0
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+tracing.py — opt-in end-to-end latency tracing for KHC bridges
+
+Enable with KHC_TRACE=1 in the environment of each participating service.
+
+Input bridges (numpad, Sparrow) stamp a `trace` object into their JSON
+payloads; Home Assistant pyscript forwards it and appends its own hop; the
+output bridges (REAPER, KVM, Shield HID) append the time a message reached
+their handler and the time the device write finished:
+
+    "trace": {"id": "5f1c0a9e", "hops": [["numpad", 1712000000123.4],
+                                         ["ha", 1712000000131.9]]}
+
+Hop times are wall-clock milliseconds, not time.monotonic(): the hops cross
+hosts (Pi, HAOS VM, Mac) and only the NTP-synced wall clock is comparable
+between them. Each output bridge folds finished traces into fixed-bucket
+histograms per path and publishes a retained snapshot to khc/trace/<service>
+every few seconds; `python -m khc.tools.trace_report` summarizes them.
+Paths come from publishers, so a recorder keeps at most MAX_PATHS of them
+(traces of MAX_HOPS hops at most); traces past either limit are counted as
+dropped, not recorded.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence
+
+from khc.services.common.metrics import counter
+
+TRACE_ENABLED = os.environ.get("KHC_TRACE", "") not in ("", "0")
+TRACE_TOPIC_PREFIX = "khc/trace"
+SNAPSHOT_INTERVAL = 5.0  # seconds
+MAX_PATHS = 32           # distinct hop paths per recorder
+MAX_HOPS = 16            # hops per trace
+
+# Upper bucket bounds in milliseconds; the last bucket catches everything above.
+LATENCY_BUCKETS_MS: Sequence[float] = (
+    0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75,
+    100, 150, 200, 300, 500, 750, 1000, 2000, 5000,
+)
+
+TRACES_DROPPED = counter("khc_trace_dropped_total", "Traces not recorded: too many hops or a new path past MAX_PATHS")
+
+
+def now_ms() -> float:
+    return time.time() * 1000.0
+
+
+# --------------------------------------------------------------------
+# Stamping (input side)
+# --------------------------------------------------------------------
+def stamp(payload: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Start a trace in `payload` (no-op unless KHC_TRACE is set)."""
+    if TRACE_ENABLED:
+        payload["trace"] = {"id": os.urandom(4).hex(), "hops": [[source, now_ms()]]}
+    return payload
+
+
+def add_hop(trace: Optional[Dict[str, Any]], name: str) -> None:
+    """Append a hop to an in-flight trace (tolerates missing/garbled traces)."""
+    if isinstance(trace, dict) and isinstance(trace.get("hops"), list):
+        trace["hops"].append([name, now_ms()])
+
+
+# --------------------------------------------------------------------
+# Histograms (output side)
+# --------------------------------------------------------------------
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(self.bounds, value_ms)] += 1
+        self.total += 1
+        self.sum_ms += value_ms
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th percentile (0..100) by interpolating inside its bucket."""
+        if not self.total:
+            return 0.0
+        rank = q / 100.0 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1] * 2.0
+                return lo + (hi - lo) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"bounds": list(self.bounds), "counts": self.counts, "sum_ms": self.sum_ms}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LatencyHistogram":
+        h = cls(d["bounds"])
+        h.counts = list(d["counts"])
+        h.total = sum(h.counts)
+        h.sum_ms = float(d.get("sum_ms", 0.0))
+        return h
+
+
+class TraceRecorder:
+    """Per-service collection of hop histograms, keyed by path and hop."""
+
+    def __init__(self, service: str):
+        self.service = service
+        # path ("numpad>ha>hid") -> hop ("numpad>ha", ..., "total") -> histogram
+        self.paths: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self.dropped = 0
+
+    def record(self, trace: Optional[Dict[str, Any]]) -> None:
+        """Fold a finished trace into the histograms."""
+        if not isinstance(trace, dict):
+            return
+        try:
+            hops: List[List[Any]] = [[str(n), float(t)] for n, t in trace.get("hops", [])]
+        except (TypeError, ValueError):
+            return
+        if len(hops) < 2:
+            return
+        path = ">".join(n for n, _ in hops)
+        hists = self.paths.get(path)
+        if hists is None:
+            if len(hops) > MAX_HOPS or len(self.paths) >= MAX_PATHS:
+                self.dropped += 1
+                TRACES_DROPPED.inc()
+                return
+            hists = self.paths[path] = {}
+        for (a, ta), (b, tb) in zip(hops, hops[1:]):
+            hists.setdefault(f"{a}>{b}", LatencyHistogram()).observe(tb - ta)
+        hists.setdefault("total", LatencyHistogram()).observe(hops[-1][1] - hops[0][1])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "service": self.service,
+            "dropped": self.dropped,
+            "paths": {
+                path: {hop: h.to_dict() for hop, h in hists.items()}
+                for path, hists in self.paths.items()
+            },
+        }
+
+    async def publish_forever(self, runtime, interval: float = SNAPSHOT_INTERVAL) -> None:
+        """Publish a retained snapshot to khc/trace/<service> every `interval` seconds."""
+        topic = f"{TRACE_TOPIC_PREFIX}/{self.service}"
+        while True:
+            await asyncio.sleep(interval)
+            if self.paths:
+                runtime.publish(topic, json.dumps(self.snapshot(), separators=(",", ":")), retain=True)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Local Sparrow → REAPER fast path (khc-mac-mini-host)
+
+Normally a fader move goes Sparrow → MQTT → HA (bedroom_soundmix re-reads
+the dials and the active mix) → MQTT → REAPER bridge → OSC. With
+`sparrow.fast_path = true` the host wires this module between the Sparrow
+and REAPER plugins instead:
+
+  - HA publishes the current mix routing table, retained, on
+    {prefix}/daw/routing whenever the mix changes:
+        {"mix": "desk_seat_with_speakers", "muted": false,
+         "routes": {"master_volume": ["master_volume_speakers"],
+                    "piano_volume": ["piano_volume"], ...}}
+  - each Sparrow flush is mapped control → dial (sparrow.control_to_dial)
+    → params (routes) → OSC address (reaper.param_to_osc, track names
+    resolved by rpp_index) and sent to REAPER in-process, before the
+    {prefix}/controls publish that keeps HA's display in sync
+  - HA then echoes those values back on daw/set_params, late. The REAPER
+    plugin drops a param value that matches (within ECHO_TOLERANCE) one the
+    fast path sent in the last ECHO_WINDOW seconds, so an old echo can't pull
+    a fader back. Any other value — a Stream Deck turn, a mix switch — goes
+    through. Each new routing table clears the history, so HA's full resend
+    after a mix switch is never mistaken for an echo.
+
+Until a table arrives, or while HA marks the mix as muted (plugs switching),
+the fast path sends nothing and HA stays in charge.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter
+from khc.services.mac_mini.rpp_index import param_to_osc as resolved_param_to_osc
+
+if TYPE_CHECKING:
+    import paho.mqtt.client as mqtt
+
+    from khc.services.common.runtime import MqttRuntime
+    from khc.services.mac_mini.osc_bundle import OscBundleClient
+    from khc.services.mac_mini.ramps import RampEngine
+
+LOG = logging.getLogger("khc.fast_path")
+
+ECHO_WINDOW = 2.0       # seconds a sent value can come back from HA
+ECHO_TOLERANCE = 0.01   # HA input_numbers round to their step
+ECHO_HISTORY = 32       # sent values remembered per param
+
+ROUTING_UPDATES = counter("khc_fast_path_routing_updates_total", "Routing tables received from HA")
+OSC_SENDS = counter("khc_fast_path_osc_sends_total", "OSC messages sent to REAPER by the fast path")
+UNROUTED = counter("khc_fast_path_unrouted_total", "Control values with no dial or route (left to HA)")
+ECHOES_DROPPED = counter("khc_fast_path_echoes_dropped_total", "daw/set_params values dropped as echoes of the fast path")
+
+
+def routing_topic() -> str:
+    return f"{get_config().mqtt.topic_prefix}/daw/routing"
+
+
+def parse_routes(table: Mapping[str, Any]) -> Dict[str, List[str]]:
+    """dial → params from a routing table; ValueError if it's malformed."""
+    routes = table.get("routes", {})
+    if not isinstance(routes, Mapping):
+        raise ValueError("routes must be an object")
+    return {str(dial): [str(p) for p in params] for dial, params in routes.items()}
+
+
+class FastPath:
+    def __init__(self, osc_client: Optional[OscBundleClient] = None):
+        self.osc_client = osc_client
+        self.ramps: Optional[RampEngine] = None  # the REAPER bridge's: held params stay put
+        self.routes: Dict[str, List[str]] = {}  # dial → params
+        self.muted = True                       # until HA's table arrives
+        self._sent: Dict[str, Deque[Tuple[float, float]]] = {}  # param → (monotonic, value)
+
+    # -- routing table ---------------------------------------------------
+    def set_routing(self, table: Mapping[str, Any]) -> None:
+        self.routes = parse_routes(table)
+        self.muted = bool(table.get("muted", False))
+        self._sent.clear()
+        ROUTING_UPDATES.inc()
+        log_kv(LOG, logging.INFO, "routing updated", mix=table.get("mix", "?"), muted=self.muted,
+               routes=len(self.routes))
+
+    async def on_routing(self, runtime: MqttRuntime, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        try:
+            self.set_routing(json.loads(msg.payload))
+        except (ValueError, TypeError, AttributeError) as e:
+            # Keep the old table; better a stale route than none
+            log_kv(LOG, logging.WARNING, "bad routing table", payload=repr(msg.payload[:200]), error=e)
+
+    def subscribe(self, runtime: MqttRuntime) -> None:
+        runtime.subscribe(routing_topic(), self.on_routing)
+
+    # -- Sparrow side ----------------------------------------------------
+    def forward(self, controls: Mapping[str, float]) -> int:
+        """Send the routed `controls` to REAPER; returns the number of OSC messages."""
+        if self.muted or self.osc_client is None:
+            return 0
+        config = get_config()
+        control_to_dial = config.sparrow.control_to_dial
+        param_to_osc = resolved_param_to_osc()
+        now = time.monotonic()
+        messages: List[Tuple[str, float]] = []
+        for control_id, value in controls.items():
+            params = self.routes.get(control_to_dial.get(control_id, ""), ())
+            if not params:
+                UNROUTED.inc()
+                continue
+            for param in params:
+                address = param_to_osc.get(param)
+                if address is None or (self.ramps is not None and self.ramps.is_held(address)):
+                    continue
+                messages.append((address, float(value)))
+                history = self._sent.get(param)
+                if history is None:
+                    history = self._sent[param] = deque(maxlen=ECHO_HISTORY)
+                history.append((now, value))
+        if not messages:
+            return 0
+        try:
+            # One bundle per flush: REAPER moves the routed params together
+            self.osc_client.send_bundle(messages)
+        except OSError as e:
+            log_kv(LOG, logging.WARNING, "OSC send failed", messages=len(messages), error=e)
+            return 0
+        if self.ramps is not None:
+            self.ramps.note(messages)
+        OSC_SENDS.inc(len(messages))
+        return len(messages)
+
+    # -- REAPER side -----------------------------------------------------
+    def is_echo(self, param: str, value: Any, now: float) -> bool:
+        history = self._sent.get(param)
+        if not history:
+            return False
+        try:
+            v = float(value)
+        except (TypeError, ValueError):
+            return False
+        return any(now - t <= ECHO_WINDOW and abs(v - sent) <= ECHO_TOLERANCE for t, sent in history)
+
+    def drop_echoes(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """`params` without the values HA is only echoing back."""
+        if not self._sent:
+            return params
+        now = time.monotonic()
+        kept = {k: v for k, v in params.items() if not self.is_echo(k, v, now)}
+        if len(kept) != len(params):
+            ECHOES_DROPPED.inc(len(params) - len(kept))
+        return kept
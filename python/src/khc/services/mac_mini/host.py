@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Mac mini service host: KVM, REAPER and Sparrow bridges in one process
+
+Runs the `serve()` of each bridge module as a plugin on one event loop with
+one MQTT connection (instead of three LaunchAgents, three interpreters and
+three connections). Publishes that match another plugin's subscription are
+delivered in-process without a broker round trip (see
+MqttRuntime(local_delivery=True)).
+
+Each plugin is supervised on its own: if one fails (KVM unplugged), it is
+restarted after PLUGIN_RESTART_DELAY while the others keep running. The
+subscriptions a run made are removed before the restart, so handlers bound
+to its closed serial port or OSC socket don't linger. The Sparrow plugin
+waits for its controllers itself (hot-plug).
+
+With `sparrow.fast_path = true` in khc.toml and both the reaper and sparrow
+plugins running, Sparrow moves reach REAPER in-process (see fast_path.py).
+
+Usage:
+  khc-mac-mini-host
+  khc-mac-mini-host --only reaper,sparrow --codec u16
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from khc.services.common.config import get_config
+from khc.services.common.runtime import Handler, MqttRuntime, run_service
+from khc.services.mac_mini import khc_mqtt_to_kvm, khc_mqtt_to_reaper, khc_sparrow_to_mqtt
+from khc.services.mac_mini.fast_path import FastPath
+
+MQTT_CLIENT_NAME = "khc_mac_mini_host"
+PLUGIN_RESTART_DELAY = 5.0  # seconds, like the LaunchAgents' ThrottleInterval
+
+LOG = logging.getLogger("khc.host")
+
+Plugin = Callable[[MqttRuntime], Awaitable[None]]
+
+
+def build_plugins(codec: str = "json", fast_path: Optional[FastPath] = None) -> Dict[str, Plugin]:
+    """The available plugins; with `fast_path`, Sparrow and REAPER share it (see fast_path.py)."""
+    sparrow_codec = khc_sparrow_to_mqtt.PAYLOAD_CODECS[codec]
+    return {
+        "kvm": khc_mqtt_to_kvm.serve,
+        "reaper": lambda runtime: khc_mqtt_to_reaper.serve(runtime, fast_path=fast_path),
+        "sparrow": lambda runtime: khc_sparrow_to_mqtt.serve(runtime, codec=sparrow_codec, fast_path=fast_path),
+    }
+
+
+class PluginRuntime:
+    """The shared runtime as one plugin run sees it: close() drops the subscriptions it made."""
+
+    def __init__(self, runtime: MqttRuntime):
+        self._runtime = runtime
+        self._subscriptions: List[Tuple[str, Handler]] = []
+
+    def subscribe(self, topic_filter: str, handler: Handler, userdata: Any = None, qos: int = 0) -> None:
+        self._runtime.subscribe(topic_filter, handler, userdata=userdata, qos=qos)
+        self._subscriptions.append((topic_filter, handler))
+
+    def close(self) -> None:
+        for topic_filter, handler in self._subscriptions:
+            self._runtime.unsubscribe(topic_filter, handler)
+        self._subscriptions.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._runtime, name)
+
+
+async def supervise(name: str, plugin: Plugin, runtime: MqttRuntime) -> None:
+    """Run one plugin until the runtime closes, restarting it when it fails."""
+    while True:
+        scoped = PluginRuntime(runtime)
+        try:
+            await plugin(scoped)  # type: ignore[arg-type]
+        except asyncio.CancelledError:
+            raise
+        # SystemExit too: the bridges exit when their device is missing
+        except (Exception, SystemExit) as e:  # noqa: BLE001
+            LOG.error("Plugin %s failed: %s: %s", name, e.__class__.__name__, e)
+        else:
+            LOG.warning("Plugin %s stopped", name)
+        finally:
+            scoped.close()
+        LOG.info("Restarting plugin %s in %.0f s", name, PLUGIN_RESTART_DELAY)
+        await asyncio.sleep(PLUGIN_RESTART_DELAY)
+
+
+async def serve(runtime: MqttRuntime, plugins: Dict[str, Plugin]) -> None:
+    tasks = [asyncio.create_task(supervise(name, plugin, runtime), name=name) for name, plugin in plugins.items()]
+    LOG.info("Running plugins: %s", ", ".join(plugins))
+    try:
+        await runtime.wait_closed()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run the Mac mini bridges in one process")
+    p.add_argument("--only", default="kvm,reaper,sparrow",
+                   help="Comma-separated plugins to run. Default: %(default)s")
+    p.add_argument("--codec", choices=sorted(khc_sparrow_to_mqtt.PAYLOAD_CODECS), default="json",
+                   help="Sparrow payload format (see khc-sparrow-to-mqtt --codec). Default: %(default)s")
+    return p.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv or sys.argv[1:])
+    names = [n for n in args.only.split(",") if n]
+    # The fast path needs both ends in this process
+    fast_path = FastPath() if get_config().sparrow.fast_path and {"reaper", "sparrow"} <= set(names) else None
+    available = build_plugins(args.codec, fast_path)
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        sys.stderr.write(f"Unknown plugin(s): {', '.join(unknown)} (choose from {', '.join(available)})\n")
+        return 2
+    plugins = {n: available[n] for n in names}
+    if fast_path is not None:
+        LOG.info("Sparrow → REAPER fast path enabled")
+    return run_service(
+        MQTT_CLIENT_NAME,
+        lambda runtime: serve(runtime, plugins),
+        service="mac_mini",
+        local_delivery=True,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
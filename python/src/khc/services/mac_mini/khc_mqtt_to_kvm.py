@@ -3,7 +3,7 @@
 Level1Techs KVM controller: MQTT → USB serial (macOS)
 
 Listens on MQTT for a JSON payload like:
-  topic:  {MQTT_TOPIC_PREFIX}/kvm/set_source
+  topic:  {mqtt.topic_prefix}/kvm/set_source
   body:   {"source_name": "corp_mac"}
 
 and sends the corresponding ASCII command to the KVM via its USB serial port.
@@ -14,33 +14,37 @@ Deps:
 
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import sys
-from typing import Dict, Optional
+import time
+from typing import TYPE_CHECKING
 
-import paho.mqtt.client as mqtt
-import serial as pyserial
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter, histogram
+from khc.services.common.runtime import MqttRuntime, run_blocking, run_service
+from khc.services.common.tracing import TRACE_ENABLED, TraceRecorder, add_hop
 
-from khc.services.common import MQTT_TOPIC_PREFIX, create_and_connect_mqtt_client
+if TYPE_CHECKING:
+    import paho.mqtt.client as mqtt
+    import serial as pyserial
 
 # --------------------------------------------------------------------
-# Config (adjust SERIAL_PORT to match your Mac's device path)
+# Config (serial port and source → command map: [kvm] in khc.toml)
 # --------------------------------------------------------------------
 MQTT_CLIENT_NAME  = "mqtt_from_and_to_kvm"
 
-# Example from your system_profiler results; change as needed:
-SERIAL_PORT        = "/dev/tty.usbmodemB7CD849C82261"
-SERIAL_BAUD        = 9600
-SERIAL_TIMEOUT_SEC = 1
+# Per-message output goes through logging (rate-limited, see common/logs.py)
+LOG = logging.getLogger("khc.kvm")
 
-# Map human-friendly source names → KVM ASCII commands (bytes)
-# (The Level1 KVM expects CRLF line endings.)
-SOURCE_TO_CMD: Dict[str, bytes] = {
-    "personal_mac":     b"9:V=1\r\n",
-    "personal_windows": b"9:V=2\r\n",
-    "corp_mac":         b"9:V=3\r\n",
-    "corp_windows":     b"9:V=4\r\n",
-}
+TRACES = TraceRecorder("kvm")
+
+SWITCHES = counter("khc_kvm_switches_total", "KVM source switches written to serial")
+REJECTED = counter("khc_kvm_rejected_total", "kvm/set_source messages ignored (bad JSON, unknown source)")
+SERIAL_ERRORS = counter("khc_kvm_serial_errors_total", "Failed serial writes")
+SERIAL_WRITE_SECONDS = histogram("khc_kvm_serial_write_seconds", "Serial write + flush latency")
 
 # --------------------------------------------------------------------
 # Helpers
@@ -51,74 +55,80 @@ def write_kvm_command(ser: pyserial.Serial, cmd: bytes) -> None:
     ser.flush()
 
 # --------------------------------------------------------------------
-# MQTT callbacks (v2 API signatures)
+# MQTT handlers
 # --------------------------------------------------------------------
-def on_mqtt_connected(
-    client: mqtt.Client,
-    userdata_serial: pyserial.Serial,
-    connect_flags: mqtt.ConnectFlags,
-    reason_code: mqtt.ReasonCode,
-    properties: Optional[mqtt.Properties],
-):
-    print(f"[mqtt] Connected: reason={reason_code}")
-    client.subscribe(f"{MQTT_TOPIC_PREFIX}/kvm/#")
-
-def on_mqtt_message_received(
-    client: mqtt.Client,
+async def on_mqtt_message_received(
+    runtime: MqttRuntime,
     userdata_serial: pyserial.Serial,
     msg: mqtt.MQTTMessage,
 ):
     """Handle incoming MQTT messages and route to the KVM."""
-    if msg.topic != f"{MQTT_TOPIC_PREFIX}/kvm/set_source":
+    config = get_config()
+    if msg.topic != f"{config.mqtt.topic_prefix}/kvm/set_source":
         return
 
     payload = msg.payload.decode("utf-8", "ignore")
     try:
         data = json.loads(payload)
     except Exception as e:
-        print(f"[mqtt] bad JSON: {payload!r} ({e})")
+        REJECTED.inc()
+        log_kv(LOG, logging.WARNING, "bad JSON", payload=payload, error=e)
         return
 
+    trace = data.get("trace")
+    add_hop(trace, "kvm")
+
     source_name = data.get("source_name")
     if not isinstance(source_name, str):
-        print(f"[bridge] missing/invalid 'source_name' in payload: {data!r}")
+        REJECTED.inc()
+        log_kv(LOG, logging.WARNING, "missing/invalid source_name", payload=payload)
         return
 
-    cmd = SOURCE_TO_CMD.get(source_name)
+    cmd = config.kvm.source_to_cmd.get(source_name)
     if not cmd:
-        print(f"[bridge] unknown source: {source_name!r}")
+        REJECTED.inc()
+        log_kv(LOG, logging.WARNING, "unknown source", source=source_name)
         return
 
     try:
-        print(f"[kvm] switching to {source_name}")
-        write_kvm_command(userdata_serial, cmd)
+        log_kv(LOG, logging.INFO, "switching", source=source_name)
+        t0 = time.perf_counter()
+        await run_blocking(write_kvm_command, userdata_serial, cmd.encode("ascii"))
+        SERIAL_WRITE_SECONDS.observe(time.perf_counter() - t0)
     except Exception as e:
-        print(f"[kvm] serial write failed: {e}")
+        SERIAL_ERRORS.inc()
+        log_kv(LOG, logging.ERROR, "serial write failed", error=e)
+        return
+    SWITCHES.inc()
+    add_hop(trace, "kvm.serial")
+    TRACES.record(trace)
 
 # --------------------------------------------------------------------
 # Main
 # --------------------------------------------------------------------
-def main() -> int:
-    # Open serial once and pass it to MQTT callbacks via user_data
-    print(f"[serial] Opening {SERIAL_PORT} @ {SERIAL_BAUD}…")
-    ser = pyserial.Serial(SERIAL_PORT, baudrate=SERIAL_BAUD, timeout=SERIAL_TIMEOUT_SEC)
-
-    print(f"[mqtt] Connecting as {MQTT_CLIENT_NAME}")
-    client = create_and_connect_mqtt_client(MQTT_CLIENT_NAME)
-    client.on_connect = on_mqtt_connected
-    client.on_message = on_mqtt_message_received
-    client.user_data_set(ser)
-
+async def serve(runtime: MqttRuntime) -> None:
+    # Imported here so the import overlaps with the MQTT connect on startup
+    import serial as pyserial
+
+    # Open serial once and pass it to the handler as subscription userdata
+    config = get_config()
+    print(f"[serial] Opening {config.kvm.serial_port} @ {config.kvm.serial_baud}…")
+    ser = pyserial.Serial(config.kvm.serial_port, baudrate=config.kvm.serial_baud, timeout=config.kvm.serial_timeout)
+    snapshots = None
     try:
-        client.loop_forever()  # blocks
-    except KeyboardInterrupt:
-        print("\n[loop] Stopping…")
+        runtime.subscribe(f"{config.mqtt.topic_prefix}/kvm/#", on_mqtt_message_received, userdata=ser)
+        if TRACE_ENABLED:
+            snapshots = asyncio.create_task(TRACES.publish_forever(runtime))
+        await runtime.wait_closed()
     finally:
+        if snapshots is not None:
+            snapshots.cancel()
         try: ser.close()
         except Exception: pass
-        try: client.disconnect()
-        except Exception: pass
-    return 0
+
+def main() -> int:
+    print(f"[mqtt] Connecting as {MQTT_CLIENT_NAME}")
+    return run_service(MQTT_CLIENT_NAME, serve, service="kvm")
 
 if __name__ == "__main__":
     try:
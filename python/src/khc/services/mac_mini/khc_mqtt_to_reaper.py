@@ -2,43 +2,68 @@
 """
 MQTT → REAPER (OSC) bridge
 
-Listens for MQTT JSON payloads and forwards mapped parameters
-to REAPER via OSC.
+Listens for MQTT JSON payloads (or binary frames, see
+khc.services.common.codec) and forwards mapped parameters to REAPER via OSC:
+one bundle per MQTT message, so REAPER applies a param set atomically (see
+osc_bundle.py). Values go through a latest-wins queue per OSC address
+(ParamCoalescer) paced to reaper.max_rate sends/s per address: a backlog of
+set_params after a Wi-Fi blip collapses to its final state in one bundle
+instead of stepping the volume through every intermediate value.
+
+With reaper.feedback_port set it also listens for REAPER's OSC feedback and
+publishes the mixer state, retained, on {prefix}/daw/state/... (see
+reaper_feedback.py). Fades and holds for mix switches arrive on
+{prefix}/daw/ramp and run here (see ramps.py).
 
 Deps:
-  pip install paho-mqtt python-osc
+  pip install paho-mqtt
+  pip install python-osc   # reaper.feedback_port only
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import sys
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from khc.services.common.codec import decode_payload
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter
+from khc.services.common.runtime import MqttRuntime, run_service
+from khc.services.common.tracing import TRACE_ENABLED, TraceRecorder, add_hop
+from khc.services.mac_mini.osc_bundle import OscBundleClient
+from khc.services.mac_mini.ramps import BAD_RAMPS, RampEngine, apply_command, ramp_forever
+from khc.services.mac_mini.rpp_index import ADDRESSES, param_to_osc, watch_project_forever
 
-import paho.mqtt.client as mqtt
-from pythonosc.udp_client import SimpleUDPClient
+if TYPE_CHECKING:
+    import paho.mqtt.client as mqtt
 
-from khc.services.common import MQTT_TOPIC_PREFIX, create_and_connect_mqtt_client
+    from khc.services.mac_mini.fast_path import FastPath
 
 # --------------------------------------------------------------------
 # Config
 # --------------------------------------------------------------------
 MQTT_CLIENT_NAME = "mqtt_to_reaper_osc"
 
-REAPER_HOST = "127.0.0.1"
-REAPER_OSC_PORT = 1234
-
-# Map from MQTT parameter keys → REAPER OSC addresses
-PARAM_TO_OSC: Dict[str, str] = {
-    "piano_volume": "/track/2/volume",                   # piano
-    "personal_windows_volume": "/track/3/volume",        # personal win
-    "corp_mac_volume": "/track/4/volume",                # corp mac
-    "corp_windows_volume": "/track/5/volume",            # corp win
-    "personal_mac_volume": "/track/6/volume",            # mac mini
-    "master_volume_speakers": "/track/1/send/1/volume",  # submix → speakers
-    "master_volume_regular_headphones": "/track/1/send/2/volume",  # submix → headphones
-    # master_volume_inverted_headphones: no REAPER send yet (piano-seat-with-headphones mix)
-}
+# Per-message output goes through logging (rate-limited, see common/logs.py)
+LOG = logging.getLogger("khc.reaper")
+
+# REAPER host/port and the param → OSC address map: [reaper] in khc.toml
+
+TRACES = TraceRecorder("reaper")
+
+PARAM_MESSAGES = counter("khc_reaper_param_messages_total", "daw/set_params messages handled")
+BAD_PAYLOADS = counter("khc_reaper_bad_payloads_total", "MQTT payloads that failed to decode")
+BAD_VALUES = counter("khc_reaper_bad_values_total", "Params ignored for a non-float value")
+OSC_SENDS = counter("khc_reaper_osc_sends_total", "OSC messages sent to REAPER")
+OSC_BUNDLES = counter("khc_reaper_osc_bundles_total", "OSC bundles (datagrams) sent to REAPER")
+OSC_ERRORS = counter("khc_reaper_osc_errors_total", "OSC bundles the socket refused")
+COALESCED = counter("khc_reaper_values_coalesced_total", "Param values replaced by a newer one before they were sent")
 
 # --------------------------------------------------------------------
 # Helpers
@@ -46,78 +71,199 @@ PARAM_TO_OSC: Dict[str, str] = {
 def build_osc_messages(mqtt_params: Dict[str, Any]) -> List[Tuple[str, float]]:
     """Turn a dict of MQTT params into (osc_address, float_value) tuples."""
     msgs: List[Tuple[str, float]] = []
-    for key, addr in PARAM_TO_OSC.items():
+    for key, addr in param_to_osc().items():
         if key in mqtt_params:
             try:
                 msgs.append((addr, float(mqtt_params[key])))
             except (TypeError, ValueError):
-                print(f"[warn] Ignoring non-float value for {key}: {mqtt_params[key]!r}")
+                BAD_VALUES.inc()
+                log_kv(LOG, logging.WARNING, "ignoring non-float value", key=key, value=repr(mqtt_params[key]))
     return msgs
 
-def send_osc_messages(osc_messages: List[Tuple[str, float]], osc_client: SimpleUDPClient) -> None:
-    """Send OSC messages to REAPER."""
-    for address, value in osc_messages:
-        osc_client.send_message(address, value)
+def send_osc_messages(osc_messages: List[Tuple[str, float]], osc_client: OscBundleClient) -> None:
+    """Send OSC messages to REAPER as one bundle."""
+    try:
+        osc_client.send_bundle(osc_messages)
+    except OSError as e:
+        OSC_ERRORS.inc()
+        log_kv(LOG, logging.WARNING, "OSC send failed", messages=len(osc_messages), error=e)
+        return
+    OSC_BUNDLES.inc()
+    OSC_SENDS.inc(len(osc_messages))
+
+class ParamCoalescer:
+    """
+    Latest-wins OSC values per address, waiting to be sent.
+
+    put() replaces a value still queued for the same address. take_due()
+    is pure (callers pass the clock): it returns the values whose address
+    was last sent at least `min_gap` seconds ago, and how long until the
+    next one is due. An address that was quiet goes out at once, so pacing
+    only adds latency to values that would have been overwritten anyway.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[str, float] = {}    # address → latest value
+        self._last_sent: Dict[str, float] = {}  # address → monotonic time
+        self.wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, osc_messages: List[Tuple[str, float]]) -> None:
+        pending = self._pending
+        for address, value in osc_messages:
+            if address in pending:
+                COALESCED.inc()
+            pending[address] = value
+        if osc_messages:
+            self.wakeup.set()
+
+    def discard(self, addresses: List[str]) -> None:
+        """Forget queued values for `addresses` (a ramp now drives them)."""
+        for address in addresses:
+            self._pending.pop(address, None)
+
+    def take_due(self, now: float, min_gap: float) -> Tuple[List[Tuple[str, float]], Optional[float]]:
+        """(values due now, seconds until the next queued one is due or None if none remain)."""
+        due: List[Tuple[str, float]] = []
+        wait: Optional[float] = None
+        last_sent = self._last_sent
+        for address in list(self._pending):
+            left = last_sent.get(address, float("-inf")) + min_gap - now
+            if left <= 0:
+                due.append((address, self._pending.pop(address)))
+                last_sent[address] = now
+            elif wait is None or left < wait:
+                wait = left
+        return due, wait
+
+
+async def send_forever(coalescer: ParamCoalescer, osc_client: OscBundleClient) -> None:
+    """Drain `coalescer` to REAPER: everything due goes out in one bundle."""
+    while True:
+        await coalescer.wakeup.wait()
+        coalescer.wakeup.clear()
+        while True:
+            max_rate = get_config().reaper.max_rate
+            due, wait = coalescer.take_due(time.monotonic(), 1.0 / max_rate if max_rate > 0 else 0.0)
+            if due:
+                send_osc_messages(due, osc_client)
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
 
 # --------------------------------------------------------------------
-# MQTT Callbacks
+# MQTT Handlers
 # --------------------------------------------------------------------
-def on_mqtt_connected(
-    client: mqtt.Client,
-    userdata,
-    connect_flags: mqtt.ConnectFlags,
-    reason_code: mqtt.ReasonCode,
-    properties: Optional[mqtt.Properties],
-):
-    print(f"[mqtt] Connected: reason={reason_code}")
-    client.subscribe(f"{MQTT_TOPIC_PREFIX}/daw/#")
-
-def on_mqtt_message_received(
-    client: mqtt.Client,
-    userdata_osc_client: SimpleUDPClient,
+async def on_mqtt_message_received(
+    runtime: MqttRuntime,
+    userdata_osc_client: OscBundleClient,
     msg: mqtt.MQTTMessage,
+    fast_path: Optional[FastPath] = None,
+    coalescer: Optional[ParamCoalescer] = None,
+    ramps: Optional[RampEngine] = None,
 ):
-    """Decode incoming MQTT message and forward as OSC if it matches our topic."""
-    payload_decoded = msg.payload.decode("utf-8", "ignore")
+    """Decode incoming MQTT message and forward as OSC if it matches our topic.
+
+    With `fast_path`, values HA merely echoes back from the fast path are dropped.
+    With `coalescer`, values are queued for send_forever instead of sent here.
+    With `ramps`, values for held params are kept back and others end their ramp.
+    """
+    if msg.topic != f"{get_config().mqtt.topic_prefix}/daw/set_params":
+        return  # daw/routing, daw/state/...: not ours to forward
     try:
-        payload_json = json.loads(payload_decoded)
-    except Exception as e:
-        print(f"[mqtt] Bad JSON: {payload_decoded!r} ({e})")
+        payload_json = decode_payload(msg.payload)
+    except ValueError as e:
+        BAD_PAYLOADS.inc()
+        log_kv(LOG, logging.WARNING, "bad payload", payload=repr(msg.payload), error=e)
         return
 
-    if msg.topic == f"{MQTT_TOPIC_PREFIX}/daw/set_params":
-        osc_messages = build_osc_messages(payload_json)
-        if osc_messages:
-            # print(f"[bridge] Forwarding {len(osc_messages)} params to REAPER")
+    PARAM_MESSAGES.inc()
+    trace = payload_json.get("trace")
+    add_hop(trace, "reaper")
+    if fast_path is not None:
+        payload_json = fast_path.drop_echoes(payload_json)
+    osc_messages = build_osc_messages(payload_json)
+    if ramps is not None:
+        osc_messages = ramps.absorb(osc_messages)
+    if osc_messages:
+        log_kv(LOG, logging.DEBUG, "forwarding", params=len(osc_messages))
+        if coalescer is not None:
+            coalescer.put(osc_messages)
+        else:
             send_osc_messages(osc_messages, userdata_osc_client)
+    add_hop(trace, "reaper.osc")
+    TRACES.record(trace)
+
+async def on_ramp_message(
+    runtime: MqttRuntime,
+    ramps: RampEngine,
+    msg: mqtt.MQTTMessage,
+    coalescer: Optional[ParamCoalescer] = None,
+):
+    """Start the fades / holds of one {prefix}/daw/ramp command (see ramps.py)."""
+    try:
+        addresses = apply_command(ramps, json.loads(msg.payload), time.monotonic())
+    except (ValueError, TypeError) as e:
+        BAD_RAMPS.inc()
+        log_kv(LOG, logging.WARNING, "bad ramp command", payload=repr(msg.payload), error=e)
+        return
+    if coalescer is not None:
+        coalescer.discard(addresses)
 
 # --------------------------------------------------------------------
 # Main
 # --------------------------------------------------------------------
-def main() -> int:
-    # Create OSC client
-    print(f"[osc] Connecting to REAPER at {REAPER_HOST}:{REAPER_OSC_PORT}")
-    osc_client = SimpleUDPClient(REAPER_HOST, REAPER_OSC_PORT)
+async def serve(runtime: MqttRuntime, fast_path: Optional[FastPath] = None) -> None:
+    # Create OSC client; addresses are pre-encoded once here
+    config = get_config()
+    print(f"[osc] Connecting to REAPER at {config.reaper.host}:{config.reaper.osc_port}")
+    osc_client = OscBundleClient(config.reaper.host, config.reaper.osc_port, param_to_osc().values())
+    # Track names in param_to_osc: follow the project's track order
+    def retemplate(addresses: Dict[str, str]) -> None:
+        osc_client.retemplate(addresses.values())
+
+    ADDRESSES.add_listener(retemplate)
+
+    coalescer = ParamCoalescer()
+    ramps = RampEngine()
+    if fast_path is not None:
+        fast_path.osc_client = osc_client  # the fast path sends through the same socket
+        fast_path.ramps = ramps
+    handler = partial(on_mqtt_message_received, fast_path=fast_path, coalescer=coalescer, ramps=ramps)
+    # Only set_params and ramp: daw/state/... is ours, and would come straight back
+    runtime.subscribe(f"{config.mqtt.topic_prefix}/daw/set_params", handler, userdata=osc_client)
+    runtime.subscribe(f"{config.mqtt.topic_prefix}/daw/ramp", partial(on_ramp_message, coalescer=coalescer),
+                      userdata=ramps)
+    tasks = [
+        asyncio.create_task(send_forever(coalescer, osc_client)),
+        asyncio.create_task(ramp_forever(ramps, partial(send_osc_messages, osc_client=osc_client))),
+    ]
+    if config.reaper.project:
+        tasks.append(asyncio.create_task(watch_project_forever()))
+    if config.reaper.feedback_port:
+        from khc.services.mac_mini.reaper_feedback import serve_feedback
 
-    # Create MQTT client with callbacks set before connecting
+        tasks.append(asyncio.create_task(serve_feedback(runtime)))
+    if TRACE_ENABLED:
+        tasks.append(asyncio.create_task(TRACES.publish_forever(runtime)))
+    closed = asyncio.ensure_future(runtime.wait_closed())
+    try:
+        # A task that fails (the feedback port is taken, ...) fails the bridge, so it gets restarted
+        done, _ = await asyncio.wait([closed, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        closed.cancel()
+        for task in tasks:
+            task.cancel()
+        ADDRESSES.remove_listener(retemplate)
+        osc_client.close()
+
+def main() -> int:
     print(f"[mqtt] Connecting as {MQTT_CLIENT_NAME}")
-    from khc.services.common import load_mqtt_secrets
-    host, user, pwd, port = load_mqtt_secrets()
-    client = mqtt.Client(
-        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-        client_id=MQTT_CLIENT_NAME,
-    )
-    client.username_pw_set(user, pwd)
-    client.on_connect = on_mqtt_connected
-    client.on_message = on_mqtt_message_received
-    client.user_data_set(osc_client)
-    client.connect(host, port, keepalive=30)
-
-    client.loop_forever()
-    return 0
+    return run_service(MQTT_CLIENT_NAME, serve, service="reaper")
 
 if __name__ == "__main__":
-    try:
-        sys.exit(main())
-    except KeyboardInterrupt:
-        print("\n[loop] Stopping cleanly…")
+    sys.exit(main())
@@ -2,8 +2,16 @@
 """
 MIDI → MQTT bridge (batched, verbose)
 
-Listens to MIDI CCs from a controller and publishes
-coalesced JSON updates to MQTT every ~20 ms.
+Listens to MIDI CCs from one or more controllers (7-bit, 14-bit pairs or
+NRPN, mapped per device; see midi_map.py) and publishes coalesced JSON
+updates (or compact binary frames with --codec) to MQTT. Controllers are
+opened when they show up and closed when unplugged. An isolated change
+is published immediately; under a sustained sweep or a slow broker the
+batch window widens (see BatchWindow). The last value of a move is always
+flushed.
+
+With sparrow.publish_mode = "per_control" each value goes retained to its
+own {prefix}/controls/<control id> topic instead (see RetainedControls).
 
 Deps:
   pip install mido paho-mqtt
@@ -12,23 +20,64 @@ Deps:
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
 import logging
+import math
 import sys
+import threading
 import time
-from typing import Dict, List, Optional
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from khc.services.common import to_json
+from khc.services.common.codec import CONTROLS_CODEC, CONTROLS_CODEC_U16, FrameCodec
+from khc.services.common.config import SparrowConfig, get_config
+from khc.services.common.filters import FilterBank
+from khc.services.common.logs import setup_logging as setup_shared_logging
+from khc.services.common.metrics import counter, gauge, histogram
+from khc.services.common.runtime import MqttRuntime, run_blocking, run_service
+from khc.services.common.tracing import TRACE_ENABLED, stamp
+from khc.services.mac_mini.midi_map import ControlMap
 
-import mido
-import paho.mqtt.client as mqtt
+if TYPE_CHECKING:
+    import mido
 
-from khc.services.common import MQTT_TOPIC_PREFIX, create_and_connect_mqtt_client, to_json
+    from khc.services.mac_mini.fast_path import FastPath
+    from khc.services.mac_mini.midi_feedback import MidiFeedback
 
 # --------------------------------------------------------------------
-# Config (can be overridden via --device/--debug)
+# Config (device, batch window bounds, filters: [sparrow] in khc.toml;
+# --device/--debug override)
 # --------------------------------------------------------------------
 MQTT_CLIENT_NAME = "midi_to_mqtt"
-MIDI_DEVICE_NAME = "Sparrow 5x5"
-BATCH_INTERVAL   = 0.02  # seconds (~20 ms)
+MAX_PENDING      = 64    # distinct controls staged at once; new ones beyond this are dropped
+PUBLISH_TIMEOUT  = 1.0   # seconds to wait for a batch to be written before retrying
+RATE_TAU         = 0.5   # seconds; time constant of the event-rate estimate
+RTT_SMOOTHING    = 0.25  # EWMA weight of a new RTT sample
+DEVICE_POLL_INTERVAL = 2.0  # seconds between MIDI input list scans (hot-plug)
+SETTLE_POLL = 0.05          # seconds between checks for controls at rest (filters.FilterBank.settle)
+
+# --codec choices; None publishes JSON
+PAYLOAD_CODECS: Dict[str, Optional[FrameCodec]] = {
+    "json": None,
+    "f32": CONTROLS_CODEC,
+    "u16": CONTROLS_CODEC_U16,
+}
+
+MIDI_EVENTS = counter("khc_sparrow_midi_events_total", "MIDI messages read from the controller")
+MIDI_IGNORED = counter("khc_sparrow_midi_ignored_total", "MIDI messages that aren't a mapped CC (or only select an NRPN)")
+FILTERED = counter("khc_sparrow_filtered_total", "CC values held back by the control's smoothing filter")
+SETTLED = counter("khc_sparrow_settled_total", "Resting values staged for controls whose filter held the last one back")
+OVERWRITTEN = counter("khc_sparrow_values_overwritten_total", "Staged values replaced by a newer one before they were sent")
+DROPPED = counter("khc_sparrow_values_dropped_total", "Values dropped because MAX_PENDING controls were already staged")
+RETRIES = counter("khc_sparrow_publish_retries_total", "Batches requeued after the client refused them or timed out")
+BATCHES = counter("khc_sparrow_batches_published_total", "Batches published to {prefix}/controls")
+CONTROLS_PUBLISHED = counter("khc_sparrow_controls_published_total", "Control values published")
+DEDUPED = counter("khc_sparrow_values_deduped_total", "Values not re-published: the broker already retains them (per_control mode)")
+PUBLISH_SECONDS = histogram("khc_sparrow_publish_seconds", "Time from publish until the batch was written to the broker socket")
+BATCH_INTERVAL = gauge("khc_sparrow_batch_interval_seconds", "Batch window used for the last flush")
+DEVICES_OPEN = gauge("khc_sparrow_midi_devices_open", "Configured MIDI devices with an open input port")
+BROKER_RTT = gauge("khc_sparrow_broker_rtt_seconds", "Smoothed QoS 1 publish → PUBACK round trip")
 
 # --------------------------------------------------------------------
 # Logging
@@ -37,12 +86,7 @@ LOG = logging.getLogger("midi_to_mqtt")
 
 
 def setup_logging(debug: bool) -> None:
-    level = logging.DEBUG if debug else logging.INFO
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s.%(msecs)03d %(levelname)-7s %(name)s: %(message)s",
-        datefmt="%H:%M:%S",
-    )
+    setup_shared_logging(logging.DEBUG if debug else None)
     # Make mido a bit quieter unless we’re debugging
     logging.getLogger("mido").setLevel(logging.WARNING if not debug else logging.DEBUG)
 
@@ -51,6 +95,10 @@ def setup_logging(debug: bool) -> None:
 # MIDI helpers
 # --------------------------------------------------------------------
 def list_midi_inputs() -> List[str]:
+    # mido (and its rtmidi backend) is imported on first use: it costs ~100 ms
+    # and isn't needed before the MQTT connect is already under way.
+    import mido
+
     names = mido.get_input_names()
     LOG.info("Available MIDI input devices (%d):", len(names))
     for i, n in enumerate(names):
@@ -58,130 +106,481 @@ def list_midi_inputs() -> List[str]:
     return names
 
 
-def resolve_device_name(requested: str) -> Optional[str]:
-    """Try exact match, then case-insensitive 'contains' match."""
-    names = list_midi_inputs()
-    if not names:
-        return None
+def match_port(requested: str, names: Sequence[str]) -> Optional[str]:
+    """Exact match, else the one input whose name contains `requested` (case-insensitive).
 
-    # Exact match first
+    None when nothing or more than one input matches."""
     if requested in names:
-        LOG.info("Using exact match for MIDI device: %s", requested)
         return requested
-
-    # Case-insensitive partial match
     lowered = requested.lower()
     matches = [n for n in names if lowered in n.lower()]
-    if len(matches) == 1:
-        LOG.info("Using partial match for MIDI device: %s (matched '%s')", requested, matches[0])
-        return matches[0]
-    elif len(matches) > 1:
-        LOG.warning("Multiple partial matches for '%s': %s", requested, matches)
-        LOG.warning("Please choose one with --device.")
-        return None
-
-    LOG.error("No MIDI device matched '%s'.", requested)
-    return None
-
-
-def khc_control_id_from_cc(cc: int) -> str:
-    """Map MIDI CC 0–9 to logical control IDs (dial_1..5, fader_1..5)."""
-    return f"dial_{cc + 1}" if cc < 5 else f"fader_{cc - 4}"
-
-
-def normalize(value: int) -> float:
-    """Convert MIDI 0–127 integer into normalized float 0.0–1.0."""
-    return value / 127.0
+    return matches[0] if len(matches) == 1 else None
 
 
 # --------------------------------------------------------------------
-# MQTT setup & publishing
+# MQTT publishing
 # --------------------------------------------------------------------
-def create_mqtt_client() -> mqtt.Client:
-    """Create and connect an MQTT client; run network loop in a background thread."""
-    LOG.info("Connecting to MQTT as client '%s'…", MQTT_CLIENT_NAME)
-    client = create_and_connect_mqtt_client(MQTT_CLIENT_NAME)
-    client.loop_start()
-    LOG.info("MQTT loop started.")
-    return client
-
-
-def publish_controls(client: mqtt.Client, pending: Dict[str, float]) -> None:
-    """Publish all changed control values as one compact JSON payload."""
-    if not pending:
-        return
-    topic = f"{MQTT_TOPIC_PREFIX}/controls"
-    payload = to_json(pending)
+def encode_controls(pending: Dict[str, float], codec: Optional[FrameCodec] = None) -> Tuple[str, Any]:
+    """Return (topic, payload) for one batch: compact JSON or a binary frame."""
+    topic = f"{get_config().mqtt.topic_prefix}/controls"
+    if codec is not None:
+        return topic, codec.encode(pending)  # binary frames carry no trace
+    data: Dict[str, Any] = stamp(dict(pending), "sparrow") if TRACE_ENABLED else pending
+    return topic, to_json(data)
+
+
+async def publish_controls(runtime: MqttRuntime, pending: Dict[str, float], codec: Optional[FrameCodec] = None) -> bool:
+    """Publish all changed control values in one payload; True once the client has sent it."""
+    topic, payload = encode_controls(pending, codec)
     LOG.debug("Publishing %d control(s) → %s", len(pending), topic)
-    # Show a single-line preview to help debug downstream subscribers:
-    # LOG.info("→ MQTT %s %s", topic, payload)
-
-    result = client.publish(topic, payload, qos=0, retain=False)
-    # Some clients return a tuple (rc, mid); paho 2.x returns MQTTMessageInfo
-    try:
-        result.wait_for_publish(timeout=1.0)
-    except Exception:  # noqa: BLE001
-        pass
+    t0 = time.perf_counter()
+    # Awaits the write without blocking the loop, so at most one batch is in
+    # flight; values staged meanwhile coalesce in the batcher.
+    sent = await runtime.publish_and_wait(topic, payload, qos=0, retain=False, timeout=PUBLISH_TIMEOUT)
+    if sent:
+        PUBLISH_SECONDS.observe(time.perf_counter() - t0)
+        BATCHES.inc()
+        CONTROLS_PUBLISHED.inc(len(pending))
+    return sent
+
+
+def control_class(control_id: str) -> str:
+    """`fader_3` → `fader`: the key of sparrow.control_qos."""
+    return control_id.rstrip("0123456789").rstrip("_") or control_id
+
+
+class RetainedControls:
+    """
+    Per-control publish mode: what the broker retains on each
+    {prefix}/controls/<control id>, so an unchanged value is never re-sent.
+
+    A value staged several times within one batch window can end where the
+    last publish left it (a knob wiggled and put back); in blob mode it would
+    go out again, here it costs nothing. The cache is updated only once a
+    publish went through, so a failed one is retried.
+    """
+
+    def __init__(self) -> None:
+        self._retained: Dict[str, bytes] = {}  # topic → payload the broker holds
+
+    def messages(self, pending: Dict[str, float]) -> List[Tuple[str, str, bytes, int]]:
+        """(control id, topic, payload, QoS) for each value in `pending` that differs from the retained one."""
+        config = get_config()
+        prefix = config.mqtt.topic_prefix
+        control_qos = config.sparrow.control_qos
+        out = []
+        for control_id, value in pending.items():
+            topic = f"{prefix}/controls/{control_id}"
+            payload = b"%.6g" % value
+            if self._retained.get(topic) == payload:
+                DEDUPED.inc()
+                continue
+            out.append((control_id, topic, payload, control_qos.get(control_class(control_id), 0)))
+        return out
+
+    def mark_sent(self, topic: str, payload: bytes) -> None:
+        self._retained[topic] = payload
+
+    def __len__(self) -> int:
+        return len(self._retained)
+
+
+async def publish_retained(runtime: MqttRuntime, pending: Dict[str, float],
+                           retained: RetainedControls) -> Dict[str, float]:
+    """Publish each changed value retained on its own topic; returns the values that weren't sent."""
+    messages = retained.messages(pending)
+    if not messages:
+        return {}
+    LOG.debug("Publishing %d control(s) → %s/controls/*", len(messages), get_config().mqtt.topic_prefix)
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(
+        runtime.publish_and_wait(topic, payload, qos=qos, retain=True, timeout=PUBLISH_TIMEOUT)
+        for _, topic, payload, qos in messages
+    ))
+    unsent: Dict[str, float] = {}
+    for (control_id, topic, payload, _), ok in zip(messages, results):
+        if ok:
+            retained.mark_sent(topic, payload)
+        else:
+            unsent[control_id] = pending[control_id]
+    if len(unsent) < len(messages):
+        PUBLISH_SECONDS.observe(time.perf_counter() - t0)
+        BATCHES.inc()
+        CONTROLS_PUBLISHED.inc(len(messages) - len(unsent))
+    return unsent
 
 
 # --------------------------------------------------------------------
 # MIDI processing
 # --------------------------------------------------------------------
-def run_midi_loop(client: mqtt.Client, device_name: str) -> None:
-    """Listen for MIDI CC messages and flush them to MQTT in batches."""
-    resolved = resolve_device_name(device_name)
-    if not resolved:
-        LOG.error("MIDI device '%s' not found. Exiting.", device_name)
-        sys.exit(1)
-
-    try:
-        port = mido.open_input(resolved)
-    except IOError as e:
-        LOG.error("Failed to open MIDI input '%s': %s", resolved, e)
-        sys.exit(1)
-
-
-    pending: Dict[str, float] = {}
-    last_published: Dict[str, float] = {}
-    last_flush = time.monotonic()
-    last_msg_time = time.monotonic()
-    DEADBAND = 2.0 / 127.0  # ignore changes smaller than ~2 MIDI steps
-
-    LOG.info("Listening on MIDI input: '%s'", resolved)
-    LOG.info("Batch interval: %.0f ms", BATCH_INTERVAL * 1000.0)
-    LOG.info("Press Ctrl+C to stop.\n")
-
-    with port:
-        for msg in port:
-            LOG.debug("MIDI raw: %s", msg)
-
-            if msg.type != "control_change":
-                LOG.debug("Ignoring non-CC message: %s", msg.type)
+class BatchWindow:
+    """
+    Adaptive batch interval for the flush task.
+
+    Pure: callers pass the clock, so khc.bench.batching can drive it with
+    simulated time. The window is
+
+        min + (max - min) × min(1, event rate / busy_rate)
+
+    raised to rtt_factor × the smoothed broker RTT and clamped to
+    [min_batch_interval, max_batch_interval]. The event rate decays
+    exponentially (RATE_TAU), so an isolated change after a quiet spell
+    finds the last flush long past and goes out at once, while a five-fader
+    sweep or a slow broker opens the window and cuts the publish rate.
+    """
+
+    def __init__(self, config: Optional[SparrowConfig] = None):
+        self._config = config  # None: follow get_config() (reloads)
+        self._rate = 0.0       # events/s at _last_event
+        self._last_event: Optional[float] = None
+        self.rtt = 0.0         # smoothed seconds
+
+    @property
+    def config(self) -> SparrowConfig:
+        return self._config or get_config().sparrow
+
+    def rate(self, now: float) -> float:
+        if self._last_event is None:
+            return 0.0
+        return self._rate * math.exp(-(now - self._last_event) / RATE_TAU)
+
+    def on_event(self, now: float) -> None:
+        self._rate = self.rate(now) + 1.0 / RATE_TAU
+        self._last_event = now
+
+    def on_rtt(self, seconds: float) -> None:
+        self.rtt = seconds if not self.rtt else self.rtt + RTT_SMOOTHING * (seconds - self.rtt)
+
+    def interval(self, now: float) -> float:
+        config = self.config
+        lo = config.min_batch_interval
+        hi = max(lo, config.max_batch_interval)
+        load = min(1.0, self.rate(now) / config.busy_rate) if config.busy_rate > 0 else 1.0
+        window = max(lo + (hi - lo) * load, config.rtt_factor * self.rtt)
+        return min(hi, window)
+
+
+class ControlBatcher:
+    """
+    Per-control filters + latest-value-wins outbound buffer between the
+    MIDI callback thread and the flush task.
+
+    stage() runs in mido's callback thread for every message and never
+    blocks on the network: a newer value for a control overwrites the
+    staged one, and at most `max_pending` controls are held. take() hands
+    the staged values to the flush task, which calls restage() if they
+    couldn't be sent. `on_staged` is called when the
+    buffer goes from empty to non-empty, i.e. once per batch, not per message.
+    Every staged value feeds the event rate of `window`.
+    """
+
+    def __init__(self, on_staged: Callable[[], None] = lambda: None, max_pending: int = MAX_PENDING,
+                 window: Optional[BatchWindow] = None):
+        self.on_staged = on_staged
+        self.max_pending = max_pending
+        self.window = window or BatchWindow()
+        self._pending: Dict[str, float] = {}
+        self._touched: Dict[str, float] = {}  # control id → monotonic time of its last CC
+        self._lock = threading.Lock()
+        self._config: Optional[SparrowConfig] = None
+        self._maps: Dict[str, ControlMap] = {}
+        self._default_device = ""
+        self._filters: FilterBank
+        self._reconfigure()
+
+    def _reconfigure(self) -> None:
+        # Rebuilt (MSB/filter state reset) when a config reload changes [sparrow]
+        config = get_config().sparrow
+        if config is not self._config:
+            self._maps = {name: ControlMap.from_config(device) for name, device in config.devices.items()}
+            self._default_device = next(iter(config.devices))
+            self._filters = FilterBank(config.filter, config.filters)
+            self._config = config
+
+    def stage(self, msg: mido.Message, device: Optional[str] = None) -> None:
+        """Filter and stage one message from `device` (default: the first configured one)."""
+        LOG.debug("MIDI raw: %s", msg)
+        MIDI_EVENTS.inc()
+
+        if msg.type != "control_change":
+            MIDI_IGNORED.inc()
+            LOG.debug("Ignoring non-CC message: %s", msg.type)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._reconfigure()
+            control_map = self._maps.get(device or self._default_device)
+            mapped = control_map.feed(msg.control, msg.value) if control_map else None
+            if mapped is None:
+                MIDI_IGNORED.inc()
+                return
+            control_id, value_norm = mapped
+            self._touched[control_id] = now
+            value_norm = self._filters.update(control_id, value_norm, now)
+            if value_norm is None:
+                FILTERED.inc()
+                return
+            self.window.on_event(now)
+            was_empty = not self._pending
+            if control_id in self._pending:
+                OVERWRITTEN.inc()
+            elif len(self._pending) >= self.max_pending:
+                DROPPED.inc()
+                return
+            self._pending[control_id] = value_norm
+        LOG.debug("Staged %s = %.3f (CC%d %d)", control_id, value_norm, msg.control, msg.value)
+        if was_empty:
+            self.on_staged()
+
+    def settle(self, now: float) -> List[str]:
+        """Stage the resting value of controls whose filter held their last position back; return their ids."""
+        staged: List[str] = []
+        with self._lock:
+            self._reconfigure()
+            values = self._filters.settle(now)
+            if not values:
+                return staged
+            was_empty = not self._pending
+            for control_id, value in values.items():
+                SETTLED.inc()
+                if control_id not in self._pending and len(self._pending) >= self.max_pending:
+                    DROPPED.inc()
+                    continue
+                self._pending[control_id] = value
+                staged.append(control_id)
+        if was_empty:
+            self.on_staged()
+        return staged
+
+    def touched(self, control_id: str) -> float:
+        """Monotonic time the user last moved `control_id` (0.0 if never)."""
+        return self._touched.get(control_id, 0.0)
+
+    def take(self) -> Dict[str, float]:
+        """Return and clear the staged values."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def restage(self, batch: Dict[str, float]) -> None:
+        """Put back an unsent batch; values staged since take() win."""
+        with self._lock:
+            for control_id, value in batch.items():
+                self._pending.setdefault(control_id, value)
+
+
+async def flush_forever(runtime: MqttRuntime, batcher: ControlBatcher, staged: asyncio.Event,
+                        codec: Optional[FrameCodec] = None, fast_path: Optional[FastPath] = None) -> None:
+    """
+    Publish staged values at most once per batch window (batcher.window).
+
+    The flush clock is independent of MIDI arrival: a value staged right
+    after a flush waits at most one window, and the last value of a
+    fader move is always published (trailing edge) instead of waiting for
+    the next touch. While the broker is away, values keep coalescing in the
+    batcher and the latest positions go out on reconnect.
+
+    With `fast_path`, each batch goes to REAPER in-process first, broker or
+    not; the MQTT publish then only keeps HA's display in sync. Values it
+    couldn't publish wait in a backlog (latest wins) rather than in the
+    batcher, so REAPER never gets them twice.
+
+    sparrow.publish_mode is read per flush, so a config reload switches
+    between one blob and retained per-control topics (RetainedControls).
+    """
+    last_flush = 0.0
+    retained = RetainedControls()
+    backlog: Dict[str, float] = {}  # fast path: forwarded to REAPER, not yet published
+    while True:
+        if backlog and not staged.is_set():
+            # Only MQTT is behind: go on new values or on reconnect, whichever comes first
+            waits = [asyncio.ensure_future(staged.wait()), asyncio.ensure_future(runtime.wait_connected())]
+            try:
+                await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for w in waits:
+                    w.cancel()
+        else:
+            await staged.wait()
+        now = time.monotonic()
+        interval = batcher.window.interval(now)
+        BATCH_INTERVAL.set(interval)
+        delay = last_flush + interval - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if fast_path is None:
+            await runtime.wait_connected()
+        staged.clear()
+        batch = batcher.take()
+        last_flush = time.monotonic()
+        if fast_path is not None:
+            if batch:
+                fast_path.forward(batch)
+                backlog.update(batch)
+            if not runtime.connected:
                 continue
-            if not (0 <= msg.control <= 9):
-                LOG.debug("Ignoring CC outside 0–9: CC%d val=%s", msg.control, getattr(msg, "value", None))
+            batch, backlog = backlog, {}
+        if not batch:
+            continue
+        if get_config().sparrow.publish_mode == "per_control":
+            unsent = await publish_retained(runtime, batch, retained)
+        else:
+            unsent = {} if await publish_controls(runtime, batch, codec) else batch
+        if unsent:
+            RETRIES.inc()
+            if fast_path is not None:
+                backlog = dict(unsent)
+            else:
+                batcher.restage(unsent)
+                staged.set()
+
+
+async def settle_forever(batcher: ControlBatcher) -> None:
+    """Publish where controls came to rest when their filter held it back (see common/filters.py)."""
+    while True:
+        await asyncio.sleep(SETTLE_POLL)
+        batcher.settle(time.monotonic())
+
+
+def rtt_probe_topic(client_id: str) -> str:
+    # Per client, so two bridges (or the host and a standalone bridge) never share one
+    return f"{get_config().mqtt.topic_prefix}/rtt_probe/{client_id}"
+
+
+async def probe_rtt_forever(runtime: MqttRuntime, window: BatchWindow) -> None:
+    """Feed the broker round trip (QoS 1 publish → PUBACK) into `window`, every sparrow.rtt_probe_interval."""
+    while True:
+        await runtime.wait_connected()
+        t0 = time.perf_counter()
+        acked = await runtime.publish_and_wait(rtt_probe_topic(runtime.client_id), b"", qos=1,
+                                               timeout=PUBLISH_TIMEOUT)
+        # A lost probe counts as the full timeout: the window opens all the way
+        window.on_rtt(time.perf_counter() - t0 if acked else PUBLISH_TIMEOUT)
+        BROKER_RTT.set(window.rtt)
+        await asyncio.sleep(get_config().sparrow.rtt_probe_interval)
+
+
+class MidiInputs:
+    """
+    The open input port of each configured device, kept in step with the
+    system's MIDI inputs.
+
+    sync() is given the current input names; when neither they nor the
+    config changed since the last call it returns at once. Otherwise ports
+    that disappeared (or whose device was removed from the config) are
+    closed and configured devices that showed up are opened, each with a
+    callback that stages into the shared batcher under its device name.
+    A port that is listed but fails to open is retried on the next call.
+    """
+
+    def __init__(self, batcher: ControlBatcher, port_override: Optional[str] = None):
+        self.batcher = batcher
+        self.port_override = port_override
+        self.ports: Dict[str, mido.ports.BaseInput] = {}  # device name → open port
+        self._seen: Optional[Tuple[Tuple[str, ...], SparrowConfig]] = None
+
+    def wanted(self, config: SparrowConfig) -> Dict[str, str]:
+        """Device name → port name pattern."""
+        if self.port_override:
+            return {next(iter(config.devices)): self.port_override}
+        return {name: device.port for name, device in config.devices.items()}
+
+    def sync(self, names: Sequence[str]) -> None:
+        config = get_config().sparrow
+        seen = (tuple(names), config)
+        if seen == self._seen:
+            return
+        wanted = self.wanted(config)
+        failed = False
+
+        for device, port in list(self.ports.items()):
+            if port.name not in names or device not in wanted:
+                LOG.warning("MIDI device %s (%s) is gone; closing it", device, port.name)
+                self._close(device)
+
+        for device, pattern in wanted.items():
+            if device in self.ports:
                 continue
-
-            control_id = khc_control_id_from_cc(msg.control)
-            value_norm = normalize(msg.value)
-            prev = last_published.get(control_id)
-            if prev is not None and abs(value_norm - prev) < DEADBAND:
+            resolved = match_port(pattern, names)
+            if resolved is None:
+                LOG.warning("Waiting for MIDI device %s (%r)", device, pattern)
                 continue
-            pending[control_id] = value_norm
-            LOG.debug("Staged %s = %.3f (CC%d %d)", control_id, value_norm, msg.control, msg.value)
-            last_msg_time = time.monotonic()
-
-            now = time.monotonic()
-            if now - last_flush >= BATCH_INTERVAL:
-                publish_controls(client, pending)
-                last_published.update(pending)
-                pending.clear()
-                last_flush = now
-
-            # Lightweight heartbeat if nothing arrived for a while
-            if now - last_msg_time > 5.0:
-                # LOG.info("No MIDI activity in the last %.1fs. Still listening…", now - last_msg_time)
-                last_msg_time = now  # avoid spamming
+            failed = not self._open(device, resolved) or failed
+        # Remember what we synced to only if nothing needs another try
+        self._seen = None if failed else seen
+        DEVICES_OPEN.set(len(self.ports))
+
+    def _open(self, device: str, port_name: str) -> bool:
+        import mido
+
+        try:
+            # mido calls the callback from its own thread for every incoming message
+            self.ports[device] = mido.open_input(port_name, callback=partial(self.batcher.stage, device=device))
+        except IOError as e:
+            LOG.error("Failed to open MIDI input '%s': %s", port_name, e)
+            return False
+        LOG.info("Listening on MIDI input: '%s' as %s", port_name, device)
+        return True
+
+    def _close(self, device: str) -> None:
+        port = self.ports.pop(device)
+        try:
+            port.close()
+        except Exception as e:  # noqa: BLE001 — rtmidi after an unplug
+            LOG.debug("Closing %s: %s", port.name, e)
+
+    def close_all(self) -> None:
+        for device in list(self.ports):
+            self._close(device)
+        DEVICES_OPEN.set(0)
+
+
+async def watch_devices_forever(inputs: MidiInputs, feedback: Optional[MidiFeedback] = None) -> None:
+    """Poll the MIDI input (and, with `feedback`, output) lists for hot-plugged controllers."""
+    import mido
+
+    while True:
+        # rtmidi rescans the system ports; keep that off the event loop
+        inputs.sync(await run_blocking(mido.get_input_names))
+        if feedback is not None:
+            feedback.sync(await run_blocking(mido.get_output_names))
+        await asyncio.sleep(DEVICE_POLL_INTERVAL)
+
+
+async def serve(runtime: MqttRuntime, device_name: Optional[str] = None, codec: Optional[FrameCodec] = None,
+                fast_path: Optional[FastPath] = None) -> None:
+    loop = asyncio.get_running_loop()
+    staged = asyncio.Event()
+    batcher = ControlBatcher(on_staged=lambda: loop.call_soon_threadsafe(staged.set))
+    inputs = MidiInputs(batcher, port_override=device_name)
+
+    config = get_config().sparrow
+    LOG.info("Batch window: %.0f–%.0f ms",
+             config.min_batch_interval * 1000.0, config.max_batch_interval * 1000.0)
+    feedback = None
+    if any(device.feedback for device in config.devices.values()):
+        from khc.services.mac_mini.midi_feedback import MidiFeedback
+
+        feedback = MidiFeedback(touched=batcher.touched)
+        feedback.subscribe(runtime)
+    tasks = [
+        asyncio.create_task(probe_rtt_forever(runtime, batcher.window)),
+        asyncio.create_task(settle_forever(batcher)),
+        asyncio.create_task(watch_devices_forever(inputs, feedback)),
+    ]
+    if feedback is not None:
+        tasks.append(asyncio.create_task(feedback.send_forever()))
+    try:
+        if fast_path is not None:
+            fast_path.subscribe(runtime)
+        await flush_forever(runtime, batcher, staged, codec, fast_path)
+    finally:
+        for task in tasks:
+            task.cancel()
+        inputs.close_all()
+        if feedback is not None:
+            feedback.close_all()
 
 
 # --------------------------------------------------------------------
@@ -189,10 +588,15 @@ def run_midi_loop(client: mqtt.Client, device_name: str) -> None:
 # --------------------------------------------------------------------
 def parse_args(argv: List[str]) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="MIDI → MQTT bridge (batched)")
-    p.add_argument("--device", "-d", default=MIDI_DEVICE_NAME,
-                   help="MIDI input device name (exact or partial match). Default: %(default)s")
+    p.add_argument("--device", "-d", default=None,
+                   help="Open only this MIDI input (exact or partial match), mapped like the first "
+                        "of [sparrow.devices] in khc.toml. Default: every configured device (%s)"
+                        % ", ".join(d.port for d in get_config().sparrow.devices.values()))
     p.add_argument("--list", action="store_true",
                    help="List available MIDI input devices and exit.")
+    p.add_argument("--codec", choices=sorted(PAYLOAD_CODECS), default="json",
+                   help="Payload format for {prefix}/controls in blob mode: JSON or a binary frame "
+                        "with float32/uint16 values. Default: %(default)s")
     p.add_argument("--debug", action="store_true",
                    help="Enable verbose debug logging.")
     return p.parse_args(argv)
@@ -209,16 +613,10 @@ def main(argv: List[str] | None = None) -> int:
             return 1
         return 0
 
-    client = create_mqtt_client()
-    try:
-        run_midi_loop(client, args.device)
-    except KeyboardInterrupt:
-        LOG.info("Stopping cleanly (Ctrl+C)…")
-    finally:
-        LOG.info("Stopping MQTT loop and disconnecting…")
-        client.loop_stop()
-        client.disconnect()
-    return 0
+    LOG.info("Connecting to MQTT as client '%s'…", MQTT_CLIENT_NAME)
+    codec = PAYLOAD_CODECS[args.codec]
+    return run_service(MQTT_CLIENT_NAME, lambda runtime: serve(runtime, args.device, codec), service="sparrow",
+                       log_level=logging.DEBUG if args.debug else None)
 
 
 if __name__ == "__main__":
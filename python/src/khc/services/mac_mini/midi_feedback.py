@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+MIDI feedback: DAW state → controller LED rings / motor faders
+
+When HA changes a volume (Stream Deck, a soundmix switch), the controller
+would keep showing the old position and the next touch would jump the
+level. For every device with `feedback = true` under
+[sparrow.devices.<name>], the Sparrow bridge opens its MIDI output too and
+mirrors the DAW params HA publishes on {prefix}/daw/set_params:
+
+  param → dial (HA's routing table on {prefix}/daw/routing)
+        → control(s) (sparrow.control_to_dial) → CC messages (the device's map)
+
+Updates are diffed against what was last sent per control, so an unchanged
+value costs nothing, and queued latest-wins per control: a mix switch that
+resets eight params can't flood the port, and a value superseded before its
+turn is never sent. A control's messages go out as one group — NRPN select +
+data entry, 14-bit MSB + LSB — since NRPN controls share CC 99/98/6/38 and a
+lone MSB resets the LSB. A sender task paces the queue to
+sparrow.feedback_rate messages/s per device. Controls the user touched in the last TOUCH_HOLD
+seconds are skipped, so HA's delayed echo of a move can't yank the LEDs
+back while the knob is still turning; nothing is mirrored while HA marks
+the routing as muted (a mix switch in progress).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from khc.services.common.codec import decode_payload
+from khc.services.common.config import SparrowConfig, get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter, gauge
+from khc.services.mac_mini.fast_path import parse_routes, routing_topic
+from khc.services.mac_mini.midi_map import ControlMap
+
+if TYPE_CHECKING:
+    import mido
+    import paho.mqtt.client as mqtt
+
+    from khc.services.common.runtime import MqttRuntime
+
+LOG = logging.getLogger("khc.midi_feedback")
+
+TOUCH_HOLD = 1.0  # seconds after a local touch during which feedback leaves a control alone
+
+FEEDBACK_SENT = counter("khc_sparrow_feedback_sent_total", "Feedback CC messages sent to controllers")
+FEEDBACK_UNCHANGED = counter("khc_sparrow_feedback_unchanged_total", "Feedback skipped: device already shows the value")
+FEEDBACK_SUPERSEDED = counter("khc_sparrow_feedback_superseded_total", "Queued feedback replaced by a newer value before sending")
+FEEDBACK_TOUCHED = counter("khc_sparrow_feedback_touched_total", "Feedback skipped for a control the user is moving")
+FEEDBACK_QUEUED = gauge("khc_sparrow_feedback_queued", "Controls waiting for feedback to be sent")
+
+Key = Tuple[str, str]                   # (device, control id)
+Group = Tuple[Tuple[int, int], ...]     # (CC, value) messages that set one control
+
+
+class MidiFeedback:
+    def __init__(self, touched: Callable[[str], float] = lambda control_id: 0.0):
+        self.touched = touched                    # control id → monotonic time of last local input
+        self.outputs: Dict[str, mido.ports.BaseOutput] = {}  # device → open output port
+        self.routes: Dict[str, List[str]] = {}    # dial → params
+        self.muted = True                         # until HA's routing table arrives
+        self._last_sent: Dict[Key, Group] = {}
+        self._queue: "OrderedDict[Key, Group]" = OrderedDict()
+        self._queued = asyncio.Event()
+        self._seen: Optional[Tuple[Tuple[str, ...], SparrowConfig]] = None
+        self._config: Optional[SparrowConfig] = None
+        self._maps: Dict[str, ControlMap] = {}
+        FEEDBACK_QUEUED.set_function(lambda: len(self._queue))
+
+    def _reconfigure(self) -> SparrowConfig:
+        config = get_config().sparrow
+        if config is not self._config:
+            self._maps = {
+                name: ControlMap.from_config(device) for name, device in config.devices.items() if device.feedback
+            }
+            self._config = config
+        return config
+
+    # -- ports (hot-plug, like MidiInputs) ---------------------------------
+    def sync(self, names: Sequence[str]) -> None:
+        import mido
+
+        config = self._reconfigure()
+        seen = (tuple(names), config)
+        if seen == self._seen:
+            return
+        failed = False
+        from khc.services.mac_mini.khc_sparrow_to_mqtt import match_port
+
+        for device, port in list(self.outputs.items()):
+            if port.name not in names or device not in self._maps:
+                self._close(device)
+        for device in self._maps:
+            if device in self.outputs:
+                continue
+            resolved = match_port(config.devices[device].port, names)
+            if resolved is None:
+                continue
+            try:
+                self.outputs[device] = mido.open_output(resolved)
+            except IOError as e:
+                LOG.error("Failed to open MIDI output '%s': %s", resolved, e)
+                failed = True  # retried on the next sync
+                continue
+            # A fresh port: we don't know what the device shows any more
+            self._forget(device)
+            LOG.info("Sending feedback to MIDI output: '%s' as %s", resolved, device)
+        self._seen = None if failed else seen
+
+    def _forget(self, device: str) -> None:
+        for key in [k for k in self._last_sent if k[0] == device]:
+            del self._last_sent[key]
+
+    def _close(self, device: str) -> None:
+        port = self.outputs.pop(device)
+        self._forget(device)
+        try:
+            port.close()
+        except Exception as e:  # noqa: BLE001 — rtmidi after an unplug
+            LOG.debug("Closing %s: %s", port.name, e)
+
+    def close_all(self) -> None:
+        for device in list(self.outputs):
+            self._close(device)
+
+    # -- DAW state → queue -------------------------------------------------
+    async def on_routing(self, runtime: MqttRuntime, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        try:
+            table = json.loads(msg.payload)
+            self.routes = parse_routes(table)
+            self.muted = bool(table.get("muted", False))
+        except (ValueError, TypeError, AttributeError) as e:
+            log_kv(LOG, logging.WARNING, "bad routing table", payload=repr(msg.payload[:200]), error=e)
+
+    async def on_params(self, runtime: MqttRuntime, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        if self.muted:
+            return
+        try:
+            params = decode_payload(msg.payload)
+        except ValueError:
+            return  # the REAPER bridge counts and logs bad payloads
+        self.update(params, time.monotonic())
+
+    def update(self, params: Dict[str, Any], now: float) -> None:
+        """Queue the CC groups that mirror `params` (param → 0–1) on every feedback device."""
+        config = self._reconfigure()
+        dial_of_param = {p: dial for dial, ps in self.routes.items() for p in ps}
+        for param, value in params.items():
+            dial = dial_of_param.get(param)
+            if dial is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            for control_id, control_dial in config.control_to_dial.items():
+                if control_dial != dial:
+                    continue
+                if now - self.touched(control_id) < TOUCH_HOLD:
+                    FEEDBACK_TOUCHED.inc()
+                    continue
+                for device, control_map in self._maps.items():
+                    group = tuple(control_map.encode(control_id, value))
+                    if group:
+                        self._enqueue((device, control_id), group)
+
+    def _enqueue(self, key: Key, group: Group) -> None:
+        if key in self._queue:
+            FEEDBACK_SUPERSEDED.inc()
+        elif self._last_sent.get(key) == group:
+            FEEDBACK_UNCHANGED.inc()
+            return
+        self._queue[key] = group
+        self._queued.set()
+
+    # -- queue → ports -----------------------------------------------------
+    async def send_forever(self) -> None:
+        import mido
+
+        while True:
+            await self._queued.wait()
+            self._queued.clear()
+            while self._queue:
+                key, group = self._queue.popitem(last=False)
+                port = self.outputs.get(key[0])
+                if port is None or self._last_sent.get(key) == group:
+                    continue
+                try:
+                    # The whole group, unchanged parts included: see the module docstring
+                    for cc, raw in group:
+                        port.send(mido.Message("control_change", control=cc, value=raw))
+                except Exception as e:  # noqa: BLE001 — port gone mid-send; the poll closes it
+                    LOG.debug("Feedback to %s failed: %s", key[0], e)
+                    self._last_sent.pop(key, None)  # part of the group may have gone out
+                    continue
+                self._last_sent[key] = group
+                FEEDBACK_SENT.inc(len(group))
+                # Pace per message; with several devices this is conservative
+                await asyncio.sleep(len(group) / max(1.0, get_config().sparrow.feedback_rate))
+
+    def subscribe(self, runtime: MqttRuntime) -> None:
+        runtime.subscribe(routing_topic(), self.on_routing)
+        runtime.subscribe(f"{get_config().mqtt.topic_prefix}/daw/set_params", self.on_params)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+midi_map.py — MIDI CC / 14-bit CC / NRPN → (control id, 0–1 value)
+
+All lookups are precomputed when the map is built from the device's
+[sparrow.devices.<name>] table in khc.toml, so the per-message path is
+list indexing only — no string formatting, no division:
+
+  - SLOTS: CC number → (kind, control id), a 128-entry list
+  - NORM_7 / NORM_14: raw value → normalized float (array('d') of 128 /
+    16384 entries)
+
+There is no raw → dB table: values stay fader positions end to end. HA's
+dials are 0–1, and REAPER's /track/N/volume takes a normalized position and
+applies its own fader taper, so 14 bits of position are 14 bits of taper.
+A dB value would only have to be turned back into a position downstream.
+
+Kinds of control:
+  cc_map     plain 7-bit CC (the Sparrow 5x5 sends CC 0–9)
+  cc14_map   14-bit pair: MSB on CC n (0–31), LSB on CC n+32. Per the MIDI
+             spec a new MSB implies LSB 0, so the MSB is published at once
+             and the LSB that usually follows refines it; the batcher
+             coalesces the two.
+  nrpn_map   NRPN parameter (CC 99/98 select it, data entry on CC 6/38,
+             14-bit). With an NRPN map, CC 6/38/98/99 are reserved for NRPN.
+
+The map keeps the MSB / NRPN selection state of one input port; use one
+instance per device. encode() goes the other way, for MIDI feedback.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from khc.services.common.config import MidiDeviceConfig
+
+NORM_7 = array("d", (v / 127.0 for v in range(128)))
+NORM_14 = array("d", (v / 16383.0 for v in range(16384)))
+
+# Slot kinds
+CC7, CC14_MSB, CC14_LSB, NRPN_MSB, NRPN_LSB, DATA_MSB, DATA_LSB = range(7)
+
+CC_DATA_MSB, CC_DATA_LSB, CC_NRPN_LSB, CC_NRPN_MSB = 6, 38, 98, 99
+NO_PARAM = -1
+
+Slot = Tuple[int, str]
+
+
+class ControlMap:
+    def __init__(self, cc_map: Dict[int, str], cc14_map: Dict[int, str], nrpn_map: Dict[int, str]):
+        self.slots: List[Optional[Slot]] = [None] * 128
+        # control id → (kind, CC or NRPN number), for feedback to the device
+        self.outputs: Dict[str, Tuple[int, int]] = {}
+        for cc, control_id in cc_map.items():
+            self.slots[cc] = (CC7, control_id)
+            self.outputs[control_id] = (CC7, cc)
+        for cc, control_id in cc14_map.items():
+            self.slots[cc] = (CC14_MSB, control_id)
+            self.slots[cc + 32] = (CC14_LSB, control_id)
+            self.outputs[control_id] = (CC14_MSB, cc)
+        self.nrpn: Dict[int, str] = dict(nrpn_map)
+        for param, control_id in nrpn_map.items():
+            self.outputs[control_id] = (NRPN_MSB, param)
+        if self.nrpn:
+            self.slots[CC_NRPN_MSB] = (NRPN_MSB, "")
+            self.slots[CC_NRPN_LSB] = (NRPN_LSB, "")
+            self.slots[CC_DATA_MSB] = (DATA_MSB, "")
+            self.slots[CC_DATA_LSB] = (DATA_LSB, "")
+        # 14-bit state: last MSB per pair (by MSB CC number) and per NRPN param
+        self._msb: List[int] = [0] * 32
+        self._param_msb = 0
+        self._param = NO_PARAM
+        self._data_msb: Dict[int, int] = {}
+
+    @classmethod
+    def from_config(cls, config: MidiDeviceConfig) -> "ControlMap":
+        return cls(
+            {int(k): v for k, v in config.cc_map.items()},
+            {int(k): v for k, v in config.cc14_map.items()},
+            {int(k): v for k, v in config.nrpn_map.items()},
+        )
+
+    def encode(self, control_id: str, value: float) -> List[Tuple[int, int]]:
+        """(CC, value) messages that set `control_id` to `value` (0–1) on the device."""
+        out = self.outputs.get(control_id)
+        if out is None:
+            return []
+        kind, number = out
+        value = min(1.0, max(0.0, value))
+        if kind == CC7:
+            return [(number, int(round(value * 127.0)))]
+        raw = int(round(value * 16383.0))
+        if kind == CC14_MSB:
+            return [(number, raw >> 7), (number + 32, raw & 0x7F)]
+        return [(CC_NRPN_MSB, number >> 7), (CC_NRPN_LSB, number & 0x7F),
+                (CC_DATA_MSB, raw >> 7), (CC_DATA_LSB, raw & 0x7F)]
+
+    def feed(self, cc: int, value: int) -> Optional[Tuple[str, float]]:
+        """Return (control id, 0–1 value) for one CC message, or None if it completes no control."""
+        slot = self.slots[cc]
+        if slot is None:
+            return None
+        kind, control_id = slot
+        if kind == CC7:
+            return control_id, NORM_7[value]
+        if kind == CC14_MSB:
+            self._msb[cc] = value
+            return control_id, NORM_14[value << 7]
+        if kind == CC14_LSB:
+            return control_id, NORM_14[self._msb[cc - 32] << 7 | value]
+        if kind == NRPN_MSB:
+            self._param_msb = value
+            self._param = NO_PARAM  # wait for the LSB to complete the number
+            return None
+        if kind == NRPN_LSB:
+            self._param = self._param_msb << 7 | value
+            return None
+        control_id = self.nrpn.get(self._param, "")
+        if not control_id:
+            return None
+        if kind == DATA_MSB:
+            self._data_msb[self._param] = value
+            return control_id, NORM_14[value << 7]
+        return control_id, NORM_14[self._data_msb.get(self._param, 0) << 7 | value]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+ramps.py — volume ramps and holds, run by the REAPER bridge
+
+HA used to orchestrate a mix switch itself: publish a hard zero for the
+master sends, sleep 1 s in pyscript, republish everything. Now it sends two
+small messages on {prefix}/daw/ramp and the bridge runs the fades locally,
+at reaper.ramp_rate steps/s, one OSC bundle per step:
+
+  {"params": {"master_volume_speakers": 0, ...}, "duration": 0.15,
+   "curve": "out", "hold": "mix-42", "timeout": 5}
+      ramp the params to the targets; with "hold", keep them there:
+      daw/set_params values for held params are only remembered (latest wins)
+  {"release": "mix-42", "params": {...}, "delay": 1.0, "duration": 0.5, "curve": "in"}
+      after `delay` (plugs switching), drop the hold and ramp to the
+      remembered values, overridden by `params`
+
+A hold that isn't released within its timeout (reaper.hold_timeout by
+default) is released on its own, ramping only to the values that arrived
+meanwhile: if HA is gone, the outputs stay quiet rather than jump back.
+A plain set_params value for an address that is ramping ends the ramp.
+
+RampEngine is pure: callers pass the clock. Addresses, not param names, are
+the keys, so the fast path (same process) can ask is_held() too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter, gauge
+from khc.services.mac_mini.rpp_index import param_to_osc as resolved_param_to_osc
+
+LOG = logging.getLogger("khc.reaper.ramps")
+
+Message = Tuple[str, float]  # (OSC address, value)
+
+TIMEOUT_RAMP = 0.5  # seconds; ramp to the values held back when a hold times out
+
+CURVES: Dict[str, Callable[[float], float]] = {
+    "linear": lambda x: x,
+    "smooth": lambda x: x * x * (3.0 - 2.0 * x),  # ease in and out
+    "in": lambda x: x * x,                         # slow start: fade-ins
+    "out": lambda x: 1.0 - (1.0 - x) * (1.0 - x),  # fast start: fade-outs
+}
+
+RAMPS_STARTED = counter("khc_reaper_ramps_started_total", "Address ramps started")
+RAMPS_CANCELLED = counter("khc_reaper_ramps_cancelled_total", "Ramps ended early by a set_params value")
+HOLD_TIMEOUTS = counter("khc_reaper_hold_timeouts_total", "Holds released by their safety timeout")
+HELD_VALUES = counter("khc_reaper_held_values_total", "set_params values kept back by a hold")
+BAD_RAMPS = counter("khc_reaper_bad_ramps_total", "daw/ramp messages that failed to parse")
+ACTIVE_RAMPS = gauge("khc_reaper_active_ramps", "Addresses currently ramping")
+
+
+class Ramp(NamedTuple):
+    start: float
+    target: float
+    t0: float
+    duration: float
+    curve: Callable[[float], float]
+
+    def value(self, now: float) -> Tuple[float, bool]:
+        """(value at `now`, finished)."""
+        if self.duration <= 0 or now >= self.t0 + self.duration:
+            return self.target, True
+        x = self.curve(max(0.0, now - self.t0) / self.duration)
+        return self.start + (self.target - self.start) * x, False
+
+
+class Hold:
+    def __init__(self, addresses: List[str], deadline: float):
+        self.addresses = addresses
+        self.deadline = deadline
+        self.targets: Dict[str, float] = {}       # address → latest value asked for meanwhile
+        self.release_at: Optional[float] = None
+        self.release_ramp: Tuple[float, str] = (0.0, "linear")  # (duration, curve)
+
+
+class RampEngine:
+    def __init__(self) -> None:
+        self.current: Dict[str, float] = {}  # address → last value sent (or about to be)
+        self.ramps: Dict[str, Ramp] = {}
+        self.holds: Dict[str, Hold] = {}     # token → hold
+        self._held: Dict[str, str] = {}      # address → token of the newest hold on it
+        self.wakeup = asyncio.Event()
+        ACTIVE_RAMPS.set_function(lambda: len(self.ramps))
+
+    # -- set_params side ---------------------------------------------------
+    def is_held(self, address: str) -> bool:
+        return address in self._held
+
+    def note(self, messages: List[Message]) -> None:
+        """Values about to be sent outside the engine: they end any ramp on their address."""
+        for address, value in messages:
+            self.current[address] = value
+            if self.ramps.pop(address, None) is not None:
+                RAMPS_CANCELLED.inc()
+
+    def absorb(self, messages: List[Message]) -> List[Message]:
+        """Keep back values for held addresses; note and return the others."""
+        if self._held:
+            free = []
+            for address, value in messages:
+                token = self._held.get(address)
+                if token is None:
+                    free.append((address, value))
+                else:
+                    self.holds[token].targets[address] = value
+                    HELD_VALUES.inc()
+            messages = free
+        self.note(messages)
+        return messages
+
+    # -- daw/ramp side -----------------------------------------------------
+    def start(self, targets: Dict[str, float], duration: float, curve: str, now: float) -> None:
+        fn = CURVES[curve]
+        for address, target in targets.items():
+            start = self.current.get(address, target)  # unknown: jump
+            self.ramps[address] = Ramp(start, target, now, duration, fn)
+            RAMPS_STARTED.inc()
+        if targets:
+            self.wakeup.set()
+
+    def hold(self, token: str, addresses: List[str], timeout: float, now: float) -> None:
+        self.holds[token] = Hold(addresses, now + timeout)
+        for address in addresses:
+            self._held[address] = token
+        self.wakeup.set()
+
+    def release(self, token: str, targets: Dict[str, float], delay: float, duration: float, curve: str,
+                now: float) -> bool:
+        hold = self.holds.get(token)
+        if hold is None:
+            return False
+        hold.targets.update(targets)
+        hold.release_at = now + delay
+        hold.release_ramp = (duration, curve)
+        self.wakeup.set()
+        return True
+
+    # -- clock -------------------------------------------------------------
+    def step(self, now: float) -> List[Message]:
+        """Release due holds and return the ramp values to send at `now`."""
+        for token, hold in list(self.holds.items()):
+            if hold.release_at is not None and now >= hold.release_at:
+                self._drop(token)
+                self.start(hold.targets, *hold.release_ramp, now)
+            elif now >= hold.deadline:
+                HOLD_TIMEOUTS.inc()
+                log_kv(LOG, logging.WARNING, "hold timed out", token=token, values=len(hold.targets))
+                self._drop(token)
+                self.start(hold.targets, TIMEOUT_RAMP, "linear", now)
+        out: List[Message] = []
+        for address, ramp in list(self.ramps.items()):
+            value, finished = ramp.value(now)
+            out.append((address, value))
+            self.current[address] = value
+            if finished:
+                del self.ramps[address]
+        return out
+
+    def next_wakeup(self, now: float, tick: float) -> Optional[float]:
+        """Seconds until step() has work again, or None when idle."""
+        if self.ramps:
+            return tick
+        times = [h.release_at if h.release_at is not None else h.deadline for h in self.holds.values()]
+        return max(0.0, min(times) - now) if times else None
+
+    def _drop(self, token: str) -> None:
+        hold = self.holds.pop(token)
+        for address in hold.addresses:
+            if self._held.get(address) == token:
+                del self._held[address]
+
+
+# --------------------------------------------------------------------
+# daw/ramp messages
+# --------------------------------------------------------------------
+def _number(data: Dict[str, Any], key: str, default: float) -> float:
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"{key} must be a number >= 0")
+    return float(value)
+
+
+def apply_command(engine: RampEngine, data: Any, now: float) -> List[str]:
+    """Apply one decoded daw/ramp payload and return its addresses; ValueError if it's malformed."""
+    if not isinstance(data, dict):
+        raise ValueError("expected an object")
+    param_to_osc = resolved_param_to_osc()
+    params = data.get("params", {})
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    targets = {}
+    for param, value in params.items():
+        address = param_to_osc.get(param)
+        if address is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"params.{param} must be a number")
+        targets[address] = float(value)
+    duration = _number(data, "duration", 0.0)
+    curve = data.get("curve", "linear")
+    if curve not in CURVES:
+        raise ValueError(f"curve must be one of {', '.join(CURVES)}")
+
+    if "release" in data:
+        if not engine.release(str(data["release"]), targets, _number(data, "delay", 0.0), duration, curve, now):
+            # Unknown or already timed out: just go to the values
+            engine.start(targets, duration, curve, now)
+        return list(targets)
+    engine.start(targets, duration, curve, now)
+    if "hold" in data:
+        timeout = _number(data, "timeout", get_config().reaper.hold_timeout)
+        engine.hold(str(data["hold"]), list(targets), timeout, now)
+    return list(targets)
+
+
+async def ramp_forever(engine: RampEngine, send: Callable[[List[Message]], None]) -> None:
+    """Step `engine` at reaper.ramp_rate while it has ramps or holds; each step is one `send`."""
+    while True:
+        await engine.wakeup.wait()
+        engine.wakeup.clear()
+        while True:
+            now = time.monotonic()
+            messages = engine.step(now)
+            if messages:
+                send(messages)
+            wait = engine.next_wakeup(now, 1.0 / max(1.0, get_config().reaper.ramp_rate))
+            if wait is None:
+                break
+            # A new command (wakeup) may move the next deadline closer
+            try:
+                await asyncio.wait_for(engine.wakeup.wait(), wait)
+                engine.wakeup.clear()
+            except asyncio.TimeoutError:
+                pass
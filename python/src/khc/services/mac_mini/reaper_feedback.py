@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+REAPER OSC feedback → retained mixer state on MQTT
+
+With reaper.feedback_port set (REAPER: Preferences → Control/OSC/web → OSC,
+"Device port"), the REAPER bridge also listens for what REAPER reports back:
+fader positions, mutes and meters, whoever changed them (HA, the fast path,
+a mouse in REAPER). MixerState keeps the latest value per OSC address and
+publishes it — throttled to reaper.state_interval and only when it changed —
+so HA reads what REAPER really does instead of re-deriving it:
+
+  {prefix}/daw/state/<param>             params of [reaper.param_to_osc], retained
+  {prefix}/daw/state/track/2/mute ...    other volumes/mutes/solos, retained
+  {prefix}/daw/state/track/2/vu ...      meters, not retained
+
+REAPER sends meters many times a second per track; they're decimated to the
+peak over reaper.meter_interval, rounded to METER_DIGITS, before they reach
+MQTT. Anything else REAPER sends (names, pan, transport, ...) is ignored.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter, gauge
+from khc.services.mac_mini.rpp_index import param_to_osc
+
+if TYPE_CHECKING:
+    from khc.services.common.runtime import MqttRuntime
+
+LOG = logging.getLogger("khc.reaper.feedback")
+
+# /master or /track/N, optionally /send/N, then the value kind
+STATE_ADDRESS = re.compile(r"^/(?:master|track/\d+)(?:/send/\d+)?/(volume|mute|solo|vu(?:/[LR])?)$")
+STATE_FORMAT = b"%.4f"
+METER_DIGITS = 2
+
+FEEDBACK_MESSAGES = counter("khc_reaper_feedback_messages_total", "OSC messages received from REAPER")
+FEEDBACK_IGNORED = counter("khc_reaper_feedback_ignored_total", "REAPER OSC messages that aren't mixer state")
+STATE_PUBLISHED = counter("khc_reaper_state_published_total", "Mixer state values published to {prefix}/daw/state")
+STATE_UNCHANGED = counter("khc_reaper_state_unchanged_total", "Mixer state updates not published: value unchanged")
+STATE_ADDRESSES = gauge("khc_reaper_state_addresses", "OSC addresses in the mixer state table")
+
+
+class MixerState:
+    """
+    REAPER's mixer as last reported over OSC.
+
+    Pure: update() and take_changes() get the clock from the caller.
+    Non-meter values are diffed against what was last published per topic;
+    meters keep their peak until the next meter publish.
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[str, float] = {}            # OSC address → latest value
+        self._dirty: Dict[str, None] = {}             # state addresses changed since the last take
+        self._meters: Dict[str, float] = {}           # meter address → peak since the last meter publish
+        self._published: Dict[str, bytes] = {}        # topic → payload last published
+        self._last_meters = float("-inf")
+        self.changed = asyncio.Event()
+        STATE_ADDRESSES.set_function(lambda: len(self.values))
+
+    def update(self, address: str, value: Any) -> bool:
+        """Record one OSC message; False if it isn't mixer state."""
+        m = STATE_ADDRESS.match(address)
+        if m is None or isinstance(value, (str, bytes)):
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        self.values[address] = value
+        if m.group(1).startswith("vu"):
+            self._meters[address] = max(value, self._meters.get(address, 0.0))
+        else:
+            self._dirty[address] = None
+        self.changed.set()
+        return True
+
+    def pending(self) -> bool:
+        return bool(self._dirty or self._meters)
+
+    def take_changes(self, now: float, meter_interval: float) -> List[Tuple[str, bytes, bool]]:
+        """(topic, payload, retain) for every value that changed since it was last published."""
+        config = get_config()
+        base = f"{config.mqtt.topic_prefix}/daw/state"
+        param_of_address = {address: param for param, address in param_to_osc().items()}
+        out: List[Tuple[str, bytes, bool]] = []
+
+        def emit(address: str, payload: bytes, retain: bool) -> None:
+            param = param_of_address.get(address)
+            topic = f"{base}/{param}" if param else base + address
+            if self._published.get(topic) == payload:
+                STATE_UNCHANGED.inc()
+                return
+            self._published[topic] = payload
+            out.append((topic, payload, retain))
+
+        for address in self._dirty:
+            emit(address, STATE_FORMAT % self.values[address], True)
+        self._dirty.clear()
+        if self._meters and now - self._last_meters >= meter_interval:
+            for address, peak in self._meters.items():
+                emit(address, b"%.*f" % (METER_DIGITS, peak), False)
+            self._meters.clear()
+            self._last_meters = now
+        return out
+
+
+async def publish_state_forever(runtime: MqttRuntime, mixer: MixerState) -> None:
+    """Publish MixerState changes, at most once per reaper.state_interval."""
+    while True:
+        await mixer.changed.wait()
+        mixer.changed.clear()
+        while mixer.pending():
+            config = get_config().reaper
+            for topic, payload, retain in mixer.take_changes(time.monotonic(), config.meter_interval):
+                runtime.publish(topic, payload, qos=0, retain=retain)
+                STATE_PUBLISHED.inc()
+            await asyncio.sleep(config.state_interval)
+
+
+async def serve_feedback(runtime: MqttRuntime, mixer: Optional[MixerState] = None) -> None:
+    """Listen for REAPER's OSC feedback on reaper.feedback_port and publish the mixer state."""
+    from pythonosc.dispatcher import Dispatcher
+    from pythonosc.osc_server import AsyncIOOSCUDPServer
+
+    mixer = mixer or MixerState()
+
+    def on_osc(address: str, *args: Any) -> None:
+        FEEDBACK_MESSAGES.inc()
+        if len(args) != 1 or not mixer.update(address, args[0]):
+            FEEDBACK_IGNORED.inc()
+
+    dispatcher = Dispatcher()
+    dispatcher.set_default_handler(on_osc)
+    config = get_config().reaper
+    server = AsyncIOOSCUDPServer((config.feedback_host, config.feedback_port), dispatcher,
+                                 asyncio.get_running_loop())
+    transport, _ = await server.create_serve_endpoint()
+    log_kv(LOG, logging.INFO, "listening for REAPER feedback", host=config.feedback_host, port=config.feedback_port)
+    try:
+        await publish_state_forever(runtime, mixer)
+    finally:
+        transport.close()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+rpp_index.py — REAPER track names → OSC track / send numbers
+
+REAPER's OSC addresses are positional (/track/2/volume, /track/1/send/2/volume)
+and silently point at the wrong track once tracks are reordered. With
+[reaper] project set to the session's .RPP file, param_to_osc may name
+tracks and hardware outputs instead:
+
+  piano_volume = "/track/{piano}/volume"
+  master_volume_speakers = "/track/{submix}/send/{hw:1}/volume"   # outputs 1/2
+  master_volume_regular_headphones = "/track/{submix}/send/{hw:7}/volume"
+
+{name} is a track name (as in REAPER's TCP, quotes not included) and becomes
+its 1-based number; {hw:N} is that track's hardware output starting at
+output N and becomes its send number (track sends first, then hardware
+outputs in the order REAPER lists them).
+
+The .RPP is read line by line and only the top-level TRACK chunks' NAME,
+HWOUT and AUXRECV lines are looked at, so the item/FX state blobs that make
+up most of a session file are skipped without being held in memory.
+AddressBook resolves the templates once per config and project mtime; the
+per-message path reads a ready dict.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from khc.services.common.config import ReaperConfig, get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter
+
+LOG = logging.getLogger("khc.reaper.rpp")
+
+PROJECT_POLL_INTERVAL = 2.0  # seconds between .RPP mtime checks
+PLACEHOLDER = re.compile(r"\{([^{}]+)\}")
+HW_CHANNEL_MASK = 0x3FF      # HWOUT's first field: output index | flags (mono, ReaRoute)
+
+REMAPS = counter("khc_reaper_address_remaps_total", "param → OSC address maps rebuilt from the REAPER project")
+REMAP_ERRORS = counter("khc_reaper_address_remap_errors_total", "REAPER project reads or param templates that failed")
+
+
+class Track(NamedTuple):
+    number: int                # 1-based, as in /track/N
+    name: str
+    hw_outputs: List[int]      # first output (1-based) of each HWOUT, in order
+    track_sends: int           # sends to other tracks (listed before hardware outputs)
+
+
+class ProjectIndex:
+    def __init__(self, tracks: List[Track]):
+        self.tracks = tracks
+        self.by_name: Dict[str, List[Track]] = {}
+        for track in tracks:
+            self.by_name.setdefault(track.name, []).append(track)
+
+    def track(self, name: str) -> Track:
+        found = self.by_name.get(name, [])
+        if len(found) != 1:
+            raise ValueError(f"{'no' if not found else 'more than one'} track named {name!r}")
+        return found[0]
+
+    def resolve(self, template: str) -> str:
+        """Replace {track name} and {hw:N} in an OSC address template."""
+        track: Optional[Track] = None
+
+        def sub(m: re.Match) -> str:
+            nonlocal track
+            key = m.group(1)
+            if key.startswith("hw:"):
+                if track is None:
+                    raise ValueError(f"{m.group(0)} must follow a {{track name}}")
+                try:
+                    output = int(key[3:])
+                    return str(track.track_sends + track.hw_outputs.index(output) + 1)
+                except ValueError:
+                    raise ValueError(f"track {track.name!r} has no hardware output {key[3:]}") from None
+            track = self.track(key)
+            return str(track.number)
+
+        return PLACEHOLDER.sub(sub, template)
+
+
+def _unquote(value: str) -> str:
+    # REAPER quotes a name with ", ' or ` — whichever the name doesn't contain
+    if len(value) >= 2 and value[0] in "\"'`" and value[-1] == value[0]:
+        return value[1:-1]
+    return value
+
+
+def parse_rpp(lines: Iterable[str]) -> ProjectIndex:
+    """Index the top-level tracks of a .RPP file, streaming over its lines."""
+    tracks: List[Tuple[str, List[int]]] = []
+    sends_from: Dict[int, int] = {}  # source track index (0-based) → track sends
+    depth = 0
+    in_track = False
+    for raw in lines:
+        line = raw.strip()
+        if line.startswith("<"):
+            depth += 1
+            if depth == 2 and line.startswith("<TRACK"):
+                in_track = True
+                tracks.append(("", []))
+            continue
+        if line == ">":
+            if depth == 2:
+                in_track = False
+            depth -= 1
+            continue
+        if not in_track or depth != 2:
+            continue
+        key, _, rest = line.partition(" ")
+        if key == "NAME":
+            tracks[-1] = (_unquote(rest), tracks[-1][1])
+        elif key == "HWOUT":
+            tracks[-1][1].append((int(rest.split(" ", 1)[0]) & HW_CHANNEL_MASK) + 1)
+        elif key == "AUXRECV":
+            src = int(rest.split(" ", 1)[0])
+            sends_from[src] = sends_from.get(src, 0) + 1
+    return ProjectIndex([
+        Track(i + 1, name, hw, sends_from.get(i, 0)) for i, (name, hw) in enumerate(tracks)
+    ])
+
+
+def load_index(path: str) -> ProjectIndex:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return parse_rpp(f)
+
+
+class AddressBook:
+    """
+    [reaper] param_to_osc with track names resolved against the project.
+
+    param_to_osc() is what the per-message path calls: a dict, rebuilt only
+    when the config object changes. poll() (watch_project_forever) rebuilds
+    it when the .RPP's mtime changes. If the project can't be read or a
+    template doesn't resolve, the last good address is kept.
+    """
+
+    def __init__(self) -> None:
+        self._config: Optional[ReaperConfig] = None
+        self._mtime: Optional[float] = None
+        self._map: Dict[str, str] = {}
+        self._listeners: List[Callable[[Dict[str, str]], None]] = []
+
+    def add_listener(self, fn: Callable[[Dict[str, str]], None]) -> None:
+        """Call fn(new map) after each rebuild."""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn: Callable[[Dict[str, str]], None]) -> None:
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def param_to_osc(self) -> Dict[str, str]:
+        config = get_config().reaper
+        if config is not self._config:
+            self._rebuild(config, self._stat(config))
+        return self._map
+
+    def poll(self) -> bool:
+        config = get_config().reaper
+        mtime = self._stat(config)
+        if config is self._config and mtime == self._mtime:
+            return False
+        self._rebuild(config, mtime)
+        return True
+
+    @staticmethod
+    def _stat(config: ReaperConfig) -> Optional[float]:
+        if not config.project:
+            return None
+        try:
+            return os.stat(os.path.expanduser(config.project)).st_mtime
+        except OSError:
+            return None
+
+    def _rebuild(self, config: ReaperConfig, mtime: Optional[float]) -> None:
+        self._config, self._mtime = config, mtime
+        templates = config.param_to_osc
+        index: Optional[ProjectIndex] = None
+        if config.project and any("{" in t for t in templates.values()):
+            try:
+                index = load_index(os.path.expanduser(config.project))
+            except (OSError, ValueError) as e:
+                REMAP_ERRORS.inc()
+                log_kv(LOG, logging.ERROR, "can't read REAPER project", path=config.project, error=e)
+        new: Dict[str, str] = {}
+        for param, template in templates.items():
+            if "{" not in template:
+                new[param] = template
+                continue
+            try:
+                if index is None:
+                    raise ValueError("no project index")
+                new[param] = index.resolve(template)
+            except ValueError as e:
+                REMAP_ERRORS.inc()
+                log_kv(LOG, logging.ERROR, "can't resolve OSC address", param=param, template=template, error=e)
+                if param in self._map:
+                    new[param] = self._map[param]
+        if new != self._map:
+            REMAPS.inc()
+            log_kv(LOG, logging.INFO, "OSC addresses mapped", params=len(new),
+                   project=config.project or "-")
+        self._map = new
+        for fn in self._listeners:
+            fn(new)
+
+
+ADDRESSES = AddressBook()
+
+
+def param_to_osc() -> Dict[str, str]:
+    """param → OSC address, track names resolved (see AddressBook)."""
+    return ADDRESSES.param_to_osc()
+
+
+async def watch_project_forever(interval: float = PROJECT_POLL_INTERVAL) -> None:
+    """Re-resolve the OSC addresses whenever the REAPER project file changes."""
+    while True:
+        ADDRESSES.poll()
+        await asyncio.sleep(interval)
@@ -9,50 +9,65 @@ mod_right while pressing action keys).
 Must run as root (or user with read access to /dev/input).
 """
 
+import asyncio
 import json
+import logging
 import sys
-import time
+from typing import Dict
 
 import evdev
 
-from khc.services.common import create_and_connect_mqtt_client
+from khc.services.common.config import CONFIG, KhcConfig, get_config
+from khc.services.common.logs import log_kv
+from khc.services.common.metrics import counter, gauge
+from khc.services.common.runtime import MqttRuntime, run_service
+from khc.services.common.tracing import stamp
 
 # --------------- Config ---------------
+# Device path, topic and the key map: [numpad] in khc.toml
 MQTT_CLIENT_NAME = "numpad_to_mqtt"
-MQTT_TOPIC = "khc/livingroom/numpad"
-DEVICE_PATH = "/dev/input/by-id/usb-Telink_Macally_RFKeyboard-if01-event-kbd"
-
-# Map evdev keycodes to our logical key names.
-# evdev KEY_* constants: https://python-evdev.readthedocs.io/en/latest/apidoc.html
-KEYCODE_TO_NAME = {
-    evdev.ecodes.KEY_BACKSPACE: '1_1',
-    evdev.ecodes.KEY_EQUAL:    '1_2',   # Macally sends KEY_EQUAL, not KEY_KPEQUAL
-    evdev.ecodes.KEY_KPSLASH:  '1_3',
-    evdev.ecodes.KEY_KPASTERISK: '1_4',
-    evdev.ecodes.KEY_KP7:      '2_1',
-    evdev.ecodes.KEY_KP8:      '2_2',
-    evdev.ecodes.KEY_KP9:      '2_3',
-    evdev.ecodes.KEY_KPMINUS:  '2_4',
-    evdev.ecodes.KEY_KP4:      '3_1',
-    evdev.ecodes.KEY_KP5:      '3_2',
-    evdev.ecodes.KEY_KP6:      '3_3',
-    evdev.ecodes.KEY_KPPLUS:   '3_4',
-    evdev.ecodes.KEY_KP1:      '4_1',
-    evdev.ecodes.KEY_KP2:      '4_2',
-    evdev.ecodes.KEY_KP3:      '4_3',
-    evdev.ecodes.KEY_KP0:      'mod_left',
-    evdev.ecodes.KEY_KPDOT:    'mod_center',
-    evdev.ecodes.KEY_KPENTER:  'mod_right',
-}
-
-
-def find_device() -> evdev.InputDevice:
+
+LOG = logging.getLogger("numpad_to_mqtt")
+
+# evdev keycode -> logical key name, built from numpad.key_to_name (KEY_* names,
+# see https://python-evdev.readthedocs.io/en/latest/apidoc.html) and rebuilt
+# when the config is reloaded.
+KEYCODE_TO_NAME: Dict[int, str] = {}
+
+KEYS_PRESSED = counter("khc_numpad_key_events_total", "Key events published", event="pressed")
+KEYS_RELEASED = counter("khc_numpad_key_events_total", "Key events published", event="released")
+UNMAPPED_KEYS = counter("khc_numpad_unmapped_keys_total", "Key events for keys missing from the key map")
+DEVICE_OPEN = gauge("khc_numpad_device_open", "1 while the numpad input device is open")
+REOPENS = counter("khc_numpad_device_reopens_total", "Times the numpad device was reopened after a disconnect")
+
+
+def build_keymap(key_to_name: Dict[str, str]) -> Dict[int, str]:
+    keymap = {}
+    for key, name in key_to_name.items():
+        code = evdev.ecodes.ecodes.get(key)
+        if code is None:
+            print(f"Ignoring unknown evdev key {key!r} in numpad.key_to_name", file=sys.stderr)
+            continue
+        keymap[code] = name
+    return keymap
+
+
+def _on_config_change(old: KhcConfig, new: KhcConfig) -> None:
+    if new.numpad.key_to_name != old.numpad.key_to_name:
+        KEYCODE_TO_NAME.clear()
+        KEYCODE_TO_NAME.update(build_keymap(new.numpad.key_to_name))
+        print("Reloaded numpad key map", file=sys.stderr)
+
+
+async def find_device() -> evdev.InputDevice:
     """Open the numpad input device, retrying until found."""
+    device_path = get_config().numpad.device_path
     while True:
+        dev = None
         try:
-            dev = evdev.InputDevice(DEVICE_PATH)
+            dev = evdev.InputDevice(device_path)
             dev.grab()  # Exclusive access so keypresses don't leak to console
-            print(f"Opened and grabbed: {dev.name} ({DEVICE_PATH})", file=sys.stderr)
+            print(f"Opened and grabbed: {dev.name} ({device_path})", file=sys.stderr)
             return dev
         except (FileNotFoundError, PermissionError, OSError) as e:
             print(f"Cannot open device ({e}), retrying in 2s...", file=sys.stderr)
@@ -60,17 +75,19 @@ def find_device() -> evdev.InputDevice:
                 dev.close()
             except Exception:
                 pass
-            time.sleep(2)
+            await asyncio.sleep(2)
 
 
-def run(client):
-    dev = find_device()
+async def run(runtime: MqttRuntime) -> None:
+    dev = await find_device()
+    DEVICE_OPEN.set(1)
+    topic = get_config().numpad.topic
     pressed_keys: set[str] = set()
 
     print("Listening for numpad events...", file=sys.stderr)
 
     try:
-        for event in dev.read_loop():
+        async for event in dev.async_read_loop():
             if event.type != evdev.ecodes.EV_KEY:
                 continue
 
@@ -79,47 +96,58 @@ def run(client):
             name = KEYCODE_TO_NAME.get(keycode)
 
             if name is None:
+                UNMAPPED_KEYS.inc()
                 continue
 
             if key_event.keystate == evdev.KeyEvent.key_down:
                 pressed_keys.add(name)
-                payload = {
+                payload = stamp({
                     'event_name': 'pressed',
                     'key': name,
                     'pressed_keys': sorted(pressed_keys),
-                }
-                print(payload, file=sys.stderr)
-                client.publish(MQTT_TOPIC, json.dumps(payload))
+                }, 'numpad')
+                log_kv(LOG, logging.DEBUG, "pressed", key=name, pressed_keys=",".join(payload['pressed_keys']))
+                runtime.publish(topic, json.dumps(payload))
+                KEYS_PRESSED.inc()
 
             elif key_event.keystate == evdev.KeyEvent.key_up:
-                payload = {
+                payload = stamp({
                     'event_name': 'released',
                     'key': name,
                     'pressed_keys': sorted(pressed_keys),
-                }
-                client.publish(MQTT_TOPIC, json.dumps(payload))
+                }, 'numpad')
+                runtime.publish(topic, json.dumps(payload))
+                KEYS_RELEASED.inc()
                 pressed_keys.discard(name)
 
     except OSError:
         print("Device disconnected", file=sys.stderr)
     finally:
+        DEVICE_OPEN.set(0)
         try:
             dev.ungrab()
         except Exception:
             pass
+        try:
+            dev.close()
+        except Exception:
+            pass
 
 
-def main():
+async def serve(runtime: MqttRuntime) -> None:
+    KEYCODE_TO_NAME.update(build_keymap(get_config().numpad.key_to_name))
+    CONFIG.add_listener(_on_config_change)
+    # The MQTT connection survives device unplugs; only the device is reopened.
     while True:
-        try:
-            client = create_and_connect_mqtt_client(MQTT_CLIENT_NAME)
-            client.loop_start()
-            run(client)
-        except Exception as e:
-            print(f"Error: {e}", file=sys.stderr)
-        print("Restarting in 2 seconds...", file=sys.stderr)
-        time.sleep(2)
+        await run(runtime)
+        REOPENS.inc()
+        print("Reopening device in 2 seconds...", file=sys.stderr)
+        await asyncio.sleep(2)
+
+
+def main():
+    return run_service(MQTT_CLIENT_NAME, serve, service="numpad")
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
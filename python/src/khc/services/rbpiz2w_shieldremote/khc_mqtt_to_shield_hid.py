@@ -5,26 +5,30 @@ MQTT → USB HID bridge for Shield
 - /dev/hidg0 : Boot keyboard (arrows, Enter, Esc) — 8 bytes per report
 - /dev/hidg1 : Consumer control (media keys)      — 3 bytes per report (Report ID = 0x01)
 
-Env (provided by systemd EnvironmentFile):
-  MQTT_HOST, MQTT_PORT, MQTT_USER, MQTT_PASSWORD, MQTT_TOPIC
+MQTT credentials come from ~/khc-private/.env via khc.services.common;
+the topic is shield_hid.topic in ~/khc-private/khc.toml.
 """
 
-import os
 import json
+import time
+import asyncio
 import logging
-import paho.mqtt.client as mqtt
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s",
-)
+from khc.services.common.config import get_config
+from khc.services.common.logs import log_kv, setup_logging
+from khc.services.common.metrics import counter, histogram
+from khc.services.common.runtime import run_blocking, run_service
+from khc.services.common.tracing import TRACE_ENABLED, TraceRecorder, add_hop
 
-# ---------------- Env ----------------
-MQTT_HOST = os.environ.get("MQTT_HOST", "127.0.0.1")
-MQTT_PORT = int(os.environ.get("MQTT_PORT", "1883"))
-MQTT_USER = os.environ.get("MQTT_USER", "")
-MQTT_PASS = os.environ.get("MQTT_PASSWORD", "")
-TOPIC     = os.environ.get("MQTT_TOPIC", "kha/livingroom/shield/press_key")
+# ---------------- Config ----------------
+MQTT_CLIENT_NAME = "khc-mqtt-to-shield-hid"
+
+TRACES = TraceRecorder("hid")
+
+ACTIONS = counter("khc_hid_actions_total", "Key presses written to the HID gadget")
+UNKNOWN_KEYS = counter("khc_hid_unknown_keys_total", "Messages naming an unknown key")
+ERRORS = counter("khc_hid_errors_total", "Messages that failed (bad JSON, hidg write errors)")
+WRITE_SECONDS = histogram("khc_hid_write_seconds", "hidg press + release write latency")
 
 KEYBOARD_DEV = "/dev/hidg0"
 CONSUMER_DEV = "/dev/hidg1"
@@ -84,37 +88,43 @@ NAME_TO_ACTION = {
     "vol_down":   lambda: _cc_tap(CC_VOL_DOWN),
 }
 
-# ------------- MQTT callbacks -------------
-def _on_connect(client, userdata, flags, reason_code, properties=None):
-    logging.info("MQTT connected: reason_code=%s", reason_code)
-    if reason_code == 0:
-        rc = client.subscribe(TOPIC)
-        logging.info("Subscribed to %s: %s", TOPIC, rc)
-    else:
-        logging.error("MQTT connect failed: %s", reason_code)
-
-def _on_message(client, userdata, msg):
+# ------------- MQTT handlers -------------
+async def _on_message(runtime, userdata, msg):
     try:
         payload = json.loads(msg.payload.decode("utf-8", "ignore"))
         name = payload.get("name")
+        trace = payload.get("trace")
+        add_hop(trace, "hid")
         fn = NAME_TO_ACTION.get(name)
-        logging.info("MQTT msg on %s: %s", msg.topic, payload)
+        log_kv(logging.getLogger(), logging.DEBUG, "MQTT msg", topic=msg.topic, name=name)
         if fn:
-            fn()
+            # hidg writes block while the Shield isn't polling; keep them off the loop.
+            t0 = time.perf_counter()
+            await run_blocking(fn)
+            WRITE_SECONDS.observe(time.perf_counter() - t0)
+            ACTIONS.inc()
+            add_hop(trace, "hid.write")
+            TRACES.record(trace)
         else:
+            UNKNOWN_KEYS.inc()
             logging.warning("Unknown key: %s", name)
     except Exception as e:
+        ERRORS.inc()
         logging.exception("Error handling message: %s", e)
 
+async def serve(runtime):
+    runtime.subscribe(get_config().shield_hid.topic, _on_message)
+    snapshots = asyncio.create_task(TRACES.publish_forever(runtime)) if TRACE_ENABLED else None
+    try:
+        await runtime.wait_closed()
+    finally:
+        if snapshots is not None:
+            snapshots.cancel()
+
 def main():
-    logging.info("Starting MQTT→HID | host=%s:%s topic=%s", MQTT_HOST, MQTT_PORT, TOPIC)
-    c = mqtt.Client(client_id="khc-mqtt-to-shield-hid", protocol=mqtt.MQTTv311)
-    if MQTT_USER or MQTT_PASS:
-        c.username_pw_set(MQTT_USER, MQTT_PASS)
-    c.on_connect = _on_connect
-    c.on_message = _on_message
-    c.connect(MQTT_HOST, MQTT_PORT, 60)
-    c.loop_forever()
+    setup_logging()
+    logging.info("Starting MQTT→HID | topic=%s", get_config().shield_hid.topic)
+    return run_service(MQTT_CLIENT_NAME, serve, service="shield_hid")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1 @@
+# KHC command-line tools (run on demand, unlike the long-running services)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+MQTT capture & replay
+
+Records broker traffic into an append-only capture file and replays it —
+into the broker, or straight into the bridge handlers (with the fake
+OSC/serial/hidg sinks from khc.bench.fakes) as a reproducible load test.
+
+File format (little-endian):
+  header   b"KHCCAP1\\n"
+  record   uint64 wall-clock ns | uint16 topic length | uint8 flags
+           (bits 0–1 QoS, bit 2 retain) | uint8 reserved |
+           uint32 payload length | topic bytes | payload bytes
+
+Records are only ever appended; a record cut short by a crash is ignored
+on read. Readers mmap the file and slice topics/payloads out of it without
+copying the whole capture into memory.
+
+Usage:
+  khc-capture record evening.khccap                 # kha/#, khc/#, zwave/#
+  khc-capture info evening.khccap
+  khc-capture replay evening.khccap --speed 10      # into the broker
+  khc-capture replay evening.khccap --speed max --to bridges
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import mmap
+import struct
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import paho.mqtt.client as mqtt
+
+from khc.services.common.runtime import MqttRuntime, run_service
+
+MQTT_CLIENT_NAME = "khc_capture"
+DEFAULT_TOPICS = ("kha/#", "khc/#", "zwave/#")
+
+MAGIC = b"KHCCAP1\n"
+_RECORD = struct.Struct("<QHBBI")
+_RETAIN = 0x04
+FLUSH_INTERVAL = 1.0  # seconds
+
+
+class Record(NamedTuple):
+    t_ns: int
+    topic: str
+    payload: bytes
+    qos: int
+    retain: bool
+
+
+# --------------------------------------------------------------------
+# File format
+# --------------------------------------------------------------------
+class CaptureWriter:
+    """Appends records to a capture file (creating it with a header if new)."""
+
+    def __init__(self, path: str):
+        self._f: BinaryIO = open(path, "ab")
+        if self._f.tell() == 0:
+            self._f.write(MAGIC)
+        self.records = 0
+
+    def append(self, t_ns: int, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        topic_b = topic.encode("utf-8")
+        flags = (qos & 0x03) | (_RETAIN if retain else 0)
+        self._f.write(_RECORD.pack(t_ns, len(topic_b), flags, 0, len(payload)))
+        self._f.write(topic_b)
+        self._f.write(payload)
+        self.records += 1
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+@contextmanager
+def open_capture(path: str) -> Iterator[mmap.mmap]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a KHC capture file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def iter_records(mm: mmap.mmap) -> Iterator[Record]:
+    """Yield the complete records of a mapped capture, in file order."""
+    view = memoryview(mm)
+    offset, end = len(MAGIC), len(mm)
+    try:
+        while offset + _RECORD.size <= end:
+            t_ns, topic_len, flags, _, payload_len = _RECORD.unpack_from(mm, offset)
+            body = offset + _RECORD.size
+            stop = body + topic_len + payload_len
+            if stop > end:
+                break  # truncated tail (writer killed mid-record)
+            topic = str(view[body:body + topic_len], "utf-8")
+            payload = bytes(view[body + topic_len:stop])
+            yield Record(t_ns, topic, payload, flags & 0x03, bool(flags & _RETAIN))
+            offset = stop
+    finally:
+        view.release()
+
+
+# --------------------------------------------------------------------
+# record
+# --------------------------------------------------------------------
+def cmd_record(args: argparse.Namespace) -> int:
+    writer = CaptureWriter(args.file)
+
+    async def on_message(runtime: MqttRuntime, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        writer.append(time.time_ns(), msg.topic, msg.payload, msg.qos, msg.retain)
+
+    async def serve(runtime: MqttRuntime) -> None:
+        for topic_filter in args.topic or DEFAULT_TOPICS:
+            runtime.subscribe(topic_filter, on_message)
+        print(f"Recording {', '.join(args.topic or DEFAULT_TOPICS)} → {args.file} (Ctrl+C to stop)")
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            writer.flush()
+
+    try:
+        run_service(MQTT_CLIENT_NAME, serve)
+    finally:
+        writer.close()
+    print(f"Recorded {writer.records} messages")
+    return 0
+
+
+# --------------------------------------------------------------------
+# info
+# --------------------------------------------------------------------
+def cmd_info(args: argparse.Namespace) -> int:
+    counts: Counter[str] = Counter()
+    first = last = None
+    total_bytes = 0
+    with open_capture(args.file) as mm:
+        for rec in iter_records(mm):
+            first = rec.t_ns if first is None else first
+            last = rec.t_ns
+            counts[rec.topic] += 1
+            total_bytes += len(rec.payload)
+    n = sum(counts.values())
+    if not n:
+        print("Empty capture")
+        return 0
+    seconds = max((last - first) / 1e9, 1e-9)
+    print(f"{n} messages, {total_bytes} payload bytes over {seconds:.1f} s ({n / seconds:.1f} msg/s)")
+    for topic, count in counts.most_common(args.top):
+        print(f"  {count:>8}  {topic}")
+    return 0
+
+
+# --------------------------------------------------------------------
+# replay
+# --------------------------------------------------------------------
+def parse_speed(value: str) -> float:
+    """'1', '10', '0.5' or 'max' (0 = no pacing)."""
+    if value == "max":
+        return 0.0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return speed
+
+
+async def replay_records(
+    records: Iterator[Record],
+    speed: float,
+    deliver: Callable[[Record], Any],
+    topic_filters: Sequence[str] = ("#",),
+) -> int:
+    """Pace `records` at `speed`× their recorded timing (0 = max) into `deliver`."""
+    sent = 0
+    t0_rec: Optional[int] = None
+    t0 = time.monotonic()
+    for rec in records:
+        if not any(mqtt.topic_matches_sub(f, rec.topic) for f in topic_filters):
+            continue
+        if speed:
+            if t0_rec is None:
+                t0_rec = rec.t_ns
+            delay = t0 + (rec.t_ns - t0_rec) / 1e9 / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        result = deliver(rec)
+        if asyncio.iscoroutine(result):
+            await result
+        sent += 1
+    return sent
+
+
+def bridge_targets() -> List[Tuple[str, str, Callable[..., Any], Any]]:
+    """(name, topic filter, handler, userdata) for each output bridge, wired to fakes."""
+    from khc.bench.fakes import FakeOSCClient, FakeSerial, load_shield_hid
+    from khc.services.common.config import get_config
+    from khc.services.mac_mini import khc_mqtt_to_kvm as kvm
+    from khc.services.mac_mini import khc_mqtt_to_reaper as reaper
+
+    config = get_config()
+    prefix = config.mqtt.topic_prefix
+    hid = load_shield_hid()
+    return [
+        ("reaper", f"{prefix}/daw/#", reaper.on_mqtt_message_received, FakeOSCClient()),
+        ("kvm", f"{prefix}/kvm/#", kvm.on_mqtt_message_received, FakeSerial()),
+        ("shield_hid", config.shield_hid.topic, hid._on_message, None),
+    ]
+
+
+def cmd_replay(args: argparse.Namespace) -> int:
+    topic_filters = args.topic or ["#"]
+
+    if args.to == "bridges":
+        import logging
+        import os
+
+        from khc.bench.fakes import FakeRuntime, make_message
+        from khc.bench.hot_paths import percentile
+
+        # The bridges log per message; keep the cost, drop the output.
+        logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(open(os.devnull, "w"))])
+        targets = bridge_targets()
+        runtime = FakeRuntime()
+        latencies: Dict[str, List[float]] = {name: [] for name, _, _, _ in targets}
+
+        async def deliver(rec: Record) -> None:
+            msg = make_message(rec.topic, rec.payload)
+            for name, topic_filter, handler, userdata in targets:
+                if mqtt.topic_matches_sub(topic_filter, rec.topic):
+                    t0 = time.perf_counter()
+                    await handler(runtime, userdata, msg)
+                    latencies[name].append((time.perf_counter() - t0) * 1e6)
+
+        async def run() -> int:
+            with open_capture(args.file) as mm:
+                return await replay_records(iter_records(mm), args.speed, deliver, topic_filters)
+
+        t0 = time.perf_counter()
+        sent = asyncio.run(run())
+        seconds = time.perf_counter() - t0
+        print(f"Replayed {sent} messages in {seconds:.2f} s")
+        print(f"{'bridge':<12} {'msgs':>7} {'p50 µs':>9} {'p99 µs':>9} {'max µs':>9}")
+        for name, values in latencies.items():
+            values.sort()
+            if values:
+                print(f"{name:<12} {len(values):>7} {percentile(values, 50):>9.1f} "
+                      f"{percentile(values, 99):>9.1f} {values[-1]:>9.1f}")
+        return 0
+
+    sent = 0
+
+    async def serve(runtime: MqttRuntime) -> None:
+        nonlocal sent
+
+        def deliver(rec: Record) -> None:
+            runtime.publish(rec.topic, rec.payload, qos=rec.qos, retain=rec.retain and args.keep_retain)
+
+        while not runtime.connected:
+            await asyncio.sleep(0.05)
+        with open_capture(args.file) as mm:
+            sent = await replay_records(iter_records(mm), args.speed, deliver, topic_filters)
+        await asyncio.sleep(0.5)  # let the network thread drain the last publishes
+
+    run_service(MQTT_CLIENT_NAME, serve)
+    print(f"Replayed {sent} messages")
+    return 0
+
+
+# --------------------------------------------------------------------
+# CLI
+# --------------------------------------------------------------------
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Record and replay KHC MQTT traffic")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Append broker traffic to a capture file")
+    rec.add_argument("file")
+    rec.add_argument("--topic", "-t", action="append",
+                     help=f"Topic filter (repeatable). Default: {' '.join(DEFAULT_TOPICS)}")
+    rec.add_argument("--duration", type=float, default=0.0,
+                     help="Stop after this many seconds (0 = until Ctrl+C). Default: %(default)s")
+    rec.set_defaults(fn=cmd_record)
+
+    info = sub.add_parser("info", help="Summarize a capture file")
+    info.add_argument("file")
+    info.add_argument("--top", type=int, default=15, help="Topics to list. Default: %(default)s")
+    info.set_defaults(fn=cmd_info)
+
+    rep = sub.add_parser("replay", help="Re-publish a capture into the broker or the bridge handlers")
+    rep.add_argument("file")
+    rep.add_argument("--speed", type=parse_speed, default=1.0,
+                     help="Playback speed: 1, 10, … or 'max'. Default: 1")
+    rep.add_argument("--to", choices=("broker", "bridges"), default="broker",
+                     help="broker: publish via MQTT; bridges: call the REAPER/KVM/HID handlers "
+                          "in-process with fake devices. Default: %(default)s")
+    rep.add_argument("--topic", "-t", action="append",
+                     help="Only replay topics matching this filter (repeatable). Default: all")
+    rep.add_argument("--keep-retain", action="store_true",
+                     help="Re-publish retained messages as retained (off by default so a replay "
+                          "doesn't overwrite live retained state)")
+    rep.set_defaults(fn=cmd_replay)
+
+    args = p.parse_args(argv or sys.argv[1:])
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Latency trace report
+
+Collects the retained histogram snapshots that traced bridges publish to
+khc/trace/<service> (see khc.services.common.tracing) and prints
+p50/p95/p99 per path and hop.
+
+Usage:
+  python -m khc.tools.trace_report            # wait 2 s for snapshots, print
+  python -m khc.tools.trace_report --wait 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List
+
+import paho.mqtt.client as mqtt
+
+from khc.services.common.runtime import MqttRuntime, run_service
+from khc.services.common.tracing import TRACE_TOPIC_PREFIX, LatencyHistogram
+
+MQTT_CLIENT_NAME = "khc_trace_report"
+
+
+def format_report(snapshots: Dict[str, Dict[str, Any]]) -> str:
+    lines: List[str] = []
+    header = f"{'hop':<28} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    for service in sorted(snapshots):
+        for path, hops in sorted(snapshots[service].get("paths", {}).items()):
+            lines.append(f"\n[{service}] {path}")
+            lines.append(header)
+            for hop, d in hops.items():
+                h = LatencyHistogram.from_dict(d)
+                lines.append(
+                    f"{hop:<28} {h.total:>7} {h.percentile(50):>9.2f} "
+                    f"{h.percentile(95):>9.2f} {h.percentile(99):>9.2f}"
+                )
+        if snapshots[service].get("dropped"):
+            lines.append(f"\n[{service}] {snapshots[service]['dropped']} trace(s) dropped (too many paths or hops)")
+    return "\n".join(lines) if lines else "No trace snapshots found (is KHC_TRACE=1 set on the bridges?)"
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Summarize KHC latency traces")
+    p.add_argument("--wait", type=float, default=2.0,
+                   help="Seconds to collect retained snapshots. Default: %(default)s")
+    args = p.parse_args(argv or sys.argv[1:])
+
+    snapshots: Dict[str, Dict[str, Any]] = {}
+
+    async def on_snapshot(runtime: MqttRuntime, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        try:
+            snapshots[msg.topic.rsplit("/", 1)[-1]] = json.loads(msg.payload)
+        except ValueError:
+            pass
+
+    async def serve(runtime: MqttRuntime) -> None:
+        runtime.subscribe(f"{TRACE_TOPIC_PREFIX}/#", on_snapshot)
+        await asyncio.sleep(args.wait)
+
+    run_service(MQTT_CLIENT_NAME, serve)
+    print(format_report(snapshots))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
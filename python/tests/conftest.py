@@ -0,0 +1,24 @@
+"""Shared fixtures: every test runs against the built-in defaults, not ~/khc-private/khc.toml."""
+
+import os
+from dataclasses import replace
+
+import pytest
+
+# Before khc is imported: CONFIG_FILE is read at import time
+os.environ["KHC_CONFIG"] = os.path.join(os.path.dirname(__file__), "no-such-khc.toml")
+
+from khc.services.common import config as C  # noqa: E402
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """Install a config for one test: config(reaper=ReaperConfig(...), ...)."""
+
+    def install(**sections):
+        new = replace(C.KhcConfig(), **sections)
+        monkeypatch.setattr(C.CONFIG, "_config", new)
+        return new
+
+    monkeypatch.setattr(C.CONFIG, "_config", C.KhcConfig())
+    return install
@@ -0,0 +1,53 @@
+import pytest
+
+from khc.services.common.codec import (
+    CONTROLS_CODEC, CONTROLS_CODEC_U16, DAW_PARAMS_CODEC, MAGIC, decode_payload, is_binary,
+)
+
+
+def test_f32_round_trip():
+    values = {"dial_1": 0.25, "fader_5": 1.0, "dial_3": 0.0}
+    frame = CONTROLS_CODEC.encode(values)
+    assert is_binary(frame)
+    assert len(frame) == 4 + 3 * 4
+    assert CONTROLS_CODEC.decode(frame) == values
+    assert decode_payload(frame) == values
+
+
+def test_u16_round_trip_within_one_step():
+    values = {"dial_2": 0.5, "fader_1": 0.123456}
+    frame = CONTROLS_CODEC_U16.encode(values)
+    assert len(frame) == 4 + 2 * 2
+    decoded = decode_payload(frame)
+    assert decoded.keys() == values.keys()
+    for key, value in values.items():
+        assert decoded[key] == pytest.approx(value, abs=1 / 65535)
+
+
+def test_u16_clamps_to_full_scale():
+    decoded = CONTROLS_CODEC_U16.decode(CONTROLS_CODEC_U16.encode({"dial_1": 1.5, "dial_2": -0.5}))
+    assert decoded == {"dial_1": 1.0, "dial_2": 0.0}
+
+
+def test_unknown_keys_are_dropped():
+    assert DAW_PARAMS_CODEC.decode(DAW_PARAMS_CODEC.encode({"piano_volume": 0.5, "nope": 1.0})) == {
+        "piano_volume": 0.5
+    }
+
+
+def test_json_passes_through():
+    assert decode_payload(b'{"piano_volume": 0.5}') == {"piano_volume": 0.5}
+
+
+@pytest.mark.parametrize("payload", [
+    bytes([MAGIC, 0]),                                   # truncated header
+    bytes([MAGIC, 9, 1, 0, 0, 0, 0, 0]),                 # unknown schema
+    bytes([MAGIC, 0, 0x00, 0x04, 0, 0, 0, 0]),           # bit 10: past the 10 control keys
+    bytes([MAGIC, 1, 0x00, 0x01, 0, 0, 0, 0]),           # bit 8: past the 8 DAW param keys
+    CONTROLS_CODEC.encode({"dial_1": 0.5, "dial_2": 0.5})[:-2],  # truncated values
+    b"[1, 2]",                                           # JSON, not an object
+    b"garbage",
+])
+def test_garbage_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_payload(payload)
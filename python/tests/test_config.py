@@ -0,0 +1,46 @@
+import pytest
+
+from khc.services.common.config import ConfigError, KhcConfig, parse_config
+
+
+def test_empty_file_is_all_defaults():
+    assert parse_config("") == KhcConfig()
+
+
+def test_values_are_coerced_to_the_schema():
+    config = parse_config("""
+[reaper]
+max_rate = 60            # int for a float field
+[sparrow.devices.sparrow]
+cc14_map = { "20" = "fader_6" }
+feedback = true
+""")
+    assert config.reaper.max_rate == 60.0 and isinstance(config.reaper.max_rate, float)
+    device = config.sparrow.devices["sparrow"]
+    assert device.cc14_map == {"20": "fader_6"} and device.feedback is True
+    assert device.cc_map == KhcConfig().sparrow.devices["sparrow"].cc_map
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[reaper]\nosc_port = '1234'", "reaper.osc_port: expected int"),
+    ("[reaper]\nosc_port = true", "reaper.osc_port: expected int"),
+    ("[reaper]\nmax_rate = 'fast'", "reaper.max_rate: expected float"),
+    ("[kvm]\nsource_to_cmd = 'x'", "kvm.source_to_cmd: expected a table"),
+    ("[kvm.source_to_cmd]\ncorp_mac = 3", "kvm.source_to_cmd.corp_mac: expected str"),
+    ("[reaper]\nbogus = 1", "reaper: unknown key(s) ['bogus']"),
+    ("mqtt = 1", "mqtt: expected a table"),
+    ("[reaper]\nmax_rate = -1", "reaper: max_rate must be >= 0"),
+    ("[reaper.param_to_osc]\npiano_volume = '/track/{piano}/volume'", "reaper.project is not set"),
+    ("[sparrow]\nrtt_probe_interval = 0", "rtt_probe_interval must be > 0"),
+    ("[sparrow]\npublish_mode = 'smoke'", "publish_mode 'smoke' is not one of"),
+    ("[sparrow.control_qos]\nfader = 3", "QoS must be 0, 1 or 2"),
+    ("[sparrow.devices.a]\ncc_map = { '128' = 'x' }", "cc_map: '128' is not a number"),
+    ("[sparrow.devices.a]\ncc_map = { '5' = 'x' }\ncc14_map = { '5' = 'y' }", "both as 7-bit and as a 14-bit pair"),
+    ("[sparrow.devices.a]\ncc_map = { '6' = 'x' }\nnrpn_map = { '1' = 'y' }", "reserved for NRPN"),
+    ("[sparrow.filter]\nkind = 'kalman'", "filter kind 'kalman'"),
+    ("[reaper", "Expected ']'"),
+])
+def test_invalid_config_raises(text, message):
+    with pytest.raises(ConfigError) as e:
+        parse_config(text)
+    assert message in str(e.value)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from khc.services.common.config import MidiDeviceConfig, SparrowConfig
+from khc.services.mac_mini.midi_feedback import MidiFeedback
+
+
+class FakePort:
+    name = "Fake Controller"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append((message.control, message.value))
+
+
+@pytest.fixture
+def feedback(config):
+    config(sparrow=SparrowConfig(
+        devices={"ctl": MidiDeviceConfig(
+            cc_map={}, cc14_map={"20": "fader_1"}, nrpn_map={"300": "dial_1", "301": "dial_2"}, feedback=True,
+        )},
+        control_to_dial={"dial_1": "piano", "dial_2": "corp", "fader_1": "master"},
+        feedback_rate=1e6,
+    ))
+    fb = MidiFeedback()
+    fb.routes = {"piano": ["piano_volume"], "corp": ["corp_mac_volume"], "master": ["master_volume_speakers"]}
+    fb.muted = False
+    fb._reconfigure()
+    fb.outputs["ctl"] = FakePort()
+    return fb
+
+
+def drain(fb, *updates):
+    """Run update() for each params dict, let send_forever empty the queue, return what the port got."""
+    port = fb.outputs["ctl"]
+    port.sent.clear()
+
+    async def run():
+        sender = asyncio.create_task(fb.send_forever())
+        for params in updates:
+            fb.update(params, now=100.0)
+        while fb._queue:  # a group is sent in full as soon as it leaves the queue
+            await asyncio.sleep(0)
+        sender.cancel()
+
+    asyncio.run(run())
+    return port.sent
+
+
+def nrpn(param, raw):
+    return [(99, param >> 7), (98, param & 0x7F), (6, raw >> 7), (38, raw & 0x7F)]
+
+
+def test_nrpn_and_cc14_groups_are_sent_whole(feedback):
+    sent = drain(feedback, {"piano_volume": 5 / 16383, "corp_mac_volume": 5 / 16383,
+                            "master_volume_speakers": (10 << 7 | 3) / 16383})
+    # Same data bytes on both NRPN params: neither is mistaken for "already sent"
+    assert sent == nrpn(300, 5) + nrpn(301, 5) + [(20, 10), (52, 3)]
+
+
+def test_msb_only_change_resends_the_lsb(feedback):
+    drain(feedback, {"master_volume_speakers": (10 << 7 | 3) / 16383})
+    assert drain(feedback, {"master_volume_speakers": (11 << 7 | 3) / 16383}) == [(20, 11), (52, 3)]
+
+
+def test_unchanged_controls_are_skipped_and_queue_is_latest_wins(feedback):
+    drain(feedback, {"piano_volume": 0.5, "corp_mac_volume": 0.5})
+    sent = drain(feedback, {"piano_volume": 0.5, "corp_mac_volume": 0.1}, {"corp_mac_volume": 0.2})
+    assert sent == nrpn(301, round(0.2 * 16383))
+
+
+def test_touched_controls_are_left_alone(feedback):
+    feedback.touched = lambda control_id: 99.5 if control_id == "dial_1" else 0.0
+    assert drain(feedback, {"piano_volume": 0.5}) == []
@@ -0,0 +1,39 @@
+import pytest
+
+from khc.services.mac_mini.khc_mqtt_to_reaper import COALESCED, ParamCoalescer
+
+
+def test_quiet_address_goes_out_at_once():
+    coalescer = ParamCoalescer()
+    coalescer.put([("/track/1/volume", 0.5), ("/track/2/volume", 0.25)])
+    assert coalescer.wakeup.is_set()
+    due, wait = coalescer.take_due(10.0, 0.1)
+    assert due == [("/track/1/volume", 0.5), ("/track/2/volume", 0.25)]
+    assert wait is None and len(coalescer) == 0
+
+
+def test_latest_value_wins_while_queued():
+    coalescer = ParamCoalescer()
+    before = COALESCED.value
+    coalescer.put([("/a", 0.1)])
+    coalescer.put([("/a", 0.2), ("/a", 0.3)])
+    assert COALESCED.value == before + 2
+    assert coalescer.take_due(0.0, 0.1) == ([("/a", 0.3)], None)
+
+
+def test_min_gap_paces_each_address():
+    coalescer = ParamCoalescer()
+    coalescer.put([("/a", 0.1)])
+    coalescer.take_due(10.0, 0.1)
+    coalescer.put([("/a", 0.2), ("/b", 0.9)])
+    due, wait = coalescer.take_due(10.04, 0.1)
+    assert due == [("/b", 0.9)]
+    assert wait == pytest.approx(0.06)
+    assert coalescer.take_due(10.1, 0.1) == ([("/a", 0.2)], None)
+
+
+def test_discard_forgets_queued_values():
+    coalescer = ParamCoalescer()
+    coalescer.put([("/a", 0.1), ("/b", 0.2)])
+    coalescer.discard(["/a", "/not-queued"])
+    assert coalescer.take_due(0.0, 0.0) == ([("/b", 0.2)], None)
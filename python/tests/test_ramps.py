@@ -0,0 +1,85 @@
+import pytest
+
+from khc.services.mac_mini.ramps import TIMEOUT_RAMP, RampEngine, apply_command
+
+PIANO = "/track/2/volume"
+SPEAKERS = "/track/1/send/1/volume"
+
+
+@pytest.fixture
+def engine(config):
+    return RampEngine()
+
+
+def test_ramp_steps_to_target_and_finishes(engine):
+    engine.note([(PIANO, 1.0)])
+    assert apply_command(engine, {"params": {"piano_volume": 0.0}, "duration": 1.0}, now=0.0) == [PIANO]
+    assert engine.step(0.5) == [(PIANO, pytest.approx(0.5))]
+    assert engine.step(1.0) == [(PIANO, 0.0)]
+    assert engine.step(1.1) == []
+    assert engine.next_wakeup(1.1, 0.01) is None
+
+
+def test_curves(engine):
+    engine.note([(PIANO, 0.0)])
+    apply_command(engine, {"params": {"piano_volume": 1.0}, "duration": 1.0, "curve": "in"}, now=0.0)
+    assert engine.step(0.5) == [(PIANO, pytest.approx(0.25))]
+
+
+def test_unknown_start_jumps(engine):
+    apply_command(engine, {"params": {"piano_volume": 0.7}, "duration": 1.0}, now=0.0)
+    assert engine.step(0.1) == [(PIANO, pytest.approx(0.7))]
+
+
+def test_set_params_value_ends_ramp(engine):
+    engine.note([(PIANO, 1.0)])
+    apply_command(engine, {"params": {"piano_volume": 0.0}, "duration": 1.0}, now=0.0)
+    assert engine.absorb([(PIANO, 0.3)]) == [(PIANO, 0.3)]
+    assert engine.step(0.5) == []
+
+
+def test_hold_keeps_values_back_until_release(engine):
+    engine.note([(SPEAKERS, 0.8)])
+    apply_command(engine, {"params": {"master_volume_speakers": 0.0}, "hold": "mix", "timeout": 5}, now=0.0)
+    assert engine.step(0.0) == [(SPEAKERS, 0.0)]
+    assert engine.is_held(SPEAKERS)
+    assert engine.absorb([(SPEAKERS, 0.6), (PIANO, 0.5)]) == [(PIANO, 0.5)]
+    apply_command(engine, {"release": "mix", "delay": 1.0, "duration": 0.5}, now=0.2)
+    assert engine.next_wakeup(0.2, 0.01) == pytest.approx(1.0)
+    assert engine.step(1.0) == []
+    assert engine.step(1.2) == [(SPEAKERS, 0.0)]   # ramp starts at the release time
+    assert not engine.is_held(SPEAKERS)
+    assert engine.step(1.45) == [(SPEAKERS, pytest.approx(0.3))]
+    assert engine.step(1.7) == [(SPEAKERS, 0.6)]
+
+
+def test_hold_times_out_to_values_seen_meanwhile(engine):
+    engine.note([(SPEAKERS, 0.8)])
+    apply_command(engine, {"params": {"master_volume_speakers": 0.0}, "hold": "mix", "timeout": 2}, now=0.0)
+    engine.step(0.0)
+    engine.absorb([(SPEAKERS, 0.4)])
+    assert engine.step(2.0) == [(SPEAKERS, 0.0)]
+    assert engine.step(2.0 + TIMEOUT_RAMP) == [(SPEAKERS, 0.4)]
+    assert not engine.holds
+
+
+def test_release_of_unknown_hold_just_ramps(engine):
+    apply_command(engine, {"release": "gone", "params": {"piano_volume": 0.5}}, now=0.0)
+    assert engine.step(0.0) == [(PIANO, 0.5)]
+
+
+def test_unmapped_params_are_ignored(engine):
+    assert apply_command(engine, {"params": {"no_such_param": 0.5}}, now=0.0) == []
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"params": []},
+    {"params": {"piano_volume": "loud"}},
+    {"params": {"piano_volume": True}},
+    {"params": {}, "duration": -1},
+    {"params": {}, "curve": "wobbly"},
+])
+def test_malformed_commands_raise(engine, data):
+    with pytest.raises(ValueError):
+        apply_command(engine, data, now=0.0)
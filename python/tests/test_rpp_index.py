@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from khc.services.common.config import ReaperConfig
+from khc.services.mac_mini.rpp_index import load_index, parse_rpp
+
+SESSION = Path(__file__).resolve().parents[2] / "devices" / "mac_mini" / "reaper_session.RPP"
+
+PROJECT = """\
+<REAPER_PROJECT 0.1 "7.0"
+  <TRACK {A}
+    NAME bus
+    HWOUT 2 0 1 0 0 0 0 -1:U -1
+    HWOUT 1030 0 1 0 0 0 0 -1:U -1
+    <FXCHAIN
+      NAME ignored
+      HWOUT 99 0 1 0 0 0 0 -1:U -1
+    >
+  >
+  <TRACK {B}
+    NAME "two words"
+    AUXRECV 0 0 1 0 0 0 0 0 0 -1:U 0 -1 ''
+  >
+  <TRACK {C}
+    NAME 'dup'
+  >
+  <TRACK {D}
+    NAME `dup`
+  >
+>
+"""
+
+
+@pytest.fixture
+def index():
+    return parse_rpp(PROJECT.splitlines())
+
+
+def test_tracks_are_numbered_in_order(index):
+    assert [(t.number, t.name) for t in index.tracks] == [(1, "bus"), (2, "two words"), (3, "dup"), (4, "dup")]
+    assert index.track("bus").hw_outputs == [3, 7]  # flags above the channel mask are dropped
+    assert index.track("bus").track_sends == 1
+
+
+def test_hw_sends_follow_track_sends(index):
+    assert index.resolve("/track/{bus}/send/{hw:3}/volume") == "/track/1/send/2/volume"
+    assert index.resolve("/track/{bus}/send/{hw:7}/volume") == "/track/1/send/3/volume"
+    assert index.resolve("/track/{two words}/volume") == "/track/2/volume"
+
+
+@pytest.mark.parametrize("template, message", [
+    ("/track/{nope}/volume", "no track named"),
+    ("/track/{dup}/volume", "more than one track named"),
+    ("/track/1/send/{hw:1}/volume", "must follow a {track name}"),
+    ("/track/{bus}/send/{hw:5}/volume", "has no hardware output 5"),
+    ("/track/{bus}/send/{hw:x}/volume", "has no hardware output x"),
+])
+def test_unresolvable_templates_raise(index, template, message):
+    with pytest.raises(ValueError, match=message):
+        index.resolve(template)
+
+
+def test_session_matches_default_addresses():
+    index = load_index(str(SESSION))
+    names = {
+        "piano_volume": "/track/{piano}/volume",
+        "personal_windows_volume": "/track/{personal win}/volume",
+        "corp_mac_volume": "/track/{corp mac}/volume",
+        "corp_windows_volume": "/track/{corp win}/volume",
+        "personal_mac_volume": "/track/{mac mini}/volume",
+        "master_volume_speakers": "/track/{submix}/send/{hw:1}/volume",
+        "master_volume_regular_headphones": "/track/{submix}/send/{hw:7}/volume",
+    }
+    assert {param: index.resolve(t) for param, t in names.items()} == ReaperConfig().param_to_osc
@@ -0,0 +1,38 @@
+from khc.services.common.tracing import MAX_HOPS, MAX_PATHS, TRACES_DROPPED, TraceRecorder
+
+
+def trace(*names):
+    return {"id": "x", "hops": [[name, 1000.0 + 2.0 * i] for i, name in enumerate(names)]}
+
+
+def test_hops_and_total_are_recorded():
+    recorder = TraceRecorder("test")
+    recorder.record(trace("numpad", "ha", "hid"))
+    hists = recorder.paths["numpad>ha>hid"]
+    assert {hop: h.total for hop, h in hists.items()} == {"numpad>ha": 1, "ha>hid": 1, "total": 1}
+    assert hists["total"].sum_ms == 4.0
+
+
+def test_garbled_traces_are_ignored():
+    recorder = TraceRecorder("test")
+    for bad in (None, "x", {"hops": [["a", "soon"], ["b", 1]]}, {"hops": [["a", 1.0]]}, {"hops": 5}):
+        recorder.record(bad)
+    assert recorder.paths == {} and recorder.dropped == 0
+
+
+def test_distinct_paths_are_capped():
+    recorder = TraceRecorder("test")
+    before = TRACES_DROPPED.value
+    for i in range(MAX_PATHS + 5):
+        recorder.record(trace(f"src{i}", "ha"))
+    recorder.record(trace("src0", "ha"))  # known paths keep recording
+    assert len(recorder.paths) == MAX_PATHS
+    assert recorder.paths["src0>ha"]["total"].total == 2
+    assert recorder.dropped == 5 and TRACES_DROPPED.value == before + 5
+    assert recorder.snapshot()["dropped"] == 5
+
+
+def test_long_traces_are_dropped():
+    recorder = TraceRecorder("test")
+    recorder.record(trace(*(f"hop{i}" for i in range(MAX_HOPS + 1))))
+    assert recorder.paths == {} and recorder.dropped == 1